@@ -9,18 +9,211 @@ It uses meaningful variable names, instead of list indices
 
 The class reading the queue implements the handler
 The class writing to the queue writes the proper message type
+
+Messages use __slots__ and cross a multiprocessing.Queue in a compact
+binary form instead of a pickled __dict__:
+    version (1 byte), type code (1 byte), then each slot as a value
+Values are a subset of msgpack: None, bool, int (64 bit), float, str, bytes,
+list/tuple, dict and nested messages.  decode() looks the type code up in MESSAGE_TYPES.
+send() puts the encoded bytes, which the queue pickles at C speed, and
+receive() turns what get() returns back into a message.  A message put
+as is still travels encoded, at the cost of a pickle __reduce__ call.
+
+BatchSender buffers messages and sends them as one BatchMessage, whose
+handle() dispatches every message in it, so a receiver loop needs no change.
+
+>>> data = LogMessage(3, 'INFO', 'off').encode()
+>>> decode(data).msg
+'off'
 """
 
+import struct
+import threading
+import time
+
+WIRE_VERSION = 1
+
+# type code -> message class, filled by register()
+MESSAGE_TYPES = {}
+
+_HEADER = struct.Struct('>BB')
+
+
+def register(code):
+    """Class decorator giving a message class its wire type code"""
+    def decorate(cls):
+        if code in MESSAGE_TYPES:
+            raise ValueError("Type code {} already used by {}".format(code, MESSAGE_TYPES[code].__name__))
+        cls.type_code = code
+        MESSAGE_TYPES[code] = cls
+        return cls
+    return decorate
+
+
+def _pack(value, out):
+    """Append the encoding of value to bytearray out"""
+    if value is None:
+        out.append(0xc0)
+    elif value is True:
+        out.append(0xc3)
+    elif value is False:
+        out.append(0xc2)
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            out.append(value)
+        elif -0x8000000000000000 <= value < 0x8000000000000000:
+            out += b'\xd3' + struct.pack('>q', value)
+        elif 0 <= value < 0x10000000000000000:
+            out += b'\xcf' + struct.pack('>Q', value)
+        else:
+            raise TypeError("Cannot encode {!r}, out of 64 bit range".format(value))
+    elif isinstance(value, float):
+        out += b'\xcb' + struct.pack('>d', value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        if len(data) < 0x20:
+            out.append(0xa0 | len(data))
+        else:
+            out += b'\xdb' + struct.pack('>I', len(data))
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        out += b'\xc6' + struct.pack('>I', len(value)) + value
+    elif isinstance(value, (list, tuple)):
+        out += b'\xdd' + struct.pack('>I', len(value))
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        out += b'\xdf' + struct.pack('>I', len(value))
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    elif isinstance(value, QueueMessage):
+        data = value.encode()
+        out += b'\xc9' + struct.pack('>I', len(data)) + data
+    else:
+        raise TypeError("Cannot encode {!r}".format(value))
+
+
+def _unpack(data, offset):
+    """Return (value, offset after it) decoded from data at offset"""
+    tag = data[offset]
+    offset += 1
+    if tag < 0x80:
+        return tag, offset
+    if 0xa0 <= tag < 0xc0:
+        end = offset + (tag & 0x1f)
+        return data[offset:end].decode('utf-8'), end
+    if tag == 0xc0:
+        return None, offset
+    if tag == 0xc2:
+        return False, offset
+    if tag == 0xc3:
+        return True, offset
+    if tag == 0xd3:
+        return struct.unpack_from('>q', data, offset)[0], offset + 8
+    if tag == 0xcf:
+        return struct.unpack_from('>Q', data, offset)[0], offset + 8
+    if tag == 0xcb:
+        return struct.unpack_from('>d', data, offset)[0], offset + 8
+    size = struct.unpack_from('>I', data, offset)[0]
+    offset += 4
+    if tag == 0xdb:
+        return data[offset:offset + size].decode('utf-8'), offset + size
+    if tag == 0xc6:
+        return bytes(data[offset:offset + size]), offset + size
+    if tag == 0xc9:
+        return decode(data[offset:offset + size]), offset + size
+    if tag == 0xdd:
+        items = []
+        for _ in range(size):
+            item, offset = _unpack(data, offset)
+            items.append(item)
+        return items, offset
+    if tag == 0xdf:
+        items = {}
+        for _ in range(size):
+            key, offset = _unpack(data, offset)
+            items[key], offset = _unpack(data, offset)
+        return items, offset
+    raise ValueError("Unknown value tag 0x{:02x}".format(tag))
+
+
+def _hashable(value):
+    """Return value with lists as tuples and dicts as frozensets, for __hash__"""
+    if isinstance(value, list):
+        return tuple(_hashable(item) for item in value)
+    if isinstance(value, dict):
+        return frozenset((key, _hashable(item)) for key, item in value.items())
+    return value
+
+
+def decode(data):
+    """Return the message encoded in data by QueueMessage.encode()"""
+    version, code = _HEADER.unpack_from(data)
+    if version != WIRE_VERSION:
+        raise ValueError("Unsupported message version {}".format(version))
+    cls = MESSAGE_TYPES.get(code)
+    if cls is None:
+        raise ValueError("Unknown message type {}".format(code))
+    msg = cls.__new__(cls)
+    offset = _HEADER.size
+    for name in cls.__slots__:
+        value, offset = _unpack(data, offset)
+        setattr(msg, name, value)
+    return msg
+
+
+def send(queue, msg):
+    """Put msg on queue in its compact form"""
+    queue.put(msg.encode())
+
+
+def receive(item):
+    """Return the message for an item read from a queue, encoded or not"""
+    if isinstance(item, bytes):
+        return decode(item)
+    return item
+
 
 class QueueMessage(object):
-    """Base class"""
+    """Base class
+    Subclasses list their fields in __slots__, which is also the wire order.
+    """
+    __slots__ = ()
+    type_code = None
 
     def handle(self, receiver):
         raise NotImplementedError
 
+    def encode(self):
+        """Return the compact wire form, see decode()"""
+        out = bytearray(_HEADER.pack(WIRE_VERSION, self.type_code))
+        for name in self.__slots__:
+            _pack(getattr(self, name), out)
+        return bytes(out)
+
+    def __reduce__(self):
+        # multiprocessing.Queue pickles what is put, send the compact form
+        return decode, (self.encode(),)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __hash__(self):
+        # Consistent with __eq__, so equal messages are one set member or dict key
+        return hash((type(self),) + tuple(_hashable(getattr(self, name)) for name in self.__slots__))
 
+    def __repr__(self):
+        return "{}({})".format(
+            type(self).__name__, ", ".join(repr(getattr(self, name)) for name in self.__slots__))
+
+
+@register(1)
 class QuitMessage(QueueMessage):
     """Worker tells Boss it is ending"""
+    __slots__ = ('id', 'this_exit_code')
+
     def __init__(self, id, this_exit_code):
         self.id = id
         self.this_exit_code = this_exit_code
@@ -29,8 +222,11 @@ class QuitMessage(QueueMessage):
         receiver.on_quit(self.id, self.this_exit_code)
 
 
+@register(2)
 class LogMessage(QueueMessage):
     """Worker tells Boss to write to it's log"""
+    __slots__ = ('id', 'log_level', 'msg')
+
     def __init__(self, id, log_level, msg):
         self.id = id
         self.log_level = log_level
@@ -40,8 +236,11 @@ class LogMessage(QueueMessage):
         receiver.on_log(self.id, self.log_level, self.msg)
 
 
+@register(3)
 class StatusMessage(QueueMessage):
     """Worker tells Boss to update status.json"""
+    __slots__ = ('id', 'data')
+
     def __init__(self, id, data):
         self.id = id
         self.data = data
@@ -49,22 +248,125 @@ class StatusMessage(QueueMessage):
     def handle(self, receiver):
         receiver.on_status(self.id, self.data)
 
+
+@register(4)
 class RebootMessage(QueueMessage):
     """Boss Tell Worker pause for reboot
     state  "down" or "up"
     """
+    __slots__ = ('state',)
+
     def __init__(self, state):
         self.state = state
-    
+
     def handle(self, receiver):
         receiver.on_galaxy_reboot(self.state)
 
 
+@register(5)
 class FinishedMessage(QueueMessage):
     """Tell Boss that the test is over"""
+    __slots__ = ('ipv6',)
 
     def __init__(self, ipv6):
         self.ipv6 = ipv6
 
     def handle(self, receiver):
         receiver.on_finished(self.ipv6)
+
+
+@register(6)
+class BatchMessage(QueueMessage):
+    """Messages sent together by a BatchSender"""
+    __slots__ = ('messages',)
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def handle(self, receiver):
+        for msg in self.messages:
+            msg.handle(receiver)
+
+
+class BatchSender(object):
+    """Buffer messages for one queue and send them as one BatchMessage
+
+    Buffered messages go out when max_messages are waiting, max_delay
+    seconds after the first of them was buffered, right after a message
+    of a flush_on type, and on flush() or close().
+    A StatusMessage replaces a buffered StatusMessage with the same id.
+    Safe to share between threads, a flusher thread sends late batches.
+    """
+
+    def __init__(self, queue, max_messages=64, max_delay=0.05, flush_on=(QuitMessage,)):
+        self.queue = queue
+        self.max_messages = max_messages
+        self.max_delay = max_delay
+        self.flush_on = flush_on
+        self.batches = 0  # puts on the queue
+        self._buffer = []
+        self._first = None  # time.monotonic() of the oldest buffered message
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def put(self, msg):
+        """Buffer msg, sending the buffer if it is full or msg is urgent"""
+        with self._cond:
+            if isinstance(msg, StatusMessage):
+                self._buffer = [
+                    m for m in self._buffer if not (isinstance(m, StatusMessage) and m.id == msg.id)
+                ]
+            self._buffer.append(msg)
+            if len(self._buffer) >= self.max_messages or isinstance(msg, self.flush_on):
+                self._flush()
+                return
+            if self._first is None:
+                self._first = time.monotonic()
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._flusher, name="BatchSender", daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+
+    def flush(self):
+        """Send what is buffered now"""
+        with self._cond:
+            self._flush()
+
+    def close(self):
+        """Send what is buffered and stop the flusher thread"""
+        with self._cond:
+            self._flush()
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+            self._thread = None
+
+    def _flush(self):
+        """Send the buffer, called holding self._cond"""
+        self._first = None
+        if not self._buffer:
+            return
+        messages, self._buffer = self._buffer, []
+        send(self.queue, messages[0] if len(messages) == 1 else BatchMessage(messages))
+        self.batches += 1
+
+    def _flusher(self):
+        """Send the buffer max_delay seconds after its first message"""
+        with self._cond:
+            while not self._closed:
+                if self._first is None:
+                    self._cond.wait()
+                    continue
+                remaining = self._first + self.max_delay - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                else:
+                    self._flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark message_queue wire encodings
+Compares the pickled __dict__ messages message_queue used to send with
+the compact encoding, in bytes per message and microseconds to encode
+and decode.  No multiprocessing is involved, only the serialization a
+multiprocessing.Queue pays on put() and get().
+
+The batching benchmark sends log messages through a real
+multiprocessing.Queue, one put per message and with a BatchSender.
+
+Run:  python message_queue_bench.py -n 100000
+"""
+
+import argparse
+import multiprocessing
+import pickle
+import time
+
+import message_queue
+
+__author__ = 'John Stile'
+
+
+class LegacyLogMessage(object):
+    """LogMessage as it was before __slots__, pickled with its __dict__"""
+    def __init__(self, id, log_level, msg):
+        self.id = id
+        self.log_level = log_level
+        self.msg = msg
+
+
+class LegacyStatusMessage(object):
+    """StatusMessage as it was before __slots__"""
+    def __init__(self, id, data):
+        self.id = id
+        self.data = data
+
+
+# name -> (legacy message, current message), typical Boss/Worker traffic
+MESSAGES = {
+    'log': (LegacyLogMessage(12, 'INFO', 'off'), message_queue.LogMessage(12, 'INFO', 'off')),
+    'status': (
+        LegacyStatusMessage(12, {'ready': True}),
+        message_queue.StatusMessage(12, {'ready': True})
+    ),
+}
+
+
+def _time(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def bench_encoding(iterations):
+    """Time a pickle round trip of each message, as multiprocessing.Queue does
+
+    before: pickled __dict__ objects
+    after:  message_queue.send() and receive(), pickling the encoded bytes
+    reduce: a __slots__ message put as is, pickled through __reduce__
+    :return list: dict of message, case, bytes and seconds per round trip
+    """
+    protocol = pickle.HIGHEST_PROTOCOL
+    results = []
+    for name, (legacy, current) in sorted(MESSAGES.items()):
+        cases = (
+            ('before', legacy, lambda msg: pickle.loads(pickle.dumps(msg, protocol))),
+            ('after', current.encode(), lambda msg: message_queue.receive(
+                pickle.loads(pickle.dumps(msg.encode(), protocol)))),
+            ('reduce', current, lambda msg: pickle.loads(pickle.dumps(msg, protocol))),
+        )
+        for case, wire, round_trip in cases:
+            msg = legacy if case == 'before' else current
+            seconds = _time(lambda: round_trip(msg), iterations)
+            results.append({
+                'message': name,
+                'case': case,
+                'bytes': len(pickle.dumps(wire, protocol)),
+                'seconds': seconds
+            })
+    return results
+
+
+class _Counter(object):
+    """Receiver counting on_log calls"""
+    def __init__(self):
+        self.count = 0
+
+    def on_log(self, id, log_level, msg):
+        self.count += 1
+
+
+def bench_batching(iterations):
+    """Time log messages through a multiprocessing.Queue and back
+
+    before: message_queue.send(), one put per message
+    after:  message_queue.BatchSender with its defaults
+    :return list: dict of case, puts and seconds per message
+    """
+    results = []
+    for case in ('before', 'after'):
+        queue = multiprocessing.Queue()
+        receiver = _Counter()
+        sender = message_queue.BatchSender(queue)
+        start = time.perf_counter()
+        for n in range(iterations):
+            msg = message_queue.LogMessage(n % 16, 'INFO', 'off')
+            if case == 'before':
+                message_queue.send(queue, msg)
+            else:
+                sender.put(msg)
+        sender.close()
+        puts = 0
+        while receiver.count < iterations:
+            message_queue.receive(queue.get()).handle(receiver)
+            puts += 1
+        seconds = (time.perf_counter() - start) / iterations
+        queue.close()
+        results.append({'message': 'batch', 'case': case, 'puts': puts, 'seconds': seconds})
+    return results
+
+
+def main():
+    """Print bytes and round trip time per message for each encoding"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--iterations', '-n',
+        type=int,
+        default=100000,
+        help='Round trips per message and encoding.'
+    )
+    args = parser.parse_args()
+    for result in bench_encoding(args.iterations):
+        print("{message:<8} {case:<8} {bytes:>5} bytes {us:>8.2f} us/message".format(
+            us=result['seconds'] * 1e6, **result))
+    for result in bench_batching(args.iterations):
+        print("{message:<8} {case:<8} {puts:>5} puts  {us:>8.2f} us/message".format(
+            us=result['seconds'] * 1e6, **result))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,16 +7,58 @@ Switches plug state, read current state
 """
 
 import argparse
+import collections
+import contextlib
+import functools
+import importlib
+import json
+import os
+import tempfile
 import time
 import sys
 import logging
+import random
 import socket
-import retrying
-from pysnmp.entity.rfc3413.oneliner import cmdgen
-from pysnmp.proto import rfc1902
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No flock (Windows): DeviceLock serializes threads only
+    fcntl = None
 
 __author__ = 'John Stile'
 
+# Modules imported on first use, loading pysnmp (and asyncio, for
+# AsyncNetBooter only) takes most of the startup time of the command line
+_LAZY_MODULES = {
+    'asyncio': 'asyncio',
+    'ber_decoder': 'pyasn1.codec.ber.decoder',
+    'ber_encoder': 'pyasn1.codec.ber.encoder',
+    'cmdgen': 'pysnmp.entity.rfc3413.oneliner.cmdgen',
+    'rfc1902': 'pysnmp.proto.rfc1902',
+    'rfc1905': 'pysnmp.proto.rfc1905',
+    'snmp_api': 'pysnmp.proto.api',
+}
+
+
+def __getattr__(name):
+    """Import a module of _LAZY_MODULES when netbooter.<name> is first read"""
+    if name in _LAZY_MODULES:
+        module = importlib.import_module(_LAZY_MODULES[name])
+        globals()[name] = module
+        return module
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def _lazy(name):
+    """Return module name of _LAZY_MODULES, importing it on first use
+
+    Looked up on this module, so a patched netbooter.cmdgen is honoured.
+    """
+    return getattr(sys.modules[__name__], name)
+
+
 class Error(Exception):
     """Generic Error Exception"""
     pass
@@ -37,18 +79,23 @@ class SnmpPduError(Error):
     pass
 
 
-def retry_if_timeout_error(exception):
-    """Return True if we should retry (in this case when it's an socket.timeout), False otherwise"""
-    return isinstance(
-        exception, 
-        (
-            socket.timeout, 
-            RequestTimedOutError, 
-            SnmpEngineError, 
-            SnmpPduError, 
-            error.CarrierError
-        )
-    )
+class RetryExhaustedError(Error):
+    """Request still failing after the attempts or deadline of its RetryPolicy"""
+    pass
+
+
+class CircuitOpenError(Error):
+    """Request refused without sending, the netbooter stopped answering"""
+    pass
+
+
+# Exceptions after which a request is worth sending again
+RETRYABLE_ERRORS = (
+    OSError,
+    RequestTimedOutError,
+    SnmpEngineError,
+    SnmpPduError
+)
 
 
 def retry_if_result_none(result):
@@ -57,12 +104,972 @@ def retry_if_result_none(result):
     return result is None or result is ''
 
 
+def retry_if_result_incomplete(result):
+    """Use the result of a bulk get to alter the behavior of retrying.
+    Return True if any value in the result list is missing"""
+    return any(retry_if_result_none(value) for value in result)
+
+
 def retry_if_result_false(result):
     """Use the result of the mfunction to alter behavior of retrying
     Return True if the result is False"""
     return not result
 
 
+# -----------------------------------------------------------------------
+# Netbooter 16s MIB
+# -----------------------------------------------------------------------
+#
+# For testing with net-snmp, this should turn off plug 1
+# snmpset -c public -v1 192.168.1.100 .1.3.6.1.4.1.21728.3.2.1.1.4.0 i 2
+# snmpget -c public -v1 192.168.1.100 .1.3.6.1.4.1.21728.3.2.1.1.3.0
+#
+STATUS_16S = {
+    "systemModel":                "1.3.6.1.4.1.21728.3.1.1.0",
+    "systemName":                 "1.3.6.1.4.1.21728.3.1.2.0",
+    "powerOutletNum":             "1.3.6.1.4.1.21728.3.1.3.0",
+    "systemUpTime":               "1.3.6.1.4.1.21728.3.1.5.0",
+    "swVersion":                  "1.3.6.1.4.1.21728.3.1.6.0",
+    "ifPhysAddress":              "1.3.6.1.2.1.2.2.1.6.0",
+    "ipAdEntIfIndex":             "1.3.6.1.2.1.4.20.1.2.0",
+    "ipAdEntNetMask":             "1.3.6.1.2.1.4.20.1.3.0",
+    "ipAddress":                  "1.3.6.1.4.1.21728.3.4.2.0",
+    "acCurrentSensorNumber":      "1.3.6.1.4.1.21728.3.1.7.0",
+    "currentAlarmThreshold":      "1.3.6.1.4.1.21728.3.3.1.0",
+    "currentDrawStatus1":         "1.3.6.1.4.1.21728.3.3.2.0",
+    "currentDrawStatus2":         "1.3.6.1.4.1.21728.3.3.3.0",
+    "currentDrawMax1":            "1.3.6.1.4.1.21728.3.3.4.0",
+    "currentDrawMax2":            "1.3.6.1.4.1.21728.3.3.5.0",
+    "temperatureUpThreshold":     "1.3.6.1.4.1.21728.3.3.6.0",
+    "temperatureLowThreshold":    "1.3.6.1.4.1.21728.3.3.7.0",
+    "temperatureReading":         "1.3.6.1.4.1.21728.3.3.8.0"
+}
+# 1=on, 2=off
+OUTLET_STATUS_16S = "1.3.6.1.4.1.21728.3.2.1.1.3"
+# 0=none,1=on,2=off,3=reboot
+OUTLET_ACTION_16S = "1.3.6.1.4.1.21728.3.2.1.1.4"
+# outlet numbering
+STARTING_PLUG_16S = 0
+# subtree holding current and temperature readings
+SENSOR_TABLE_16S = "1.3.6.1.4.1.21728.3.3"
+
+# -----------------------------------------------------------------------
+# Netbooter 16 or 8 MIB
+# -----------------------------------------------------------------------
+#
+# For testing with net-snmp, this should turn off plug 1
+# snmpset -c public -v1 <IP> .1.3.6.1.4.1.21728.2.4.1.2.1.1.4.1 i 2
+# snmpget -c public -v1 <IP> .1.3.6.1.4.1.21728.2.4.1.2.1.1.3.1
+#
+STATUS_16 = {
+    "systemModel":                "1.3.6.1.4.1.21728.2.4.1.1.1.0",
+    "systemName":                 "1.3.6.1.4.1.21728.2.4.1.1.2.0",
+    "powerOutletNum":             "1.3.6.1.4.1.21728.2.4.1.1.3.0",
+    "systemUpTime":               "1.3.6.1.4.1.21728.2.4.1.1.5.0",
+    "swVersion":                  "1.3.6.1.4.1.21728.2.4.1.1.6.0",
+    "currentAlarmThreshold":      "1.3.6.1.4.1.21728.2.4.1.3.1.1.2",
+    "currentDrawStatus1":         "1.3.6.1.4.1.21728.2.4.1.3.1.1.3",
+    "currentDrawStatus2":         "1.3.6.1.4.1.21728.2.4.1.3.1.1.4",
+    "currentDrawMax1":            "1.3.6.1.4.1.21728.2.4.1.3.1.1.5",
+    "currentDrawMax2":            "1.3.6.1.4.1.21728.2.4.1.3.1.1.6",
+    "temperatureThreshold":       "1.3.6.1.4.1.21728.2.4.1.3.1.1.7",
+    "temperatureReading":         "1.3.6.1.4.1.21728.2.4.1.3.1.1.8"
+}
+# 0 OR 2 OR 256=off, 1 OR 257=on
+OUTLET_STATUS_16 = "1.3.6.1.4.1.21728.2.4.1.2.1.1.3"
+# 0=none,1=on,2=off,3=reboot
+OUTLET_ACTION_16 = "1.3.6.1.4.1.21728.2.4.1.2.1.1.4"
+# outlet numbering
+STARTING_PLUG_16 = 1
+# subtree holding current and temperature readings
+SENSOR_TABLE_16 = "1.3.6.1.4.1.21728.2.4.1.3"
+
+# -----------------------------------------------------------------------
+# Tunables for confirming an outlet state after a set
+# -----------------------------------------------------------------------
+# The netbooter tries the set, and during that time reports the values to be set.
+# If the plug is not powered, port returns to previous state, and then netbooter
+#   reports the original state.
+# Reads during that window can not be trusted, so no state is accepted before min_settle.
+# Polling starts stable_reads reads max_delay apart before min_settle, the last
+#   read landing right at it, and the state is accepted once it reads the same for
+#   stable_reads reads in a row.  Past min_settle reads back off exponentially.
+#   min_settle    - seconds the netbooter may misreport after a set
+#   initial_delay - seconds between the first reads past min_settle
+#   max_delay     - cap on seconds between reads, delay doubles after each read
+#   stable_reads  - consecutive good reads needed to accept the state
+#   deadline      - seconds after the set to give up
+# A plug that switches costs the old sleep(2) and stable_reads reads, 2 GETs.
+# Waiting 2 seconds is not long enough 1/50 tries, a port falling back just
+#   before min_settle breaks the run of stable reads, and polling goes on.
+# Both models use these values: none has been measured per model, a MIBS entry
+#   may add its own 'verify' once one is.
+VERIFY_DEFAULT = {
+    'min_settle': 2.0,
+    'initial_delay': 0.1,
+    'max_delay': 1.0,
+    'stable_reads': 2,
+    'deadline': 8.0,
+}
+
+# -----------------------------------------------------------------------
+# MIB for each model, keyed by the sysDescr reported by the netbooter
+# -----------------------------------------------------------------------
+MIBS = {
+    'Power Distribution System': {
+        'status': STATUS_16,
+        'outlet_action': OUTLET_ACTION_16,
+        'outlet_status': OUTLET_STATUS_16,
+        'starting_plug': STARTING_PLUG_16,
+        'sensor_table': SENSOR_TABLE_16,
+        'verify': VERIFY_DEFAULT,
+    },
+    'Synaccess Remote PDU': {
+        'status': STATUS_16S,
+        'outlet_action': OUTLET_ACTION_16S,
+        'outlet_status': OUTLET_STATUS_16S,
+        'starting_plug': STARTING_PLUG_16S,
+        'sensor_table': SENSOR_TABLE_16S,
+        'verify': VERIFY_DEFAULT,
+    },
+}
+
+@functools.lru_cache(maxsize=4096)
+def _compile_dotted(oid):
+    """Split a dot separated OID string into a tuple of ints"""
+    return tuple([int(x) for x in oid.split('.')])
+
+
+def compile_oid(oid):
+    """Return oid in the tuple of ints form pysnmp expects
+
+    Tuples pass through untouched. Strings are parsed once and cached,
+    so repeated requests for the same OID do not parse it again.
+    """
+    if isinstance(oid, tuple):
+        return oid
+    return _compile_dotted(str(oid))
+
+
+class MibProfile(object):
+    """MIB of one netbooter model, with every OID compiled to pysnmp form
+
+    Built from a MIBS style entry.  Outlet OIDs are compiled on first use
+    and cached per outlet, so switching and status requests never parse
+    an OID string.
+    """
+
+    def __init__(self, identity, status, outlet_action, outlet_status, starting_plug, verify,
+                 sensor_table=None):
+        self.identity = identity
+        self.status = dict(status)
+        self.status_oids = dict((name, compile_oid(oid)) for name, oid in status.items())
+        self.outlet_action = outlet_action
+        self.outlet_status = outlet_status
+        self.outlet_action_oid = compile_oid(outlet_action)
+        self.outlet_status_oid = compile_oid(outlet_status)
+        self.starting_plug = starting_plug
+        self.sensor_table_oid = compile_oid(sensor_table) if sensor_table else None
+        self.verify = dict(verify)
+        self._outlet_oids = {}
+
+    def outlet_oids(self, outlet):
+        """Return compiled (set_oid, get_oid) for an outlet index of this model"""
+        oids = self._outlet_oids.get(outlet)
+        if oids is None:
+            oids = self._outlet_oids[outlet] = (
+                self.outlet_action_oid + (outlet,),
+                self.outlet_status_oid + (outlet,)
+            )
+        return oids
+
+
+# Compiled profile for each model, keyed by sysDescr
+PROFILES = {}
+
+
+def register_profile(identity, mib):
+    """Compile a MIBS style entry and register it for identity
+    New Synaccess models can be added this way, as data.
+    :return MibProfile:
+    """
+    PROFILES[identity] = MibProfile(identity, **mib)
+    return PROFILES[identity]
+
+
+def load_profiles(path):
+    """Register every model in a JSON file of {identity: MIBS style entry}
+    Entries without 'verify' use VERIFY_DEFAULT.
+    """
+    with open(path) as fh:
+        for identity, mib in json.load(fh).items():
+            register_profile(identity, dict({'verify': VERIFY_DEFAULT}, **mib))
+
+
+for _identity, _mib in MIBS.items():
+    register_profile(_identity, _mib)
+
+# Current information read by NetBooter.current_draw(), keys in the status dictionary
+CURRENT_KEYS = (
+    # "acCurrentSensorNumber" ,
+    "currentAlarmThreshold",
+    "currentDrawStatus1",
+    "currentDrawStatus2",
+    "currentDrawMax1",
+    "currentDrawMax2"
+)
+
+def walk_end_values():
+    """Return the value types marking the end of a column in a walk"""
+    rfc1905 = _lazy('rfc1905')
+    return rfc1905.EndOfMibView, rfc1905.NoSuchObject, rfc1905.NoSuchInstance
+
+# Result of NetBooter.snapshot()
+#   host    - netbooter address
+#   model   - sysDescr of the netbooter
+#   time    - time.time() when the walk finished
+#   outlets - dict of plug -> 1=on, 0=off, None=Unknown
+#   sensors - dict of status name -> value, for current and temperature
+Snapshot = collections.namedtuple('Snapshot', 'host model time outlets sensors')
+
+# For these set states, list of acceptable current_state
+STATE_MAP = {
+    1: [1, 257],    # Good ON values
+    2: [0, 2, 256]  # Good OFF values
+}
+
+
+def verify_delays(verify):
+    """Yield the delay before each confirmation read, backing off exponentially"""
+    delay = verify['initial_delay']
+    while True:
+        yield delay
+        delay = min(delay * 2, verify['max_delay'])
+
+
+def poll_start(verify):
+    """Return seconds from the set to the first read
+
+    stable_reads reads max_delay apart then end right at min_settle.
+    """
+    return max(verify.get('min_settle', 0) - (verify['stable_reads'] - 1) * verify['max_delay'], 0)
+
+
+def settle_delay(delay, elapsed, verify):
+    """Return the delay before the next read, and none past the deadline
+
+    Before min_settle reads are max_delay apart from poll_start(), the last
+    one landing right at min_settle; past it the backoff delay is used.
+    :param float elapsed: seconds since the set
+    """
+    settle = verify.get('min_settle', 0)
+    start = poll_start(verify)
+    if elapsed < start:
+        delay = start - elapsed
+    elif elapsed < settle:
+        delay = min(verify['max_delay'], settle - elapsed)
+    return min(delay, max(verify['deadline'] - elapsed, 0))
+
+
+def verify_done(same_reads, elapsed, verify):
+    """True once the state was stable past min_settle, or the deadline passed
+    :param float elapsed: seconds from the set to the last read
+    """
+    if elapsed >= verify['deadline']:
+        return True
+    return same_reads >= verify['stable_reads'] and elapsed >= verify.get('min_settle', 0)
+
+
+def stable_count(same_reads, previous_state, current_state):
+    """Return how many reads in a row, including current_state, show the same outlet state"""
+    if same_reads and plug_state(previous_state) == plug_state(current_state):
+        return same_reads + 1
+    return 1
+
+
+def plug_state(response):
+    """Translate an outlet status value into 1=on, 0=off, None=Unknown"""
+    if response in STATE_MAP[1]:
+        return 1
+    elif response in STATE_MAP[2]:
+        return 0
+    return None
+
+
+def atomic_write(path, text, prefix='.tmp'):
+    """Replace the file at path with text, so readers never see a partial file"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix)
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(text)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+# Default on-disk location of the identity cache used by the command line
+DEFAULT_IDENTITY_CACHE = os.path.join(
+    os.path.expanduser('~'), '.cache', 'netbooter', 'identity.json')
+
+
+class IdentityCache(object):
+    """On-disk cache of netbooter identity, so NetBooter can skip identify_netbooter()
+
+    Entries are keyed by host:port and hold the model, outlet count,
+    outlet_range and OID map.  An entry older than ttl seconds is ignored.
+    The file is JSON and rewritten atomically, so concurrent command line
+    runs never read a partial file.
+    """
+
+    def __init__(self, path=DEFAULT_IDENTITY_CACHE, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+
+    def _read(self):
+        """Return all entries, or an empty dict if the file is missing or corrupt"""
+        try:
+            with open(self.path) as fh:
+                return json.load(fh)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write(self, entries):
+        """Replace the cache file with entries"""
+        atomic_write(self.path, json.dumps(entries, indent=1, sort_keys=True), prefix='.identity')
+
+    def get(self, key):
+        """Return the entry for key, or None if missing or expired"""
+        entry = self._read().get(key)
+        if entry is None or time.time() - entry.get('time', 0) > self.ttl:
+            return None
+        return entry
+
+    def put(self, key, entry):
+        """Store entry for key, stamped with the current time"""
+        entries = self._read()
+        entries[key] = dict(entry, time=time.time())
+        self._write(entries)
+
+    def invalidate(self, key):
+        """Drop the entry for key"""
+        entries = self._read()
+        if entries.pop(key, None) is not None:
+            self._write(entries)
+
+
+class MemoryIdentityCache(IdentityCache):
+    """IdentityCache held in memory, for NetBooters of one process
+
+    Threads sharing one MemoryIdentityCache identify a netbooter once.
+    """
+
+    def __init__(self, ttl=3600):
+        super(MemoryIdentityCache, self).__init__(path=None, ttl=ttl)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _read(self):
+        with self._lock:
+            return dict(self._entries)
+
+    def _write(self, entries):
+        with self._lock:
+            self._entries = dict(entries)
+
+
+class OutletStateCache(object):
+    """Recently seen outlet states, so port_status() can skip the netbooter
+
+    States are 1=on, 0=off, keyed by NetBooter.identity_key (host:port)
+    and plug.  An entry older than ttl seconds is ignored.  NetBooters
+    record what they read and what their SETs verified; a TrapListener
+    (netbooter_traps) records or drops states the netbooter announces.
+    Traps name their sender by IP address, so host names in keys are
+    resolved, once each, to match them.
+    One cache may be shared by many NetBooters and threads.
+    """
+
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self._states = {}  # key -> {plug: (state, time)}
+        self._addresses = {}  # host of a key -> its IP address
+        self._lock = threading.Lock()
+
+    def get(self, key, plug):
+        """Return the state of plug, or None if missing or expired"""
+        with self._lock:
+            entry = self._states.get(key, {}).get(plug)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def put(self, key, plug, state):
+        """Record state of plug, None forgets it"""
+        if state is None:
+            return self.invalidate(key, plug)
+        with self._lock:
+            self._states.setdefault(key, {})[plug] = (state, time.monotonic())
+
+    def invalidate(self, key, plug=None):
+        """Forget plug, or every plug of key"""
+        with self._lock:
+            if plug is None:
+                self._states.pop(key, None)
+            else:
+                self._states.get(key, {}).pop(plug, None)
+
+    def _address(self, host):
+        """IP address of host, or host itself if it does not resolve"""
+        address = self._addresses.get(host)
+        if address is None:
+            try:
+                address = socket.gethostbyname(host)
+            except (OSError, UnicodeError):
+                address = host
+            self._addresses[host] = address
+        return address
+
+    def _keys_of_host(self, host):
+        """Keys whose host is host, by name or by IP address"""
+        with self._lock:
+            keys = list(self._states)
+        address = self._address(host)
+        return [
+            key for key in keys
+            if key.rsplit(':', 1)[0] == host or self._address(key.rsplit(':', 1)[0]) == address
+        ]
+
+    def update_host(self, host, plug, state):
+        """Record state of plug for every port of host, e.g. from a trap"""
+        for key in self._keys_of_host(host):
+            self.put(key, plug, state)
+
+    def invalidate_host(self, host):
+        """Forget every plug of host, whatever the port"""
+        keys = self._keys_of_host(host)
+        with self._lock:
+            for key in keys:
+                self._states.pop(key, None)
+
+
+# Seconds between outlets switched on one netbooter from the command line,
+# so a rack of loads does not draw its inrush current at once
+DEFAULT_STAGGER = 0.5
+
+# Directory of per-netbooter lock files used by DeviceLock
+DEFAULT_LOCK_DIR = os.path.join(tempfile.gettempdir(), 'netbooter-locks')
+
+
+class DeviceLock(object):
+    """Serialize requests to one netbooter across threads and processes
+
+    The netbooter firmware misreports when it gets simultaneous requests.
+    Threads of one process share one DeviceLock per host (see for_host),
+    and processes take an flock on a lock file named after the host.
+    The lock is re-entrant within a thread.
+    """
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, key, lock_dir=DEFAULT_LOCK_DIR):
+        self.key = key
+        self.path = os.path.join(lock_dir, key.replace(':', '_').replace('/', '_') + '.lock')
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    @classmethod
+    def for_host(cls, host, port=161, lock_dir=DEFAULT_LOCK_DIR):
+        """Return the DeviceLock shared by every NetBooter of host:port in this process"""
+        key = "{}:{}".format(host, port)
+        with cls._registry_lock:
+            lock = cls._registry.get(key)
+            if lock is None:
+                lock = cls._registry[key] = cls(key, lock_dir)
+            return lock
+
+    @classmethod
+    def _reset_after_fork(cls):
+        """A forked child must not inherit locks held by other parent threads"""
+        cls._registry = {}
+        cls._registry_lock = threading.Lock()
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        self._depth += 1
+        if self._depth == 1 and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except Exception:
+                self._depth -= 1
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._thread_lock.release()
+                raise
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=DeviceLock._reset_after_fork)
+
+
+class CircuitBreaker(object):
+    """Fail fast on a netbooter that stopped answering
+
+    After threshold failed attempts in a row the circuit opens and attempts
+    are refused for reset_time seconds.  The first attempt after that is let
+    through as a probe: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, threshold=5, reset_time=30):
+        self.threshold = threshold
+        self.reset_time = reset_time
+        self.failures = 0        # failed attempts in a row
+        self.opened_at = None    # time.monotonic() when opened, None when closed
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return 'closed' if self.opened_at is None else 'open'
+
+    def allow(self):
+        """Return True if an attempt may be sent now"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_time:
+                # Let this attempt probe, refuse others until it reports
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record(self, success):
+        """Count the outcome of an attempt"""
+        with self._lock:
+            if success:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+
+# End of the deadline of the outermost RetryPolicy.call on each thread
+_deadlines = threading.local()
+
+
+class RetryPolicy(object):
+    """Attempts, total deadline, backoff and circuit breakers for requests
+
+    Replaces pysnmp retries nested inside unbounded retry decorators,
+    so a dead netbooter costs at most deadline seconds plus one request,
+    and once its circuit opens, nothing at all.  Calls made from inside
+    func, e.g. the GETs verifying a set_snmp_data, share the deadline of
+    the outermost call on their thread instead of starting their own.
+
+    A request is retried when it raises one of retry_on, or when
+    retry_on_result(result) is True.  Only exceptions count against the
+    circuit breaker of the host, a bad result still means it answered.
+    The sleep between attempts doubles from initial_backoff up to
+    max_backoff, less a random fraction up to jitter so many callers do
+    not retry in step.
+
+    One policy may be shared, e.g. by a fleet, for common breakers and counters.
+    """
+
+    def __init__(self, max_attempts=5, deadline=30, initial_backoff=0.5, max_backoff=4,
+                 jitter=0.5, retry_on=RETRYABLE_ERRORS, breaker_threshold=5,
+                 breaker_reset=30, seed=None):
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_on = retry_on
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.random = random.Random(seed)
+        self.counters = collections.Counter()
+        self._breakers = {}  # host:port -> CircuitBreaker
+        self._lock = threading.Lock()
+
+    def breaker(self, key):
+        """Return the circuit breaker of key, e.g. host:port"""
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(
+                    self.breaker_threshold, self.breaker_reset)
+            return breaker
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        """Return dict of counter name -> count"""
+        with self._lock:
+            return dict(self.counters)
+
+    def backoff(self, attempt):
+        """Seconds to sleep after attempt, counted from 1"""
+        delay = min(self.initial_backoff * 2 ** (attempt - 1), self.max_backoff)
+        return delay * (1 - self.jitter * self.random.random())
+
+    def call(self, key, func, retry_on_result=None, max_attempts=None):
+        """Call func() until it succeeds, the attempts run out or the deadline passes
+
+           Takes: key - circuit breaker key, e.g. host:port
+                  func - callable taking no arguments
+                  retry_on_result - predicate, True if the result needs a retry
+                  max_attempts - override self.max_attempts
+           Returns: result of func()
+           Raises: CircuitOpenError, RetryExhaustedError
+        """
+        max_attempts = max_attempts or self.max_attempts
+        breaker = self.breaker(key)
+        start = time.monotonic()
+        outer_end = getattr(_deadlines, 'end', None)
+        end = start + self.deadline
+        if outer_end is not None:
+            if outer_end <= start:
+                self.count('deadline_exceeded')
+                raise RetryExhaustedError("{} deadline passed before the first attempt".format(key))
+            end = min(end, outer_end)
+        _deadlines.end = end
+        try:
+            return self._call(key, func, retry_on_result, max_attempts, breaker, start, end)
+        finally:
+            _deadlines.end = outer_end
+
+    def _call(self, key, func, retry_on_result, max_attempts, breaker, start, end):
+        error = None
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self.count('circuit_open')
+                raise CircuitOpenError("{} circuit open after {} failures".format(
+                    key, breaker.failures)) from error
+            attempt += 1
+            self.count('attempts')
+            try:
+                result = func()
+            except self.retry_on as e:
+                breaker.record(False)
+                self.count('errors')
+                error = e
+            else:
+                breaker.record(True)
+                if retry_on_result is None or not retry_on_result(result):
+                    self.count('successes')
+                    return result
+                self.count('bad_results')
+                error = None
+            remaining = end - time.monotonic()
+            if attempt >= max_attempts or remaining <= 0:
+                break
+            self.count('retries')
+            time.sleep(min(self.backoff(attempt), remaining))
+
+        self.count('deadline_exceeded' if attempt < max_attempts else 'exhausted')
+        raise RetryExhaustedError("{} failed after {} attempts in {:.1f}s: {}".format(
+            key, attempt, time.monotonic() - start,
+            error if error is not None else "result {!r}".format(result))) from error
+
+
+# One request of a NetBooter, passed to each of its request_hooks
+#   host      - netbooter address, host:port
+#   operation - NetBooter method, e.g. get_snmp_data
+#   oid       - dotted OID requested, the first one of a bulk request
+#   duration  - seconds, including retries
+#   retries   - attempts after the first
+#   error     - class name of the error raised, None on success
+RequestMetric = collections.namedtuple('RequestMetric', 'host operation oid duration retries error')
+
+
+def dotted_oid(oid):
+    """Return oid, a string or tuple of ints, as a dot separated string"""
+    if isinstance(oid, tuple):
+        return '.'.join(str(part) for part in oid)
+    return str(oid)
+
+
+def error_name(error):
+    """Class name of error, or of its cause when retries ran out on it"""
+    if isinstance(error, RetryExhaustedError) and error.__cause__ is not None:
+        error = error.__cause__
+    return type(error).__name__
+
+
+def retried(retry_on_result=None, max_attempts=None):
+    """Decorate a NetBooter method to run it under self.retry_policy
+
+    Each call is reported as a RequestMetric to self.request_hooks.
+    The undecorated method stays reachable as method.__wrapped__.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            attempts = [0]
+
+            def attempt():
+                attempts[0] += 1
+                return method(self, *args, **kwargs)
+
+            start = time.perf_counter()
+            error = None
+            try:
+                return self.retry_policy.call(
+                    self.identity_key,
+                    attempt,
+                    retry_on_result=retry_on_result,
+                    max_attempts=max_attempts
+                )
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                if self.request_hooks:
+                    oid = args[0] if args else next(iter(kwargs.values()), '')
+                    if isinstance(oid, list):
+                        oid = oid[0] if oid else ''
+                    metric = RequestMetric(
+                        self.identity_key,
+                        method.__name__,
+                        dotted_oid(oid),
+                        time.perf_counter() - start,
+                        max(attempts[0] - 1, 0),
+                        None if error is None else error_name(error)
+                    )
+                    for hook in self.request_hooks:
+                        hook(metric)
+        return wrapper
+    return decorate
+
+
+class MetricsRegistry(object):
+    """Aggregate RequestMetric per host, operation and OID
+
+    Pass as a request hook, NetBooter(request_hooks=[registry]).
+    Durations go into a cumulative histogram with BUCKETS upper bounds.
+    write() exports Prometheus text or a JSON snapshot to a file.
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.series = {}  # (host, operation, oid) -> dict of totals
+        self._lock = threading.Lock()
+
+    def __call__(self, metric):
+        self.record(metric)
+
+    def record(self, metric):
+        """Add one RequestMetric"""
+        key = (metric.host, metric.operation, metric.oid)
+        with self._lock:
+            totals = self.series.get(key)
+            if totals is None:
+                totals = self.series[key] = {
+                    'count': 0,
+                    'retries': 0,
+                    'errors': collections.Counter(),
+                    'duration_sum': 0.0,
+                    'duration_max': 0.0,
+                    'buckets': [0] * len(self.BUCKETS),
+                }
+            totals['count'] += 1
+            totals['retries'] += metric.retries
+            if metric.error is not None:
+                totals['errors'][metric.error] += 1
+            totals['duration_sum'] += metric.duration
+            totals['duration_max'] = max(totals['duration_max'], metric.duration)
+            for index, bound in enumerate(self.BUCKETS):
+                if metric.duration <= bound:
+                    totals['buckets'][index] += 1
+
+    def snapshot(self):
+        """Return a JSON serializable copy of every series"""
+        with self._lock:
+            return {
+                'time': time.time(),
+                'buckets': list(self.BUCKETS),
+                'requests': [
+                    dict(totals, host=host, operation=operation, oid=oid,
+                         errors=dict(totals['errors']), buckets=list(totals['buckets']))
+                    for (host, operation, oid), totals in sorted(self.series.items())
+                ],
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=1, sort_keys=True)
+
+    def to_prometheus(self):
+        """Return the series in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        requests, retries, errors, duration = [], [], [], []
+        for series in snapshot['requests']:
+            labels = 'host="{host}",operation="{operation}",oid="{oid}"'.format(**series)
+            requests.append('netbooter_requests_total{{{}}} {}'.format(labels, series['count']))
+            retries.append('netbooter_request_retries_total{{{}}} {}'.format(labels, series['retries']))
+            for name, count in sorted(series['errors'].items()):
+                errors.append('netbooter_request_errors_total{{{},error="{}"}} {}'.format(
+                    labels, name, count))
+            for bound, count in zip(self.BUCKETS, series['buckets']):
+                duration.append('netbooter_request_duration_seconds_bucket{{{},le="{}"}} {}'.format(
+                    labels, bound, count))
+            duration.append('netbooter_request_duration_seconds_bucket{{{},le="+Inf"}} {}'.format(
+                labels, series['count']))
+            duration.append('netbooter_request_duration_seconds_sum{{{}}} {}'.format(
+                labels, series['duration_sum']))
+            duration.append('netbooter_request_duration_seconds_count{{{}}} {}'.format(
+                labels, series['count']))
+        lines = []
+        for name, kind, text, samples in (
+            ('netbooter_requests_total', 'counter', 'SNMP requests', requests),
+            ('netbooter_request_retries_total', 'counter', 'Attempts after the first', retries),
+            ('netbooter_request_errors_total', 'counter', 'Requests that raised, by error', errors),
+            ('netbooter_request_duration_seconds', 'histogram', 'Request duration with retries', duration),
+        ):
+            lines.append('# HELP {} {}'.format(name, text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, format=None):
+        """Atomically write the metrics to path
+        format is 'json' or 'prometheus', by default json for a .json path
+        """
+        if format is None:
+            format = 'json' if path.endswith('.json') else 'prometheus'
+        text = self.to_json() if format == 'json' else self.to_prometheus()
+        atomic_write(path, text, prefix='.metrics')
+
+
+class SnmpDatagramProtocol(object):
+    """asyncio datagram protocol of AsyncNetBooter, one per netbooter and event loop
+
+    Requests are BER encoded SNMP messages, matched to their response by
+    request-id.  A request is resent every timeout seconds, num_retries
+    times at most, and fails with RequestTimedOutError once its deadline passes.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.waiters = {}  # request-id -> future of the response PDU
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            version = int(_lazy('snmp_api').decodeMessageVersion(data))
+            p_mod = _lazy('snmp_api').protoModules[version]
+            msg, _ = _lazy('ber_decoder').decode(data, asn1Spec=p_mod.Message())
+            pdu = p_mod.apiMessage.getPDU(msg)
+            request_id = int(p_mod.apiPDU.getRequestID(pdu))
+        except Exception:
+            # Not an SNMP response, or garbled on the way
+            return
+        future = self.waiters.pop(request_id, None)
+        if future is not None and not future.done():
+            future.set_result(pdu)
+
+    def error_received(self, exc):
+        # e.g. ICMP port unreachable from a rebooting netbooter, requests
+        # are resent until their deadline as pysnmp does
+        pass
+
+    def connection_lost(self, exc):
+        for future in self.waiters.values():
+            if not future.done():
+                future.set_exception(exc or ConnectionAbortedError("SNMP transport closed"))
+        self.waiters.clear()
+
+    async def request(self, data, request_id, timeout, num_retries, deadline):
+        """Send an encoded request and return the response PDU"""
+        asyncio = _lazy('asyncio')
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.waiters[request_id] = future
+        start = loop.time()
+        sends = 0
+        try:
+            while sends <= num_retries:
+                remaining = start + deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self.transport.sendto(data)
+                sends += 1
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), min(timeout, remaining))
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            self.waiters.pop(request_id, None)
+        raise RequestTimedOutError("No response after {} tries in {:.1f}s".format(
+            sends, loop.time() - start))
+
+
+async def gather_bounded(coros, limit):
+    """Await coroutines with at most limit running at once
+
+    Takes: coros - iterable of coroutines, e.g. one per netbooter
+           limit - maximum number of coroutines in flight
+    Returns: list of results, in the order given.
+             Exceptions are returned in place of results.
+    """
+    semaphore = _lazy('asyncio').Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await _lazy('asyncio').gather(*[run(coro) for coro in coros], return_exceptions=True)
+
+
+class LogEvent(object):
+    """Log message built only when a handler emits it
+
+    Rendered as "event key=value ..." or, when structured, as one JSON
+    object {"event": event, key: value, ...}.  The fields are also set on
+    the LogRecord as record.event and record.fields for handlers that
+    format records themselves.
+    """
+    __slots__ = ('event', 'fields', 'structured')
+
+    def __init__(self, event, fields, structured=False):
+        self.event = event
+        self.fields = fields
+        self.structured = structured
+
+    def __str__(self):
+        if self.structured:
+            return json.dumps(dict(self.fields, event=self.event), default=str, sort_keys=True)
+        return ' '.join(
+            [self.event] + ['{}={}'.format(key, value) for key, value in sorted(self.fields.items())])
+
+
 def get_log():
     """
     Return a console logger if one not provided
@@ -89,7 +1096,17 @@ class NetBooter(object):
         public="public", 
         private="public",
         conn_type="snmp", 
-        debug=False
+        debug=False,
+        max_var_binds=16,
+        identity_cache=None,
+        mp_model=0,
+        serialize=False,
+        timeout=2,
+        num_retries=2,
+        retry_policy=None,
+        request_hooks=(),
+        structured_log=False,
+        outlet_cache=None
     ):
 
         self.host = host
@@ -99,8 +1116,17 @@ class NetBooter(object):
         self.debug = debug
         self.conn_type = conn_type
         self.log = logger or get_log()
-        self.timeout = 10  # seconds to wait before retrying NP-16 connection
-        self.num_retries = 15  # number of times to try connecting
+        self.timeout = timeout  # seconds to wait before retrying NP-16 connection
+        self.num_retries = num_retries  # pysnmp resends within one attempt
+        self.retry_policy = retry_policy or RetryPolicy()  # attempts, deadline, breaker
+        self.request_hooks = list(request_hooks)  # callables given a RequestMetric per request
+        self.structured_log = structured_log  # log events as JSON, see LogEvent
+        self.outlet_cache = outlet_cache  # OutletStateCache, or None to always read
+        self.max_var_binds = max_var_binds  # OIDs packed into one GET PDU
+        self.mp_model = mp_model  # 0=SNMPv1, 1=SNMPv2c (allows GETBULK)
+        # Hold a per-host lock for each request, across threads and processes
+        self.device_lock = DeviceLock.for_host(host, port) if serialize else None
+        self._snmp_session = None  # (engine, auth, transport) built on first request
         #
         # Call init method to initialize these variables
         #
@@ -109,59 +1135,135 @@ class NetBooter(object):
         self.outlet_action = ""    # base oid (minus port) for switching outlet
         self.outlet_status = ""    # base oid (minus port) for status of outlet
         self.outlet_range = []     # valid outlet numbering
-        self.identify_netbooter()  # initialize these variables
+        self.verify = dict(VERIFY_DEFAULT)  # set confirmation tunables for model
+        self.profile = None        # compiled MibProfile of this model
+        self.identity_cache = identity_cache  # IdentityCache, or None to always identify
+        if not self.load_identity():
+            self.identify_netbooter()  # initialize these variables
+
+    def _event(self, level, event, **fields):
+        """Log event with fields, formatted only if level is enabled"""
+        if self.log.isEnabledFor(level):
+            self.log.log(
+                level,
+                LogEvent(event, fields, self.structured_log),
+                extra={'event': event, 'fields': fields}
+            )
+
+    def snmp_session(self):
+        """Return the long-lived pysnmp objects used for every request
+        :return tuple: (CommandGenerator, CommunityData, UdpTransportTarget)
+
+        Building a CommandGenerator creates a new SNMP engine, and building
+        a UdpTransportTarget resolves the host, so both are created once per
+        instance and reused.  The engine caches its target configuration,
+        so later requests skip that work too.
+        """
+        if self._snmp_session is None:
+            cmdgen = _lazy('cmdgen')
+            self._snmp_session = (
+                cmdgen.CommandGenerator(),
+                cmdgen.CommunityData('my-name', self.public, self.mp_model),
+                cmdgen.UdpTransportTarget(
+                    (self.host, self.port),
+                    timeout=self.timeout,
+                    retries=self.num_retries
+                )
+            )
+        return self._snmp_session
+
+    def _command(self, command, *args):
+        """Send one request with a CommandGenerator command, e.g. 'getCmd'
+        :return tuple: (error_indication, error_status, error_index, var_binds)
+
+        With serialize on, the device lock is held for the exchange, so
+        no other thread or process talks to this netbooter meanwhile.
+        """
+        cmd_gen, auth_data, transport = self.snmp_session()
+        lock = self.device_lock if self.device_lock is not None else contextlib.nullcontext()
+        with lock:
+            return getattr(cmd_gen, command)(auth_data, transport, *args)
+
+    def _check_response(self, error_indication, error_status, error_index, var_binds):
+        """Raise SnmpEngineError or SnmpPduError if the response is an error
+
+        An error may mean the cached identity is stale, so it is invalidated.
+        """
+        if error_indication or error_status:
+            self.invalidate_identity()
+        if error_indication:
+            raise SnmpEngineError("error:{}".format(error_indication))
+        elif error_status:
+            raise SnmpPduError("error_status:{},error_index:{}".format(error_status, error_index))
+        self.log.debug(var_binds)
 
-    @retrying.retry(retry_on_result=retry_if_result_none)
+    @retried(retry_on_result=retry_if_result_none)
     def get_snmp_data(self, oid):
         """Perform snmp get request
         :param string oid: dot separated SET object identifier
         :return string: value of the oid
 
-        1. Perform snmp get, repeat on fail 10 times, pausing 6 sec between.
+        1. Perform snmp get, retried under self.retry_policy on error.
         2. Repeat if result == None or ''.
         """
-        self.log.debug("Called get_snmp_data({})".format(oid))
-
-        # Convert OID to pysnmp OID representation
-        # split string on '.' into a list
-        # list comprehension to convert list of strings to list of int
-        # - pysnmp expects a tuple of ints
-        get_oid_split = tuple([int(x) for x in oid.split('.')])
+        # Convert OID to pysnmp OID representation, a tuple of ints
+        get_oid_split = compile_oid(oid)
 
-        self.log.debug("BEFORE: get_oid:{}".format(oid))
+        self._event(logging.DEBUG, 'get_request', oid=oid)
 
         try:
             # Create the pysnmp object, and send query
-            err_tuple = cmdgen.CommandGenerator().getCmd(
-                cmdgen.CommunityData('my-name', self.public, 0),
-                cmdgen.UdpTransportTarget(
-                    (self.host, 161),
-                    timeout=self.timeout,
-                    retries=self.num_retries
-                ),
-                get_oid_split
-            )
+            err_tuple = self._command('getCmd', get_oid_split)
         except Exception as e:
-            self.log.error("Got Exception:{}".format(str(e)))
+            self.log.error("Got Exception:%s", e)
             raise(e)
 
-        self.log.debug("AFTER: get_oid:{}".format(oid))
+        self._event(logging.DEBUG, 'get_response', oid=oid)
         error_indication, error_status, error_index, var_binds = err_tuple
 
         # If We receive an error, trigger a retry
-        if error_indication:
-            raise SnmpEngineError("error:{}".format(error_indication))
-        elif error_status:
-            raise SnmpPduError("error_status:{},error_index:{}".format(error_status, error_index))
-        else:
-            self.log.debug(var_binds)
+        self._check_response(error_indication, error_status, error_index, var_binds)
 
         var_bind = var_binds[0]
         oid, value = var_bind
         response = value
         return response
 
-    @retrying.retry(retry_on_result=retry_if_result_false, stop_max_attempt_number=4)
+    @retried(retry_on_result=retry_if_result_incomplete)
+    def get_snmp_data_bulk(self, oids):
+        """Perform snmp get request for many OIDs at once
+        :param list oids: dot separated GET object identifiers
+        :return list: values of the oids, in the order requested
+
+        1. Pack OIDs into as few GET PDUs as possible,
+           splitting at self.max_var_binds OIDs per PDU.
+        2. Repeat if any result == None or ''.
+        """
+        self._event(logging.DEBUG, 'get_bulk_request', oids=oids)
+
+        # pysnmp expects a tuple of ints per OID
+        get_oid_split = [compile_oid(oid) for oid in oids]
+
+        responses = []
+        for start in range(0, len(get_oid_split), self.max_var_binds):
+            chunk = get_oid_split[start:start + self.max_var_binds]
+            try:
+                # Create the pysnmp object, and send one query for the chunk
+                err_tuple = self._command('getCmd', *chunk)
+            except Exception as e:
+                self.log.error("Got Exception:%s", e)
+                raise(e)
+
+            error_indication, error_status, error_index, var_binds = err_tuple
+
+            # If We receive an error, trigger a retry
+            self._check_response(error_indication, error_status, error_index, var_binds)
+
+            responses.extend(value for oid, value in var_binds)
+
+        return responses
+
+    @retried(retry_on_result=retry_if_result_false, max_attempts=4)
     def set_snmp_data(self, set_oid, get_oid, state):
         """Perform snmp set request
         :param string set_oid: dot separated SET object identifier
@@ -169,174 +1271,109 @@ class NetBooter(object):
         :state string state: value to be SET
         :return bool: True on success, False on fail
 
-        1. Perform snmp set request, repeat on fail 4 times, pausing 6 sec between each try.
-        2. Wait a few seconds after a successful set
-        3. Perform get,
-        4. If get value matches set value, result = True; Otherwise result = False
-        5. If result == False, retry method 4 times.
+        1. Perform snmp set request, retried under self.retry_policy on error.
+        2. Poll the get_oid until the value is stable (see confirm_state)
+        3. If get value matches set value, result = True; Otherwise result = False
+        4. If result == False, retry up to 4 attempts, then raise RetryExhaustedError.
         """
-        self.log.debug("Called set_snmp_data(set:{},get:{},val:{})".format(set_oid, get_oid, state))
-
-        # Result variable.
-        # True if the value set is verified by subsequent get.
-        set_value_successful = False
-
-        # Convert OID to pysnmp OID representation
-        # - split string on '.' into a list
-        # - use list comprehension to converts list of strings to list of int
-        # - pysnmp expects a tuple of ints
-        set_oid_split = tuple([int(x) for x in set_oid.split('.')])
+        # Convert OID to pysnmp OID representation, a tuple of ints
+        set_oid_split = compile_oid(set_oid)
 
-        self.log.debug("BEFORE: set_oid:{}, state:{}".format(set_oid, state))
+        self._event(logging.DEBUG, 'set_request', set_oid=set_oid, get_oid=get_oid, state=state)
 
         try:
             # Create the pysnmp object, and send query
-            err_tuple = cmdgen.CommandGenerator().setCmd(
-                cmdgen.CommunityData('my_name', self.public, 0),
-                cmdgen.UdpTransportTarget(
-                    (self.host, 161),
-                    timeout=self.timeout,
-                    retries=self.num_retries
-                ),
-                (set_oid_split, rfc1902.Integer(state))
-            )
+            err_tuple = self._command('setCmd', (set_oid_split, _lazy('rfc1902').Integer(state)))
         except Exception as e:
-            self.log.error("Got Exception:{}".format(str(e)))
+            self.log.error("Got Exception:%s", e)
             raise
 
-        self.log.debug("AFTER: set_oid:{}, state:{}".format(set_oid, state))
         error_indication, error_status, error_index, var_binds = err_tuple
 
-        # BAND AID: Netbooter misreports state immediately after a set
-        # The netbooter tries the set, and during that time reports the values to be set.
-        # If the plug is not powered, port returns to previous state, and then netbooter
-        #   reports the original state.
-        # Waiting 2 seconds is not long enough 1/50 tries
-        time.sleep(2)
-
         # If We receive an error, trigger a retry
-        if error_indication:
-            raise SnmpEngineError("error:{}".format(error_indication))
-        elif error_status:
-            raise SnmpPduError("error_status:{},error_index:{}".format(error_status, error_index))
-        else:
-            self.log.debug(var_binds)
+        self._check_response(error_indication, error_status, error_index, var_binds)
 
         var_bind = var_binds[0]
         oid, value = var_bind
-        response = value
-        self.log.debug("set response:{}".format(response))
-
-        # Read value
-        current_state = self.get_snmp_data(get_oid)
-
-        self.log.debug(
-            (
-                "get_oid:{}, "
-                "current_state:{},"
-                "time:{}"
-             ).format(
-                get_oid,
-                current_state,
-                time.time()
-            )
-        )
-        self.log.debug(
-            (
-                "++++++++++++++++++++++++\n"
-                "var_binds:{}\n"
-                "var_bind:{}\n"
-                "value:{}\n"
-                "cur_value:{}\n"
-                "------------------------"
-            ).format(
-                var_binds,
-                var_bind,
-                value,
-                current_state
-            )
+        self._event(logging.DEBUG, 'set_response', set_oid=set_oid, value=value)
+
+        # BAND AID: Netbooter misreports state immediately after a set
+        # Poll until the value is stable, instead of a fixed sleep
+        current_state = self.confirm_state(get_oid, state)
+
+        # True if the value set is verified by subsequent get.
+        set_value_successful = current_state in STATE_MAP[state]
+        self._event(
+            logging.DEBUG, 'set_confirm',
+            get_oid=get_oid, state=state, current_state=current_state,
+            verified=set_value_successful
         )
-        # For these set states, make list of acceptable current_state
-        state_map = {
-            1: [1, 257],    # Good ON values
-            2: [0, 2, 256]  # Good OFF values
-        }
-        if current_state in state_map[state]:
-            self.log.debug("Value changed value:{}, current_state:{}".format(value, current_state))
-            set_value_successful = True
+        if not set_value_successful:
+            # The cached OID map may not match this netbooter anymore
+            self.invalidate_identity()
 
         return set_value_successful
 
+    def confirm_state(self, get_oid, state):
+        """Poll outlet state after a set until it is stable
+        :param string get_oid: dot separated GET object identifier
+        :param int state: value that was SET
+        :return: last value read
+
+        Reads from poll_start() on, one read landing at min_settle, then with
+        exponential backoff (self.verify tunables), and returns once
+        stable_reads reads in a row show the same outlet state past
+        min_settle, or the deadline passes.
+        The caller decides whether the stable value is acceptable for state,
+        so a plug that did not switch fails fast instead of polling until
+        the deadline.
+        """
+        start = time.time()
+        same_reads = 0
+        current_state = None
+        for delay in verify_delays(self.verify):
+            time.sleep(settle_delay(delay, time.time() - start, self.verify))
+            previous_state, current_state = current_state, self.get_snmp_data(get_oid)
+            same_reads = stable_count(same_reads, previous_state, current_state)
+            if verify_done(same_reads, time.time() - start, self.verify):
+                break
+        return current_state
+
+    @property
+    def identity_key(self):
+        """Key of this netbooter in the identity cache"""
+        return "{}:{}".format(self.host, self.port)
+
+    def load_identity(self):
+        """Initialize identity variables from the identity cache
+        :return bool: True if a fresh entry was found
+        """
+        if self.identity_cache is None:
+            return False
+        entry = self.identity_cache.get(self.identity_key)
+        if entry is None or entry.get('model') not in PROFILES:
+            return False
+        self.profile = PROFILES[entry['model']]
+        self.status = entry['status']
+        self.power_outlet_num = entry['power_outlet_num']
+        self.outlet_action = entry['outlet_action']
+        self.outlet_status = entry['outlet_status']
+        self.outlet_range = entry['outlet_range']
+        self.verify = dict(self.profile.verify)
+        self.log.debug("identity from cache: %s", entry['model'])
+        return True
+
+    def invalidate_identity(self):
+        """Drop this netbooter from the identity cache"""
+        if self.identity_cache is not None:
+            self.identity_cache.invalidate(self.identity_key)
+
     def identify_netbooter(self):
         """Identify proper OID's for each netbooter model
 
             Based on response for OID 1.3.6.1.2.1.1.1.0,
             Return nothing.  Intiaizes class level variables
         """
-
-        # -----------------------------------------------------------------------
-        # Netbooter 16s MIB
-        # -----------------------------------------------------------------------
-        #
-        # For testing with net-snmp, this should turn off plug 1
-        # snmpset -c public -v1 192.168.1.100 .1.3.6.1.4.1.21728.3.2.1.1.4.0 i 2
-        # snmpget -c public -v1 192.168.1.100 .1.3.6.1.4.1.21728.3.2.1.1.3.0
-        #
-        status_16s = {
-            "systemModel":                "1.3.6.1.4.1.21728.3.1.1.0",
-            "systemName":                 "1.3.6.1.4.1.21728.3.1.2.0",
-            "powerOutletNum":             "1.3.6.1.4.1.21728.3.1.3.0",
-            "systemUpTime":               "1.3.6.1.4.1.21728.3.1.5.0",
-            "swVersion":                  "1.3.6.1.4.1.21728.3.1.6.0",
-            "ifPhysAddress":              "1.3.6.1.2.1.2.2.1.6.0",
-            "ipAdEntIfIndex":             "1.3.6.1.2.1.4.20.1.2.0",
-            "ipAdEntNetMask":             "1.3.6.1.2.1.4.20.1.3.0",
-            "ipAddress":                  "1.3.6.1.4.1.21728.3.4.2.0",
-            "acCurrentSensorNumber":      "1.3.6.1.4.1.21728.3.1.7.0",
-            "currentAlarmThreshold":      "1.3.6.1.4.1.21728.3.3.1.0",
-            "currentDrawStatus1":         "1.3.6.1.4.1.21728.3.3.2.0",
-            "currentDrawStatus2":         "1.3.6.1.4.1.21728.3.3.3.0",
-            "currentDrawMax1":            "1.3.6.1.4.1.21728.3.3.4.0",
-            "currentDrawMax2":            "1.3.6.1.4.1.21728.3.3.5.0",
-            "temperatureUpThreshold":     "1.3.6.1.4.1.21728.3.3.6.0",
-            "temperatureLowThreshold":    "1.3.6.1.4.1.21728.3.3.7.0",
-            "temperatureReading":         "1.3.6.1.4.1.21728.3.3.8.0"
-        }
-        # 1=on, 2=off
-        outlet_status_16s = "1.3.6.1.4.1.21728.3.2.1.1.3"
-        # 0=none,1=on,2=off,3=reboot
-        outlet_action_16s = "1.3.6.1.4.1.21728.3.2.1.1.4"
-        # outlet numbering
-        starting_plug_16s = 0
-
-        # -----------------------------------------------------------------------
-        # Netbooter 16 or 8 MIB
-        # -----------------------------------------------------------------------
-        #
-        # For testing with net-snmp, this should turn off plug 1
-        # snmpset -c public -v1 <IP> .1.3.6.1.4.1.21728.2.4.1.2.1.1.4.1 i 2
-        # snmpget -c public -v1 <IP> .1.3.6.1.4.1.21728.2.4.1.2.1.1.3.1
-        #
-        status_16 = {
-            "systemModel":                "1.3.6.1.4.1.21728.2.4.1.1.1.0",
-            "systemName":                 "1.3.6.1.4.1.21728.2.4.1.1.2.0",
-            "powerOutletNum":             "1.3.6.1.4.1.21728.2.4.1.1.3.0",
-            "systemUpTime":               "1.3.6.1.4.1.21728.2.4.1.1.5.0",
-            "swVersion":                  "1.3.6.1.4.1.21728.2.4.1.1.6.0",
-            "currentAlarmThreshold":      "1.3.6.1.4.1.21728.2.4.1.3.1.1.2",
-            "currentDrawStatus1":         "1.3.6.1.4.1.21728.2.4.1.3.1.1.3",
-            "currentDrawStatus2":         "1.3.6.1.4.1.21728.2.4.1.3.1.1.4",
-            "currentDrawMax1":            "1.3.6.1.4.1.21728.2.4.1.3.1.1.5",
-            "currentDrawMax2":            "1.3.6.1.4.1.21728.2.4.1.3.1.1.6",
-            "temperatureThreshold":       "1.3.6.1.4.1.21728.2.4.1.3.1.1.7",
-            "temperatureReading":         "1.3.6.1.4.1.21728.2.4.1.3.1.1.8"
-        }
-        # 0 OR 2 OR 256=off, 1 OR 257=on
-        outlet_status_16 = "1.3.6.1.4.1.21728.2.4.1.2.1.1.3"
-        # 0=none,1=on,2=off,3=reboot
-        outlet_action_16 = "1.3.6.1.4.1.21728.2.4.1.2.1.1.4"
-        # outlet numbering
-        starting_plug_16 = 1
         #
         # Us OID SNMPv2-MIB::sysObjectID.0 to identify netbooter.
         #
@@ -344,118 +1381,207 @@ class NetBooter(object):
         #
         # Assign the proper oid's for the netbooter
         #
-        self.log.debug("identity: {}".format(identity_string))
-        if identity_string == 'Power Distribution System':
-            # Choose correct MIB
-            self.status = status_16
-            # Get outlet count
-            self.power_outlet_num = self.get_snmp_data(self.status["powerOutletNum"])
-            # Set base OID for switching outlet
-            self.outlet_action = outlet_action_16
-            # Set base OID for reading outlet state
-            self.outlet_status = outlet_status_16
-            # Create list of outlet numbering
-            self.outlet_range = list(range(
-                starting_plug_16,
-                starting_plug_16 + self.power_outlet_num))
-
-        elif identity_string == 'Synaccess Remote PDU':
-            # Choose correct MIB
-            self.status = status_16s
-            # Get outlet count
-            self.power_outlet_num = self.get_snmp_data(self.status["powerOutletNum"])
-            # Set base OID for switching outlet
-            self.outlet_action = outlet_action_16s
-            # Set base OID for reading outlet state
-            self.outlet_status = outlet_status_16s
-            # Create list of outlet numbering
-            self.outlet_range = list(range(
-                starting_plug_16s,
-                starting_plug_16s + self.power_outlet_num))
-        else:
+        self.log.debug("identity: %s", identity_string)
+        profile = PROFILES.get(str(identity_string))
+        if profile is None:
             raise Exception("Can't identify netbooter!")
-
-        self.log.debug(
-            (
-                "--------------------\n"
-                "powerOutletNum:{}\n"
-                "outlet_action:{}\n"
-                "outlet_status:{}\n"
-                "outlet_range:{}\n"
-                "status:{}\n"
-                "--------------------"
-            ).format(
-                self.power_outlet_num,
-                self.outlet_action,
-                self.outlet_status,
-                self.outlet_range,
-                self.status
-            )
+        # Choose correct MIB
+        self.profile = profile
+        self.status = profile.status
+        # Get outlet count
+        self.power_outlet_num = self.get_snmp_data(profile.status_oids["powerOutletNum"])
+        # Set base OID for switching outlet
+        self.outlet_action = profile.outlet_action
+        # Set base OID for reading outlet state
+        self.outlet_status = profile.outlet_status
+        # Create list of outlet numbering
+        self.outlet_range = list(range(
+            profile.starting_plug,
+            profile.starting_plug + self.power_outlet_num))
+        # Tunables for confirming a set on this model
+        self.verify = dict(profile.verify)
+        # Remember the identity for the next run
+        if self.identity_cache is not None:
+            self.identity_cache.put(self.identity_key, {
+                'model': str(identity_string),
+                'power_outlet_num': int(self.power_outlet_num),
+                'outlet_action': self.outlet_action,
+                'outlet_status': self.outlet_status,
+                'outlet_range': self.outlet_range,
+                'status': self.status,
+            })
+
+        self._event(
+            logging.DEBUG, 'identified',
+            powerOutletNum=self.power_outlet_num,
+            outlet_action=self.outlet_action,
+            outlet_status=self.outlet_status,
+            outlet_range=self.outlet_range,
+            status=self.status
         )
 
-    def plug_off(self, plug_id, delay_time=0):
+    def outlet_oids(self, plug):
+        """Return compiled (set_oid, get_oid) for a plug
+
+        int(plug)      - convert string to int
+        subtract 1     - User count from 1, array count from zero
+        outlet_range[] - grab proper outlet index for identified netbooter
+        """
+        return self.profile.outlet_oids(self.outlet_range[int(plug)-1])
+
+    @retried(max_attempts=4)
+    def set_snmp_data_bulk(self, set_oids, state):
+        """Perform snmp set request for many OIDs at once, without verifying
+        :param list set_oids: dot separated SET object identifiers
+        :param int state: value to be SET on every OID
+
+        OIDs are packed into as few SET PDUs as possible,
+        splitting at self.max_var_binds OIDs per PDU.
+        Retried under self.retry_policy on error, resending every PDU;
+        setting an outlet to the same state again is harmless.
+        """
+        self._event(logging.DEBUG, 'set_bulk_request', set_oids=set_oids, state=state)
+
+        # pysnmp expects a tuple of ints per OID
+        set_oid_split = [compile_oid(oid) for oid in set_oids]
+
+        for start in range(0, len(set_oid_split), self.max_var_binds):
+            chunk = set_oid_split[start:start + self.max_var_binds]
+            try:
+                # Send one SET PDU for the chunk
+                err_tuple = self._command(
+                    'setCmd',
+                    *[(oid, _lazy('rfc1902').Integer(state)) for oid in chunk]
+                )
+            except Exception as e:
+                self.log.error("Got Exception:%s", e)
+                raise
+
+            error_indication, error_status, error_index, var_binds = err_tuple
+
+            self._check_response(error_indication, error_status, error_index, var_binds)
+
+    def confirm_states(self, get_oids, state):
+        """Poll many outlet states after a set until each is stable
+        :param list get_oids: dot separated GET object identifiers
+        :param int state: value that was SET
+        :return list: last value read for each oid, in the order given
+
+        Like confirm_state(), but every poll is one bulk read of the oids
+        that are not yet stable.
+        """
+        start = time.time()
+        same_reads = dict.fromkeys(get_oids, 0)
+        current_states = dict.fromkeys(get_oids)
+        pending = list(get_oids)
+        for delay in verify_delays(self.verify):
+            time.sleep(settle_delay(delay, time.time() - start, self.verify))
+            for oid, current_state in zip(pending, self.get_snmp_data_bulk(pending)):
+                same_reads[oid] = stable_count(same_reads[oid], current_states[oid], current_state)
+                current_states[oid] = current_state
+            elapsed = time.time() - start
+            pending = [oid for oid in pending if not verify_done(same_reads[oid], elapsed, self.verify)]
+            if not pending:
+                break
+        return [current_states[oid] for oid in get_oids]
+
+    def switch_plugs(self, plug_id, state, stagger=0, attempts=4):
+        """Set a list of plugs to state concurrently, then verify them together
+
+           Takes: plug_id - list of plugs
+                  state - 1=on, 2=off
+                  stagger - seconds between SETs, to limit inrush current.
+                            With 0 all SETs go out in one multi-varbind PDU.
+                  attempts - times to SET plugs that did not verify
+           Returns: dict of plug -> True if the new state was verified
+        """
+        outlets = dict((plug, self.outlet_oids(plug)) for plug in plug_id)
+        results = dict.fromkeys(plug_id, False)
+        pending = list(plug_id)
+        for _ in range(attempts):
+            set_oids = [outlets[plug][0] for plug in pending]
+            if stagger:
+                for index, set_oid in enumerate(set_oids):
+                    if index:
+                        time.sleep(stagger)
+                    self.set_snmp_data_bulk([set_oid], state)
+            else:
+                self.set_snmp_data_bulk(set_oids, state)
+
+            current_states = self.confirm_states(
+                [outlets[plug][1] for plug in pending],
+                state
+            )
+            for plug, current_state in zip(pending, current_states):
+                results[plug] = current_state in STATE_MAP[state]
+            pending = [plug for plug in pending if not results[plug]]
+            if not pending:
+                break
+        if pending:
+            # The cached OID map may not match this netbooter anymore
+            self.invalidate_identity()
+        return results
+
+    def plug_off(self, plug_id, delay_time=0, concurrent=False):
         """Power off outlet range in list
 
            Takes: plug_id - list of ports ot power off
-           Returns nothing.
+                  delay_time - time to sleep before operation.
+                  concurrent - set all plugs at once, delay_time staggers the SETs.
+           Returns: dict of plug -> True if verified off
 
         >>> x = NetBooter(host='192.168.60.124')
         >>> x.debug = True
         >>> x.plug_off([1])
         Plug 1 to Off
+        {1: True}
         
         """
         self.log.debug("Called plug_off()")
-        #
-        # For each plug in list
-        #
-        for plug in plug_id:
-            #
-            # Announce intent
-            #
-            self.log.info("Plug {} to Off".format(plug))
-            #
-            # Delay
-            #
-            time.sleep(delay_time)
-            #
-            # Append the plug id
-            #
-            # int(plug)    - convert string to int
-            # subtract 1   - User count from 1, array count from zero
-            # outlet_range[] - grab proper OID for identified netbooter
-            # str() - converts the resulting number to string
-            # join OID for outlet_action with OID for this plug
-            #
-            set_oid = self.outlet_action + "." + str(self.outlet_range[int(plug)-1])
-            get_oid = self.outlet_status + "." + str(self.outlet_range[int(plug) - 1])
-            #
-            #
-            # plug off state
-            #
-            my_state = 2
-            #
-            # Issue snmp set
-            #
-            self.set_snmp_data(set_oid, get_oid, my_state)
-
-        #
-        # return to main
-        #
-        return
+        return self._switch(plug_id, 2, "Off", delay_time, concurrent)
 
-    def plug_on(self, plug_id, delay_time=0):
+    def plug_on(self, plug_id, delay_time=0, concurrent=False):
         """Power on outlet range in list
 
            Takes: plug_id - list of the plugs
                   delay_time - time to sleep before operation.
-           Returns nothing.
+                  concurrent - set all plugs at once, delay_time staggers the SETs.
+           Returns: dict of plug -> True if verified on
         >>> x = NetBooter(host='192.168.60.124')
         >>> x.debug = True
         >>> x.plug_on([1])
         Plug 1 to On
+        {1: True}
+
+        """
+        return self._switch(plug_id, 1, "On", delay_time, concurrent)
 
+    def _switch(self, plug_id, state, name, delay_time, concurrent):
+        """Set each plug in plug_id to state, recording the outcome in self.outlet_cache
+        :return dict: plug -> True if the new state was verified
         """
+        if self.outlet_cache is None:
+            return self._switch_plugs(plug_id, state, name, delay_time, concurrent)
+        try:
+            results = self._switch_plugs(plug_id, state, name, delay_time, concurrent)
+        except Exception:
+            for plug in plug_id:
+                self.outlet_cache.invalidate(self.identity_key, plug)
+            raise
+        for plug, verified in results.items():
+            self.outlet_cache.put(self.identity_key, plug, plug_state(state) if verified else None)
+        return results
+
+    def _switch_plugs(self, plug_id, state, name, delay_time, concurrent):
+        """Set each plug in plug_id to state
+        :return dict: plug -> True if the new state was verified
+        """
+        if concurrent:
+            for plug in plug_id:
+                self.log.info("Plug %s to %s", plug, name)
+            return self.switch_plugs(plug_id, state, stagger=delay_time)
+
+        results = {}
         #
         # For each plug in list
         #
@@ -463,45 +1589,29 @@ class NetBooter(object):
             #
             # Announce intent
             #
-            self.log.info("Plug {} to On".format(plug))
+            self.log.info("Plug %s to %s", plug, name)
             #
             # Delay
             #
-            if delay_time == 0:
-                pass
-            else:
+            if delay_time:
                 time.sleep(delay_time)
             #
-            # Append the plug id
-            #
-            # int(plug)    - convert string to int
-            # subtract 1   - User count from 1, array count from zero
-            # outlet_range[] - grab proper OID for identified netbooter
-            # str() - converts the resulting number to string
-            # join OID for outlet_action with OID for this plug
+            # Compiled OIDs for this plug on the identified netbooter
             #
-            set_oid = self.outlet_action + "." + str(self.outlet_range[int(plug)-1])
-            get_oid = self.outlet_status + "." + str(self.outlet_range[int(plug)-1])
-            #
-            #
-            # plug on state
-            #
-            my_state = 1
+            set_oid, get_oid = self.outlet_oids(plug)
             #
             # Issue snmp set
             #
-            self.set_snmp_data(set_oid, get_oid, my_state)
-
-        #
-        # return to main
-        #
-        return
+            results[plug] = self.set_snmp_data(set_oid, get_oid, state)
+        return results
 
-    def all_on(self, delay_time=0):
+    def all_on(self, delay_time=0, concurrent=True):
         """Power on all outlets on switch
 
            Takes: delay_time - time to sleep before operation.
-           Returns nothing.
+                  concurrent - set all plugs at once, delay_time staggers the SETs,
+                      False sets and verifies one plug after another.
+           Returns: dict of plug -> True if verified on
 
         >>> x = NetBooter(host='192.168.60.124')
         >>> x.debug = True
@@ -522,6 +1632,7 @@ class NetBooter(object):
         Plug 14 to On
         Plug 15 to On
         Plug 16 to On
+        {1: True, 2: True, 3: True, 4: True, 5: True, 6: True, 7: True, 8: True, 9: True, 10: True, 11: True, 12: True, 13: True, 14: True, 15: True, 16: True}
         """
         #
         # We need all plugs on unit, starting from 1 to max
@@ -529,17 +1640,19 @@ class NetBooter(object):
         # len tells us how many elements
         # range(1, max+1) gives an appropriate array
         #
-        self.plug_on(
+        return self.plug_on(
             plug_id=list(range(1, len(self.outlet_range)+1)),
-            delay_time=delay_time
+            delay_time=delay_time,
+            concurrent=concurrent
         )
-        return
 
-    def all_off(self, delay_time=0):
+    def all_off(self, delay_time=0, concurrent=True):
         """Power off all outlets on switch
 
            Takes: delay_time - time to sleep before operation.
-           Returns nothing.
+                  concurrent - set all plugs at once, delay_time staggers the SETs,
+                      False sets and verifies one plug after another.
+           Returns: dict of plug -> True if verified off
         >>> x = NetBooter(host='192.168.60.124')
         >>> x.debug = True
         >>> x.all_off()
@@ -559,6 +1672,7 @@ class NetBooter(object):
         Plug 14 to Off
         Plug 15 to Off
         Plug 16 to Off
+        {1: True, 2: True, 3: True, 4: True, 5: True, 6: True, 7: True, 8: True, 9: True, 10: True, 11: True, 12: True, 13: True, 14: True, 15: True, 16: True}
         
         """
         #
@@ -567,14 +1681,19 @@ class NetBooter(object):
         # len tells us how many elements
         # range(1, max+1) gives an appropraite array
         #
-        self.plug_off(plug_id=list(range(1, len(self.outlet_range)+1)), delay_time=delay_time)
+        return self.plug_off(
+            plug_id=list(range(1, len(self.outlet_range)+1)),
+            delay_time=delay_time,
+            concurrent=concurrent
+        )
 
-    def run_sequence(self, plug_id, delay_time=0):
+    def run_sequence(self, plug_id, delay_time=0, concurrent=False):
         """Power off, then power on a list of outlets
 
            Takes: plug_id - list of plugs 0-15
                   delay_time - sleep before operation
-           Returns: nothing
+                  concurrent - switch all plugs off together, then all on together
+           Returns: dict of plug -> True if verified off and then on
 
         >>> x = NetBooter(host='192.168.60.124')
         >>> x.debug = True
@@ -587,12 +1706,114 @@ class NetBooter(object):
         Plug 6 to On
         Plug 8 to Off
         Plug 8 to On
+        {2: True, 4: True, 6: True, 8: True}
 
         """
+        if concurrent:
+            off = self.plug_off(plug_id=plug_id, delay_time=delay_time, concurrent=True)
+            time.sleep(delay_time)
+            on = self.plug_on(plug_id=plug_id, delay_time=delay_time, concurrent=True)
+            return dict((plug, off[plug] and on[plug]) for plug in plug_id)
+
+        results = {}
         for plug in plug_id:
-            self.plug_off(plug_id=[plug], delay_time=delay_time)
+            off = self.plug_off(plug_id=[plug], delay_time=delay_time)
             time.sleep(delay_time)
-            self.plug_on(plug_id=[plug], delay_time=delay_time)
+            on = self.plug_on(plug_id=[plug], delay_time=delay_time)
+            results[plug] = off[plug] and on[plug]
+        return results
+
+    @retried(max_attempts=4)
+    def walk_snmp_data(self, oids):
+        """Walk subtrees with GETBULK, or GETNEXT when SNMPv1 forces it
+        :param list oids: dot separated roots of the subtrees to walk
+        :return list: (oid tuple, value) for every object under the roots
+
+        Every GETBULK PDU carries all roots, so a table walk takes a handful
+        of packets rather than one GET per object.  Over SNMPv1 each root
+        is walked on its own: a v1 agent fails the whole GETNEXT with
+        noSuchName once any column passes the end of its MIB, which would
+        cut the other columns short.
+        """
+        self._event(logging.DEBUG, 'walk_request', oids=oids)
+        roots = [compile_oid(oid) for oid in oids]
+
+        if self.mp_model:
+            requests = [('bulkCmd', 0, self.max_var_binds) + tuple(roots)]
+        else:
+            requests = [('nextCmd', root) for root in roots]
+        rows = []
+        for request in requests:
+            try:
+                err_tuple = self._command(*request)
+            except Exception as e:
+                self.log.error("Got Exception:%s", e)
+                raise
+
+            error_indication, error_status, error_index, var_bind_table = err_tuple
+            self._check_response(error_indication, error_status, error_index, var_bind_table)
+            rows.extend(var_bind_table)
+
+        # Rows hold one column per root, keep only objects inside a root
+        end_values = walk_end_values()
+        objects = []
+        for row in rows:
+            for oid, value in row:
+                oid = tuple(oid)
+                # A column that ran out is padded with endOfMibView
+                if isinstance(value, end_values):
+                    continue
+                if any(oid[:len(root)] == root for root in roots):
+                    objects.append((oid, value))
+        return objects
+
+    def snapshot(self):
+        """Read every outlet state and sensor reading with table walks
+
+           Takes nothing
+           Returns: Snapshot of outlet states and current/temperature sensors
+
+        >>> x = NetBooter(host='192.168.60.124')
+        >>> x.snapshot().outlets[1]
+        1
+        """
+        roots = [self.profile.outlet_status_oid]
+        if self.profile.sensor_table_oid:
+            roots.append(self.profile.sensor_table_oid)
+        objects = self.walk_snmp_data(roots)
+
+        # Outlet index -> plug, numbered from 1
+        plugs = dict((outlet, plug) for plug, outlet in enumerate(self.outlet_range, 1))
+        status_oid = self.profile.outlet_status_oid
+        # Sensors are scalars (NP-16s) or the first row of a column (NP-16)
+        sensor_oids = []
+        if self.profile.sensor_table_oid:
+            table = self.profile.sensor_table_oid
+            sensor_oids = [
+                (name, oid) for name, oid in self.profile.status_oids.items()
+                if oid[:len(table)] == table
+            ]
+
+        outlets = dict.fromkeys(range(1, len(self.outlet_range)+1))
+        sensors = {}
+        for oid, value in objects:
+            if oid[:-1] == status_oid and oid[-1] in plugs:
+                outlets[plugs[oid[-1]]] = plug_state(int(value))
+                continue
+            for name, sensor_oid in sensor_oids:
+                if name not in sensors and oid[:len(sensor_oid)] == sensor_oid:
+                    sensors[name] = int(value)
+        if self.outlet_cache is not None:
+            for plug, state in outlets.items():
+                self.outlet_cache.put(self.identity_key, plug, state)
+
+        return Snapshot(
+            host=self.host,
+            model=self.profile.identity,
+            time=time.time(),
+            outlets=outlets,
+            sensors=sensors
+        )
 
     def get_status(self):
         """Get general system status
@@ -611,34 +1832,29 @@ class NetBooter(object):
 
 
         """
-        # Run the list
-        for name, oid in sorted(list(self.status.items()), key=lambda x: x[0]):
-            response = self.get_snmp_data(oid)
-            self.log.info("{}:{}".format(name, response))
+        # Read the whole list in one bulk request
+        names = sorted(self.status)
+        responses = self.get_snmp_data_bulk([self.status[name] for name in names])
+        for name, response in zip(names, responses):
+            self.log.info("%s:%s", name, response)
 
-    def current_draw(self, status=None):
+    def current_draw(self, status=None, keys=CURRENT_KEYS):
         """Get all current information
 
            Takes: status - a dictionary of OID's for general system"
-           Returns: nothing
+                  keys - names in status to read, e.g. add "temperatureReading"
+           Returns: dict of name -> int value
         """
         if status is None:
             status = self.status
 
-        # Define query list, of keys in the status dictionary
-        current = (
-            # "acCurrentSensorNumber" ,
-            "currentAlarmThreshold",
-            "currentDrawStatus1",
-            "currentDrawStatus2",
-            "currentDrawMax1",
-            "currentDrawMax2"
-        )
-
-        # Run the list
-        for i in current:
-            response = self.get_snmp_data(status[i])
-            self.log.info("{}: {}".format(i, response))
+        # Read the whole list in one bulk request
+        responses = self.get_snmp_data_bulk([status[i] for i in keys])
+        values = {}
+        for i, response in zip(keys, responses):
+            self.log.debug("%s: %s", i, response)
+            values[i] = int(response)
+        return values
 
     def port_status(self, plug_id=None):
         """Get state of each outlet
@@ -667,22 +1883,36 @@ class NetBooter(object):
         #
         status_array = []
         #
+        # Determine oid based on outlet_range[plug]
+        # Gives us the proper oid number for the model
+        #
+        # Fresh states from the outlet cache need no request
+        cached = {}
+        if self.outlet_cache is not None:
+            for plug in plug_id:
+                state = self.outlet_cache.get(self.identity_key, plug)
+                if state is not None:
+                    cached[plug] = state
+        missing = [plug for plug in plug_id if plug not in cached]
+        oids = [self.outlet_oids(plug)[1] for plug in missing]
+
+        ######################################################
+        # Work around to race condition in Netbooter Firmware
+        # with multiple requests
+        # and return the most popular answer
+        ######################################################
+        # Query every other plug in one bulk request
+        responses = dict(zip(missing, self.get_snmp_data_bulk(oids) if oids else []))
+        if self.outlet_cache is not None:
+            for plug in missing:
+                self.outlet_cache.put(self.identity_key, plug, plug_state(int(responses[plug])))
+        # A cached 1=on or 0=off reads like a response
+        responses.update(cached)
+        #
         # Go through the list of plugs
         #
         for plug in plug_id:
-            #
-            # Determine oid based on outlet_range[plug]
-            # Gives us the proper oid number for the model
-            #
-            oid = self.outlet_status + "." + str(self.outlet_range[int(plug)-1])
-
-            ######################################################
-            # Work around to race condition in Netbooter Firmware
-            # with multiple requests
-            # and return the most popular answer
-            ######################################################
-            # Query once
-            response = int(self.get_snmp_data(oid))
+            response = int(responses[plug])
 
             # Set status into english
             status = "UNK"
@@ -691,9 +1921,9 @@ class NetBooter(object):
             elif response in [0, 2, 256]:
                 status = "Off"
             else:
-                self.log.critical("Unhandled response:{}".format(response))
+                self.log.critical("Unhandled response:%s", response)
 
-            self.log.info("Plug {} is {}".format(plug, status))
+            self.log.info("Plug %s is %s", plug, status)
             #
             # Append to the returned array
             #
@@ -706,15 +1936,400 @@ class NetBooter(object):
         return status_array
 
 
+class AsyncNetBooter(object):
+    """asyncio counterpart of NetBooter
+
+    All SNMP methods are coroutines, so one event loop can drive many
+    netbooters at once.  Requests to one netbooter are bounded by
+    max_concurrency, which defaults to 1 because the netbooter firmware
+    races on simultaneous requests.
+    Messages are encoded with pysnmp.proto.api and sent on an asyncio
+    datagram endpoint, see SnmpDatagramProtocol.  Each request is resent
+    every timeout seconds, num_retries times, and gives up after deadline.
+    There is no RetryPolicy or circuit breaker here, unlike NetBooter:
+    a failed request raises RequestTimedOutError and the caller decides.
+    Call close() before the event loop ends.
+
+    >>> import asyncio
+    >>> async def main():
+    ...     nb = await AsyncNetBooter.create(host='192.168.60.124')
+    ...     try:
+    ...         return await nb.port_status([2, 4])
+    ...     finally:
+    ...         nb.close()
+    >>> asyncio.run(main())
+    Plug 2 is On
+    Plug 4 is On
+    [1, 1]
+    """
+
+    def __init__(self,
+        host,
+        logger=None,
+        port=161,
+        public="public",
+        private="public",
+        max_concurrency=1,
+        max_var_binds=16,
+        mp_model=0,
+        timeout=2,
+        num_retries=2,
+        deadline=30
+    ):
+
+        self.host = host
+        self.port = port
+        self.public = public
+        self.private = private
+        self.log = logger or get_log()
+        self.timeout = timeout  # seconds to wait for a response before resending
+        self.num_retries = num_retries  # resends of one request
+        self.deadline = deadline  # seconds before a request fails, resends included
+        self.set_attempts = 4  # number of times to try set then verify
+        self.verify = dict(VERIFY_DEFAULT)  # set confirmation tunables for model
+        self.max_concurrency = max_concurrency
+        self.max_var_binds = max_var_binds  # OIDs packed into one GET PDU
+        self.mp_model = mp_model  # 0=SNMPv1, 1=SNMPv2c
+        self._loop = None  # event loop the endpoint and semaphore belong to
+        self._semaphore = None
+        self._sock = None  # UDP socket of the endpoint, connected to the netbooter
+        self._transport = None
+        self._protocol = None  # SnmpDatagramProtocol
+        #
+        # Call identify_netbooter() to initialize these variables
+        #
+        self.profile = None
+        self.status = {}
+        self.power_outlet_num = None
+        self.outlet_action = ""
+        self.outlet_status = ""
+        self.outlet_range = []
+
+    @classmethod
+    async def create(cls, host, **kwargs):
+        """Return an identified AsyncNetBooter"""
+        nb = cls(host, **kwargs)
+        await nb.identify_netbooter()
+        return nb
+
+    async def _endpoint(self):
+        """Return the SnmpDatagramProtocol of the running loop, opening it on first use"""
+        loop = _lazy('asyncio').get_running_loop()
+        if self._loop is not loop:
+            # A new event loop, e.g. another asyncio.run(), needs its own endpoint
+            self.close()
+            family, _, _, _, address = (await loop.getaddrinfo(
+                self.host, self.port, type=socket.SOCK_DGRAM))[0]
+            self._sock = socket.socket(family, socket.SOCK_DGRAM)
+            self._sock.setblocking(False)
+            self._sock.connect(address)
+            self._transport, self._protocol = await loop.create_datagram_endpoint(
+                SnmpDatagramProtocol, sock=self._sock)
+            self._semaphore = _lazy('asyncio').Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._protocol
+
+    def close(self):
+        """Close the datagram endpoint, the next request opens a new one"""
+        if self._transport is not None and not self._loop.is_closed():
+            self._transport.close()
+        elif self._sock is not None:
+            # Its event loop is gone, and took the transport with it
+            self._sock.close()
+        self._loop = self._sock = self._transport = self._protocol = self._semaphore = None
+
+    async def _request(self, pdu_type, var_binds):
+        """Send one request, holding a concurrency slot for this netbooter
+        :param string pdu_type: 'GetRequestPDU' or 'SetRequestPDU'
+        :param list var_binds: (oid tuple, value) pairs
+        :return list: var_binds of the response
+        """
+        api = _lazy('snmp_api')
+        p_mod = api.protoModules[api.protoVersion2c if self.mp_model else api.protoVersion1]
+        pdu = getattr(p_mod, pdu_type)()
+        p_mod.apiPDU.setDefaults(pdu)
+        p_mod.apiPDU.setVarBinds(pdu, var_binds)
+        msg = p_mod.Message()
+        p_mod.apiMessage.setDefaults(msg)
+        p_mod.apiMessage.setCommunity(msg, self.public)
+        p_mod.apiMessage.setPDU(msg, pdu)
+        data = _lazy('ber_encoder').encode(msg)
+
+        protocol = await self._endpoint()
+        async with self._semaphore:
+            rsp_pdu = await protocol.request(
+                data, int(p_mod.apiPDU.getRequestID(pdu)),
+                self.timeout, self.num_retries, self.deadline
+            )
+
+        error_status = int(p_mod.apiPDU.getErrorStatus(rsp_pdu))
+        if error_status:
+            raise SnmpPduError("error_status:{},error_index:{}".format(
+                error_status, int(p_mod.apiPDU.getErrorIndex(rsp_pdu))))
+        var_binds = [(tuple(oid), value) for oid, value in p_mod.apiPDU.getVarBinds(rsp_pdu)]
+        self.log.debug(var_binds)
+        return var_binds
+
+    async def get_snmp_data_bulk(self, oids):
+        """Perform snmp get request for many OIDs at once
+        :param list oids: dot separated GET object identifiers
+        :return list: values of the oids, in the order requested
+        """
+        null = _lazy('rfc1902').Null('')
+        responses = []
+        for start in range(0, len(oids), self.max_var_binds):
+            var_binds = await self._request('GetRequestPDU', [
+                (compile_oid(oid), null) for oid in oids[start:start + self.max_var_binds]
+            ])
+            responses.extend(value for oid, value in var_binds)
+        return responses
+
+    async def get_snmp_data(self, oid):
+        """Perform snmp get request
+        :param string oid: dot separated GET object identifier
+        :return: value of the oid
+        """
+        responses = await self.get_snmp_data_bulk([oid])
+        return responses[0]
+
+    async def set_snmp_data(self, set_oid, get_oid, state):
+        """Perform snmp set request, then verify with a get
+        :param string set_oid: dot separated SET object identifier
+        :param string get_oid: dot separated GET object identifier
+        :state int state: value to be SET
+        :return bool: True on success, False if state not seen after set_attempts
+        """
+        for attempt in range(self.set_attempts):
+            await self._request(
+                'SetRequestPDU', [(compile_oid(set_oid), _lazy('rfc1902').Integer(state))])
+            # BAND AID: Netbooter misreports state immediately after a set
+            current_state = await self.confirm_state(get_oid, state)
+            if current_state in STATE_MAP[state]:
+                return True
+            self.log.debug("Set attempt %s of %s not verified, current_state:%s",
+                           attempt + 1, self.set_attempts, current_state)
+        return False
+
+    async def confirm_state(self, get_oid, state):
+        """Poll outlet state after a set until it is stable, see NetBooter.confirm_state
+        :return: last value read
+        """
+        loop = _lazy('asyncio').get_running_loop()
+        start = loop.time()
+        same_reads = 0
+        current_state = None
+        for delay in verify_delays(self.verify):
+            await _lazy('asyncio').sleep(settle_delay(delay, loop.time() - start, self.verify))
+            previous_state, current_state = current_state, await self.get_snmp_data(get_oid)
+            same_reads = stable_count(same_reads, previous_state, current_state)
+            if verify_done(same_reads, loop.time() - start, self.verify):
+                break
+        return current_state
+
+    async def identify_netbooter(self):
+        """Identify proper OID's for each netbooter model
+
+            Based on response for OID 1.3.6.1.2.1.1.1.0,
+            Return nothing.  Intiaizes class level variables
+        """
+        identity_string = await self.get_snmp_data('1.3.6.1.2.1.1.1.0')
+        self.log.debug("identity: %s", identity_string)
+        profile = PROFILES.get(str(identity_string))
+        if profile is None:
+            raise Exception("Can't identify netbooter!")
+        self.profile = profile
+        self.status = profile.status
+        self.power_outlet_num = int(await self.get_snmp_data(profile.status_oids["powerOutletNum"]))
+        self.outlet_action = profile.outlet_action
+        self.outlet_status = profile.outlet_status
+        self.outlet_range = list(range(
+            profile.starting_plug,
+            profile.starting_plug + self.power_outlet_num))
+        self.verify = dict(profile.verify)
+
+    def outlet_oids(self, plug):
+        """Return compiled (set_oid, get_oid) for a plug, see NetBooter.outlet_oids"""
+        return self.profile.outlet_oids(self.outlet_range[int(plug)-1])
+
+    async def _switch(self, plug_id, state, name, delay_time):
+        """Set each plug in plug_id to state, in order
+        :return dict: plug -> True if the new state was verified
+        """
+        results = {}
+        for plug in plug_id:
+            self.log.info("Plug %s to %s", plug, name)
+            if delay_time:
+                await _lazy('asyncio').sleep(delay_time)
+            set_oid, get_oid = self.outlet_oids(plug)
+            results[plug] = await self.set_snmp_data(set_oid, get_oid, state)
+        return results
+
+    async def plug_on(self, plug_id, delay_time=0):
+        """Power on outlet range in list
+
+           Takes: plug_id - list of the plugs
+                  delay_time - time to sleep before operation.
+           Returns: dict of plug -> True if verified on
+        """
+        return await self._switch(plug_id, 1, "On", delay_time)
+
+    async def plug_off(self, plug_id, delay_time=0):
+        """Power off outlet range in list
+
+           Takes: plug_id - list of the plugs
+                  delay_time - time to sleep before operation.
+           Returns: dict of plug -> True if verified off
+        """
+        return await self._switch(plug_id, 2, "Off", delay_time)
+
+    async def port_status(self, plug_id=None):
+        """Get state of each outlet
+
+           Takes: plug_id - list of plugs
+           Returns: array holding 0=off, 1=on, None=Unknown
+        """
+        if plug_id is None:
+            plug_id = list(range(1, len(self.outlet_range)+1))
+        responses = await self.get_snmp_data_bulk([
+            self.outlet_oids(plug)[1] for plug in plug_id
+        ])
+        status_array = []
+        for plug, response in zip(plug_id, responses):
+            state = plug_state(int(response))
+            if state is None:
+                self.log.critical("Unhandled response:%s", response)
+            self.log.info("Plug %s is %s", plug, {1: "On", 0: "Off"}.get(state, "UNK"))
+            status_array.append(state)
+        return status_array
+
+
+# Columns of the report written by the command line subcommands
+REPORT_FIELDS = ('host', 'plug', 'sensor', 'command', 'value', 'error')
+
+
+def parse_outlets(spec):
+    """Expand an outlet list, e.g. '1-4,8' -> [1, 2, 3, 4, 8]
+
+    >>> parse_outlets('1-3,8')
+    [1, 2, 3, 8]
+    """
+    outlets = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        outlets.extend(range(int(first), int(last or first) + 1))
+    return outlets
+
+
+def read_inventory(path):
+    """Read netbooters from a file, one 'address[:port] [outlets]' per line
+
+    Blank lines and text after # are ignored.
+    :return list: (host, list of outlets or None for all)
+    """
+    inventory = []
+    with open(path) as fh:
+        for line in fh:
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            outlets = parse_outlets(fields[1]) if len(fields) > 1 else None
+            inventory.append((fields[0], outlets))
+    return inventory
+
+
+def write_report(rows, path):
+    """Atomically write report rows, CSV for a *.csv path, else JSON"""
+    if path.endswith('.csv'):
+        import csv
+        import io
+        text = io.StringIO()
+        writer = csv.DictWriter(text, REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        atomic_write(path, text.getvalue(), prefix='.report')
+    else:
+        atomic_write(path, json.dumps(rows, indent=1, default=str), prefix='.report')
+
+
+def run_command(fleet, command, hosts, off_time=0):
+    """Run a subcommand over many netbooters at once
+
+       Takes: fleet - netbooter_fleet.FleetController
+              command - status, on, off, cycle or snapshot
+              hosts - list of (host, list of outlets or None for all)
+              off_time - seconds outlets stay off in a cycle
+       Returns: list of report rows, dicts with REPORT_FIELDS
+    """
+    import netbooter_fleet
+
+    rows = []
+    if command == 'snapshot':
+        unique = collections.OrderedDict.fromkeys(host for host, _ in hosts)
+        for host, snapshot in fleet.snapshot(unique).items():
+            if isinstance(snapshot, Exception):
+                rows.append(dict(host=host, plug=None, sensor=None, command=command,
+                                 value=None, error=str(snapshot)))
+                continue
+            for plug, state in sorted(snapshot.outlets.items()):
+                rows.append(dict(host=host, plug=plug, sensor=None, command=command,
+                                 value=state, error=None))
+            for sensor, value in sorted(snapshot.sensors.items()):
+                rows.append(dict(host=host, plug=None, sensor=sensor, command=command,
+                                 value=value, error=None))
+        return rows
+
+    # Hosts without an outlet list get every outlet, counted after identifying them in parallel
+    counts = fleet.map_pdus(
+        collections.OrderedDict.fromkeys(host for host, outlets in hosts if outlets is None),
+        lambda host, nb: len(nb.outlet_range),
+        'identify'
+    )
+    targets = []
+    for host, outlets in hosts:
+        if outlets is None:
+            count = counts[host]
+            outlets = [] if isinstance(count, Exception) else range(1, count + 1)
+        targets.extend(netbooter_fleet.Target(host, plug) for plug in outlets)
+
+    if command == 'status':
+        results = fleet.status(targets)
+    elif command == 'cycle':
+        results = fleet.cycle(targets, off_time=off_time)
+    else:
+        results = fleet.run_step(targets, command)
+    for target, value in results.items():
+        error = fleet.errors.get(target.host)
+        rows.append(dict(host=target.host, plug=target.plug, sensor=None, command=command,
+                         value=value, error=None if error is None else str(error)))
+    for host, count in counts.items():
+        if isinstance(count, Exception):
+            rows.append(dict(host=host, plug=None, sensor=None, command=command,
+                             value=None, error=str(count)))
+    return rows
+
+
 def main():
     """Program used to operate netbooter remote power switch.
-    
+
+    With a subcommand, every netbooter given by --address or --inventory
+    is worked at once and the results go to one report, e.g.
+      netbooter.py -a 192.168.60.124 -a 192.168.60.125 status -o 1-4
+      netbooter.py --inventory pdus.txt --report cycle.csv cycle --off-time 5
+    Without one, the switch test sequence runs on each address in turn.
     """
     parser = argparse.ArgumentParser()
     parser.add_argument(
         '--address', '-a',
-        required=True,
-        help='Destination IP of netbooter.'
+        action='append',
+        default=[],
+        help='Destination IP of netbooter, address:port allowed, repeat for many.'
+    )
+    parser.add_argument(
+        '--inventory', '-i',
+        help="File of netbooters, one 'address[:port] [outlets]' per line."
     )
     parser.add_argument(
         '--port', '-p',
@@ -724,12 +2339,12 @@ def main():
     )
     parser.add_argument(
         '--public',
-        default=['public'],
+        default='public',
         help='Destination snmp public community string.'
     )
     parser.add_argument(
         '--private',
-        default=['public'],
+        default='public',
         help='Destination snmp private community string.'
     )
     parser.add_argument(
@@ -752,19 +2367,121 @@ def main():
         '--test', '-t',
         action='store_true',
         help='Run doctest (verbose: -t -t).')
+    parser.add_argument(
+        '--identity-cache',
+        default=DEFAULT_IDENTITY_CACHE,
+        help='File caching the netbooter model between runs.'
+    )
+    parser.add_argument(
+        '--identity-ttl',
+        type=int,
+        default=3600,
+        help='Seconds a cached netbooter model stays valid.'
+    )
+    parser.add_argument(
+        '--no-identity-cache',
+        action='store_true',
+        help='Always identify the netbooter over SNMP.'
+    )
+    parser.add_argument(
+        '--log-json',
+        action='store_true',
+        help='Log request events as JSON objects.'
+    )
+    parser.add_argument(
+        '--metrics-file',
+        help='Write request metrics here when done, JSON for *.json, else Prometheus text.'
+    )
+    parser.add_argument(
+        '--report', '-r',
+        help='Write subcommand results here, CSV for *.csv, else JSON.'
+    )
+    parser.add_argument(
+        '--parallel',
+        type=int,
+        default=16,
+        help='Netbooters worked at once by a subcommand.'
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    for command, text in (
+        ('status', 'Read outlet states.'),
+        ('on', 'Power outlets on.'),
+        ('off', 'Power outlets off.'),
+        ('cycle', 'Power outlets off, then on.'),
+    ):
+        subparser = subparsers.add_parser(command, help=text)
+        subparser.add_argument(
+            '--outlets', '-o',
+            type=parse_outlets,
+            help='Outlets, e.g. 1-4,8, for addresses and inventory lines without (default: all).'
+        )
+        if command != 'status':
+            subparser.add_argument(
+                '--stagger',
+                type=float,
+                default=DEFAULT_STAGGER,
+                help='Seconds between outlets switched on one netbooter, 0 for all at once '
+                     '(default: %(default)s).'
+            )
+        if command == 'cycle':
+            subparser.add_argument(
+                '--off-time',
+                type=float,
+                default=0,
+                help='Seconds outlets stay off.'
+            )
+    subparsers.add_parser('snapshot', help='Walk outlet states and sensors.')
 
     args = parser.parse_args()
+    if not (args.address or args.inventory or args.test):
+        parser.error('give --address or --inventory')
 
     # Assign to local variables
-    address = args.address[0]
     port = args.port
-    public = args.public[0]
-    private = args.private[0]
+    public = args.public
+    private = args.private
     delay_time = args.delay
     debug = args.debug
     doctest = args.test
     conn_type = "snmp"
 
+    identity_cache = None
+    if not args.no_identity_cache:
+        identity_cache = IdentityCache(args.identity_cache, args.identity_ttl)
+    metrics = MetricsRegistry()
+
+    import netbooter_fleet
+
+    if args.command:
+        outlets = getattr(args, 'outlets', None)
+        hosts = [(address, outlets) for address in args.address]
+        if args.inventory:
+            hosts.extend(
+                (host, host_outlets or outlets)
+                for host, host_outlets in read_inventory(args.inventory)
+            )
+        fleet = netbooter_fleet.FleetController(
+            max_pdus=args.parallel,
+            stagger=getattr(args, 'stagger', 0),
+            port=port,
+            public=public,
+            private=private,
+            identity_cache=identity_cache,
+            request_hooks=[metrics],
+            structured_log=args.log_json
+        )
+        try:
+            rows = run_command(fleet, args.command, hosts, off_time=getattr(args, 'off_time', 0))
+        finally:
+            if args.metrics_file:
+                metrics.write(args.metrics_file)
+        for row in rows:
+            print("{host:<21} {plug!s:>4} {sensor!s:<20} {value!s:<6} {error!s}".format(**row))
+        if args.report:
+            write_report(rows, args.report)
+        failed = [row for row in rows if row['error'] or row['value'] is None or row['value'] is False]
+        return 1 if failed else 0
+
     print((
         "address:{:>20}\n"
         "port:{:>20}\n"
@@ -775,7 +2492,7 @@ def main():
         "doctest:{:>20}\n"
         "conn_type:{:>20}"
     ).format(
-        address,
+        ','.join(args.address),
         port,
         public,
         private,
@@ -790,12 +2507,26 @@ def main():
         import doctest
         doctest.testmod(verbose=debug)
     else:
-        nb = NetBooter(host=address)
-        nb.port_status()
-        nb.all_off()
-        nb.port_status()
-        nb.all_on()
-        nb.port_status()
+        try:
+            for address in args.address:
+                host, host_port = netbooter_fleet.split_host(address, port)
+                nb = NetBooter(
+                    host=host,
+                    port=host_port,
+                    public=public,
+                    private=private,
+                    identity_cache=identity_cache,
+                    request_hooks=[metrics],
+                    structured_log=args.log_json
+                )
+                nb.port_status()
+                nb.all_off()
+                nb.port_status()
+                nb.all_on()
+                nb.port_status()
+        finally:
+            if args.metrics_file:
+                metrics.write(args.metrics_file)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the netbooter module
+No netbooter is required.
+Local benchmarks measure overhead only, except session which times GETs
+against netbooter_sim.SimulatedNetBooter.  The operation suite runs
+NetBooter operations against netbooter_sim.SimulatedNetBooter and reports
+p50/p95/p99 latency and operations per second.
+
+Run all:    python netbooter_bench.py
+Run one:    python netbooter_bench.py --bench session
+Startup:    python netbooter_bench.py --bench import
+Simulated:  python netbooter_bench.py --sim --outlets 8 --outlets 16 \\
+                --concurrency 1 --concurrency 4 --loss 0 --loss 0.05 --json bench.json
+Realistic:  python netbooter_bench.py --sim --realistic -n 5 -o set_snmp_data -o all_on
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import netbooter
+import netbooter_sim
+import netbooter_telemetry
+
+__author__ = 'John Stile'
+
+
+def _get(session, oid):
+    """One GET through a (CommandGenerator, CommunityData, UdpTransportTarget) session"""
+    cmd_gen, auth_data, transport = session
+    error_indication, error_status, error_index, var_binds = cmd_gen.getCmd(auth_data, transport, oid)
+    if error_indication or error_status:
+        raise netbooter.SnmpEngineError("error:{} error_status:{}".format(error_indication, error_status))
+    return var_binds[0][1]
+
+
+def bench_session(iterations):
+    """Per-request cost of a GET with and without a reused SNMP session
+
+    Both cases read one outlet state from a netbooter_sim.SimulatedNetBooter.
+    before: a new engine, community and transport for every request
+    after:  NetBooter.snmp_session() built once and reused
+    A new engine waits out its dispatcher timer on the first request, so
+    before runs at most 20 GETs.
+    :param int iterations: number of GETs
+    :return dict: seconds per request for each case
+    """
+    cmdgen = netbooter.cmdgen
+    with netbooter_sim.SimulatedNetBooter(outlets=16, misreport_time=0) as sim:
+        nb = netbooter.NetBooter(
+            host=sim.host, port=sim.port, logger=logging.getLogger(__name__),
+            timeout=1, num_retries=2
+        )
+        oid = netbooter.compile_oid(nb.outlet_oids(1)[1])
+
+        runs = max(min(iterations, 20), 1)
+        start = time.perf_counter()
+        for _ in range(runs):
+            _get((
+                cmdgen.CommandGenerator(),
+                cmdgen.CommunityData('my-name', nb.public, nb.mp_model),
+                cmdgen.UdpTransportTarget((nb.host, nb.port), timeout=nb.timeout, retries=nb.num_retries)
+            ), oid)
+        before = (time.perf_counter() - start) / runs
+
+        # identify_netbooter() already built the session
+        session = nb.snmp_session()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            _get(session, oid)
+        after = (time.perf_counter() - start) / iterations
+
+    return {'before': before, 'after': after}
+
+
+def _legacy_set_logging(log, set_oid, get_oid, state, var_binds, current_state):
+    """Debug strings the old set_snmp_data built on every call, at any log level"""
+    var_bind = var_binds[0]
+    value = var_bind[1]
+    log.debug("Called set_snmp_data(set:{},get:{},val:{})".format(set_oid, get_oid, state))
+    log.debug("BEFORE: set_oid:{}, state:{}".format(set_oid, state))
+    log.debug("AFTER: set_oid:{}, state:{}".format(set_oid, state))
+    log.debug("set response:{}".format(value))
+    log.debug("get_oid:{}, current_state:{},time:{}".format(get_oid, current_state, time.time()))
+    log.debug((
+        "++++++++++++++++++++++++\n"
+        "var_binds:{}\n"
+        "var_bind:{}\n"
+        "value:{}\n"
+        "cur_value:{}\n"
+        "------------------------"
+    ).format(var_binds, var_bind, value, current_state))
+    log.debug("Value changed value:{}, current_state:{}".format(value, current_state))
+
+
+def bench_logging(iterations):
+    """Per-SET CPU of debug logging with the logger at INFO
+
+    before: set_snmp_data plus the eager .format() debug strings it used to build
+    after:  set_snmp_data with lazy, isEnabledFor guarded events
+    The SNMP exchange and confirmation are stubbed out, so only local work is timed.
+    :param int iterations: number of SETs
+    :return dict: seconds per SET for each case
+    """
+    log = logging.getLogger('netbooter_bench.logging')
+    log.addHandler(logging.NullHandler())
+    log.propagate = False
+    log.setLevel(logging.INFO)
+
+    nb = netbooter.NetBooter.__new__(netbooter.NetBooter)
+    nb.host = '127.0.0.1'
+    nb.port = 161
+    nb.log = log
+    nb.structured_log = False
+    nb.identity_cache = None
+    nb.request_hooks = []
+    nb.retry_policy = netbooter.RetryPolicy()
+    nb._command = lambda command, var_bind: (None, 0, 0, [var_bind])
+    nb.confirm_state = lambda get_oid, state: state
+    set_oid, get_oid = netbooter.PROFILES['Synaccess Remote PDU'].outlet_oids(0)
+    var_binds = [(set_oid, netbooter.rfc1902.Integer(1))]
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        nb.set_snmp_data(set_oid, get_oid, 1)
+        _legacy_set_logging(log, set_oid, get_oid, 1, var_binds, 1)
+    before = (time.perf_counter() - start) / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        nb.set_snmp_data(set_oid, get_oid, 1)
+    after = (time.perf_counter() - start) / iterations
+
+    return {'before': before, 'after': after}
+
+
+# Statement timed in a fresh interpreter, printing seconds taken
+_IMPORT_TIMER = (
+    "import time; start = time.perf_counter(); {}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def bench_import(iterations):
+    """Startup cost of importing netbooter, each run in a fresh interpreter
+
+    before: netbooter with pysnmp and asyncio loaded up front, as it used to import
+    after:  netbooter alone, pysnmp is imported by the first SNMP request
+    Runs at most 20 interpreters per case, each takes a while to start.
+    :param int iterations: number of imports
+    :return dict: seconds per import for each case
+    """
+    statements = {
+        'before': "import asyncio, netbooter; netbooter.cmdgen, netbooter.rfc1902, netbooter.rfc1905",
+        'after': "import netbooter",
+    }
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = {}
+    for case, statement in statements.items():
+        seconds = 0.0
+        runs = max(min(iterations, 20), 1)
+        for _ in range(runs):
+            output = subprocess.check_output(
+                [sys.executable, '-c', _IMPORT_TIMER.format(statement)],
+                cwd=here, stderr=subprocess.DEVNULL)
+            seconds += float(output)
+        result[case] = seconds / runs
+    return result
+
+
+BENCHMARKS = {
+    'import': bench_import,
+    'logging': bench_logging,
+    'session': bench_session,
+}
+
+# Operations timed against the simulator
+# Each takes (netbooter, plugs owned by the worker, iteration)
+# SETs alternate off/on, so every iteration really switches.
+OPERATIONS = collections.OrderedDict([
+    ('get_snmp_data', lambda nb, plugs, i: nb.get_snmp_data(nb.outlet_oids(plugs[0])[1])),
+    ('set_snmp_data', lambda nb, plugs, i: nb.set_snmp_data(*nb.outlet_oids(plugs[0]), state=2 - i % 2)),
+    ('port_status', lambda nb, plugs, i: nb.port_status(plugs)),
+    ('all_on', lambda nb, plugs, i: nb.all_on()),
+    ('all_off', lambda nb, plugs, i: nb.all_off()),
+    ('run_sequence', lambda nb, plugs, i: nb.run_sequence(plugs, concurrent=True)),
+])
+
+# The simulator switches instantly, so confirmation polls without sleeping
+# and the suite times the SNMP path rather than the settle tunables.
+# A realistic run keeps the model tunables and the simulator's default
+# misreport window, timing what a set costs against a real netbooter.
+BENCH_VERIFY = dict(min_settle=0, initial_delay=0, max_delay=0)
+
+
+def verified(result):
+    """False when an operation reported an unverified outlet"""
+    if isinstance(result, dict):
+        return all(result.values())
+    return result is not False
+
+
+def run_operation(sim, operation, iterations, concurrency, timeout=0.5, num_retries=10,
+                  verify=BENCH_VERIFY):
+    """Time one operation from concurrency threads, each with its own NetBooter
+
+    Outlets are dealt out between the threads, so single outlet operations
+    do not switch the same outlet from two threads.
+    verify overrides the model's confirmation tunables, {} keeps them.
+    :return dict: count, errors, ops_per_sec and latency statistics in seconds
+    """
+    log = logging.getLogger(__name__)
+    netbooters = []
+    for _ in range(concurrency):
+        nb = netbooter.NetBooter(
+            host=sim.host, port=sim.port, logger=log,
+            timeout=timeout, num_retries=num_retries
+        )
+        nb.verify = dict(nb.verify, **verify)
+        netbooters.append(nb)
+    outlets = list(range(1, len(sim.outlets) + 1))
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(number, nb):
+        plugs = outlets[number::concurrency] or outlets[number % len(outlets):][:1]
+        for i in range(iterations):
+            start = time.perf_counter()
+            try:
+                ok = verified(OPERATIONS[operation](nb, plugs, i))
+            except Exception as e:
+                log.debug("{} failed: {}".format(operation, e))
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors[0] += 1
+
+    threads = [
+        threading.Thread(target=worker, args=(number, nb))
+        for number, nb in enumerate(netbooters)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    ring = netbooter_telemetry.RingBuffer(len(latencies))
+    for latency in latencies:
+        ring.append(latency, 0)
+    result = ring.stats()
+    result.update(errors=errors[0], ops_per_sec=len(latencies) / wall if wall else None)
+    return result
+
+
+def bench_operations(iterations, operations=None, outlets=(16,), concurrency=(1,),
+                     loss=(0.0,), model='Synaccess Remote PDU', latency=0.0, realistic=False):
+    """Run each operation for every outlets x concurrency x loss combination
+
+    A fresh simulator is started per combination.  With realistic, the
+    simulator misreports for its default 2 seconds after a set and the
+    default verify tunables are kept, instead of BENCH_VERIFY.
+    :return list: one dict per run, parameters and results
+    """
+    sim_options = {} if realistic else {'misreport_time': 0}
+    verify = {} if realistic else BENCH_VERIFY
+    results = []
+    for outlet_count in outlets:
+        for loss_rate in loss:
+            for threads in concurrency:
+                sim = netbooter_sim.SimulatedNetBooter(
+                    model=model, outlets=outlet_count, latency=latency,
+                    loss=loss_rate, seed=0, **sim_options
+                )
+                with sim:
+                    for operation in operations or OPERATIONS:
+                        result = run_operation(sim, operation, iterations, threads, verify=verify)
+                        result.update(
+                            operation=operation, model=model, outlets=outlet_count,
+                            concurrency=threads, loss=loss_rate, latency=latency,
+                            iterations=iterations, realistic=realistic
+                        )
+                        results.append(result)
+    return results
+
+
+def print_operations(results):
+    """Print one line per operation run, latencies in milliseconds"""
+    print("{:<14} {:>7} {:>4} {:>5} {:>9} {:>9} {:>9} {:>9} {:>6}".format(
+        'operation', 'outlets', 'conc', 'loss', 'p50 ms', 'p95 ms', 'p99 ms', 'ops/s', 'errors'))
+    for result in results:
+        print("{operation:<14} {outlets:>7} {concurrency:>4} {loss:>5.2f} {p50:>9.2f} "
+              "{p95:>9.2f} {p99:>9.2f} {ops_per_sec:>9.1f} {errors:>6}".format(**dict(
+                  result,
+                  p50=result['p50'] * 1e3, p95=result['p95'] * 1e3, p99=result['p99'] * 1e3
+              )))
+
+
+def main():
+    """Run the selected benchmarks and print the results"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--bench', '-b',
+        choices=sorted(BENCHMARKS),
+        action='append',
+        help='Benchmark to run (default: all).'
+    )
+    parser.add_argument(
+        '--iterations', '-n',
+        type=int,
+        default=200,
+        help='Number of iterations per benchmark, per thread for --sim.'
+    )
+    parser.add_argument(
+        '--sim',
+        action='store_true',
+        help='Run the operation suite against a simulated netbooter.'
+    )
+    parser.add_argument(
+        '--operation', '-o',
+        choices=list(OPERATIONS),
+        action='append',
+        help='Operation to time with --sim (default: all).'
+    )
+    parser.add_argument('--outlets', type=int, action='append', help='Outlet count, repeat for many.')
+    parser.add_argument('--concurrency', '-c', type=int, action='append', help='Threads, repeat for many.')
+    parser.add_argument('--loss', type=float, action='append', help='Fraction of requests dropped, repeat for many.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated seconds per response.')
+    parser.add_argument(
+        '--realistic',
+        action='store_true',
+        help='Keep the default verify tunables and the 2 second misreport window.'
+    )
+    parser.add_argument(
+        '--model',
+        choices=sorted(netbooter.PROFILES),
+        default='Synaccess Remote PDU',
+        help='Simulated netbooter model.'
+    )
+    parser.add_argument('--json', '-j', help='Write results as JSON to this file.')
+    args = parser.parse_args()
+
+    report = {
+        'time': time.time(),
+        'python': platform.python_version(),
+        'benchmarks': [],
+        'operations': [],
+    }
+    if args.bench or not args.sim:
+        for name in args.bench or sorted(BENCHMARKS):
+            result = BENCHMARKS[name](args.iterations)
+            for case, seconds in sorted(result.items()):
+                print("{:<10} {:<10} {:>12.1f} us/request".format(name, case, seconds * 1e6))
+                report['benchmarks'].append({'name': name, 'case': case, 'seconds': seconds})
+    if args.sim:
+        report['operations'] = bench_operations(
+            args.iterations,
+            operations=args.operation,
+            outlets=args.outlets or [16],
+            concurrency=args.concurrency or [1],
+            loss=args.loss or [0.0],
+            model=args.model,
+            latency=args.latency,
+            realistic=args.realistic
+        )
+        print_operations(report['operations'])
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fleet wide power orchestration for many netbooter power switches
+Runs power plans, e.g. "cycle these 400 outlets across 30 PDUs".
+  - PDUs are worked in parallel, up to max_pdus at once
+  - each PDU takes at most per_pdu_limit request streams at once,
+    because the netbooter firmware races on simultaneous requests
+  - plan steps run in order, outlets on one PDU are switched together
+    with an optional stagger to limit inrush current
+
+>>> fleet = FleetController(stagger=0.5)
+>>> targets = [Target('192.168.60.124', 1), Target('192.168.60.125', 3)]
+>>> fleet.cycle(targets, off_time=5)
+{Target(host='192.168.60.124', plug=1): True, Target(host='192.168.60.125', plug=3): True}
+"""
+
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+
+import netbooter
+
+__author__ = 'John Stile'
+
+# One outlet on one netbooter, plug numbered from 1
+# host is an address, or address:port for a netbooter on another port
+Target = collections.namedtuple('Target', 'host plug')
+
+
+def split_host(host, default_port=161):
+    """Split 'address' or 'address:port' into (address, port)"""
+    address, colon, port = host.rpartition(':')
+    if not colon or not port.isdigit():
+        return host, default_port
+    return address, int(port)
+
+
+class FleetController(object):
+    """Run power plans over outlets on many netbooters
+
+    NetBooter objects are created on first use and kept, so each PDU is
+    identified once per controller.  Results map each Target to True when
+    its new state was verified; a PDU that raises marks all its targets
+    False and records the error in self.errors.
+    Every NetBooter shares retry_policy, so a dead PDU opens its circuit
+    once and later steps fail fast on it, see retry_policy.stats().
+    """
+
+    def __init__(self, max_pdus=16, per_pdu_limit=1, stagger=0, logger=None,
+                 netbooter_factory=None, retry_policy=None, **netbooter_kwargs):
+        self.max_pdus = max_pdus
+        self.per_pdu_limit = per_pdu_limit
+        self.stagger = stagger
+        self.log = logger or logging.getLogger(__name__)
+        self.retry_policy = retry_policy or netbooter.RetryPolicy()
+        self.netbooter_kwargs = netbooter_kwargs
+        self.netbooter_factory = netbooter_factory or self._make_netbooter
+        self.errors = {}  # host -> last error
+        self._netbooters = {}  # host -> NetBooter
+        self._pdu_slots = {}  # host -> Semaphore(per_pdu_limit)
+        self._lock = threading.Lock()
+
+    def _make_netbooter(self, host):
+        """Create the NetBooter of host, 'address' or 'address:port'"""
+        kwargs = dict(self.netbooter_kwargs)
+        address, kwargs['port'] = split_host(host, kwargs.get('port', 161))
+        kwargs.setdefault('logger', self.log)
+        kwargs.setdefault('retry_policy', self.retry_policy)
+        return netbooter.NetBooter(host=address, **kwargs)
+
+    def netbooter(self, host):
+        """Return the NetBooter for host, creating it on first use"""
+        with self._lock:
+            if host not in self._pdu_slots:
+                self._pdu_slots[host] = threading.Semaphore(self.per_pdu_limit)
+            slot = self._pdu_slots[host]
+        # Identification talks to the PDU, so it takes a slot too
+        with slot:
+            with self._lock:
+                nb = self._netbooters.get(host)
+            if nb is None:
+                nb = self.netbooter_factory(host)
+                with self._lock:
+                    self._netbooters[host] = nb
+        return nb
+
+    @staticmethod
+    def group(targets):
+        """Return OrderedDict of host -> list of plugs, keeping target order"""
+        groups = collections.OrderedDict()
+        for target in targets:
+            groups.setdefault(target.host, []).append(target.plug)
+        return groups
+
+    def map_pdus(self, hosts, func, name):
+        """Call func(host, NetBooter) for every host, PDUs in parallel
+
+           Takes: hosts - iterable of hosts
+                  func - callable taking a host and its NetBooter,
+                         run while holding a slot of that PDU
+                  name - what func does, for the log
+           Returns: dict of host -> result, or the exception raised
+        """
+        def run(host):
+            nb = self.netbooter(host)
+            with self._pdu_slots[host]:
+                return func(host, nb)
+
+        hosts = list(hosts)
+        results = {}
+        workers = max(min(self.max_pdus, len(hosts)), 1)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = dict((pool.submit(run, host), host) for host in hosts)
+            for future in concurrent.futures.as_completed(futures):
+                host = futures[future]
+                try:
+                    results[host] = future.result()
+                except Exception as e:
+                    self.log.error("%s %s failed: %s", host, name, e)
+                    self.errors[host] = e
+                    results[host] = e
+        return results
+
+    def run_step(self, targets, action):
+        """Switch every target on or off, PDUs in parallel
+
+           Takes: targets - list of Target
+                  action - 'on' or 'off'
+           Returns: dict of Target -> True if verified
+        """
+        if action not in ('on', 'off'):
+            raise ValueError("Unknown action:{}".format(action))
+        groups = self.group(targets)
+        outcomes = self.map_pdus(
+            groups,
+            lambda host, nb: (nb.plug_on if action == 'on' else nb.plug_off)(
+                groups[host], delay_time=self.stagger, concurrent=True),
+            action
+        )
+        results = {}
+        for host, verified in outcomes.items():
+            if isinstance(verified, Exception):
+                verified = {}
+            for plug in groups[host]:
+                results[Target(host, plug)] = bool(verified.get(plug))
+        # Report in the order given
+        return collections.OrderedDict((target, results[target]) for target in targets)
+
+    def status(self, targets):
+        """Read the state of every target, PDUs in parallel
+
+           Takes: targets - list of Target
+           Returns: dict of Target -> 1=on, 0=off, None=Unknown or failed
+        """
+        groups = self.group(targets)
+        outcomes = self.map_pdus(groups, lambda host, nb: nb.port_status(groups[host]), 'status')
+        results = {}
+        for host, states in outcomes.items():
+            if isinstance(states, Exception):
+                states = [None] * len(groups[host])
+            for plug, state in zip(groups[host], states):
+                results[Target(host, plug)] = state
+        return collections.OrderedDict((target, results[target]) for target in targets)
+
+    def snapshot(self, hosts):
+        """Walk outlets and sensors of every host, PDUs in parallel
+        :return dict: host -> netbooter.Snapshot, or the exception raised
+        """
+        return self.map_pdus(hosts, lambda host, nb: nb.snapshot(), 'snapshot')
+
+    def on(self, targets):
+        """Power on targets"""
+        return self.run_step(targets, 'on')
+
+    def off(self, targets):
+        """Power off targets"""
+        return self.run_step(targets, 'off')
+
+    def cycle(self, targets, off_time=0):
+        """Power off targets, wait off_time seconds, power them on
+        :return dict: Target -> True if verified off and then on
+        """
+        return self.run_plan([('off', targets), ('wait', off_time), ('on', targets)])
+
+    def run_plan(self, plan):
+        """Run plan steps in order
+
+           Takes: plan - list of (action, argument) where action is
+                         'on' or 'off' with a list of Target,
+                         or 'wait' with seconds
+           Returns: dict of Target -> True if every step on it verified
+        """
+        results = collections.OrderedDict()
+        for action, argument in plan:
+            if action == 'wait':
+                time.sleep(argument)
+                continue
+            self.log.info("Plan step {} on {} outlets".format(action, len(argument)))
+            for target, verified in self.run_step(argument, action).items():
+                results[target] = results.get(target, True) and verified
+        return results
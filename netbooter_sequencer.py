@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Inrush aware power sequencing for one netbooter
+plug_on(delay_time=...) waits the same delay before every outlet, so a rack
+takes N x delay to come up even when the circuit could take several loads
+at once.  The Sequencer is told what every outlet draws and what it needs
+powered first, plans the earliest start of each outlet that keeps the
+circuit under budget, and switches each wave of outlets together.
+
+Currents are in the units the netbooter reports currentDrawStatus in.
+  steady - draw once the load has booted
+  inrush - draw while it starts, for settle seconds after power on
+  after  - plugs that must be on and settled first, e.g. the switch
+           before the servers behind it
+
+>>> nb = netbooter.NetBooter(host='192.168.60.124')
+>>> loads = [Load(1, steady=10, inrush=40, settle=5),
+...          Load(2, steady=20, inrush=60, settle=10, after=[1]),
+...          Load(3, steady=20, inrush=60, settle=10, after=[1])]
+>>> sequencer = Sequencer(nb, loads, budget=160)
+>>> sequencer.schedule()
+[Wave(start=0, plugs=[1]), Wave(start=5, plugs=[2, 3])]
+>>> sequencer.run()
+OrderedDict([(1, True), (2, True), (3, True)])
+"""
+
+import argparse
+import collections
+import json
+import logging
+import sys
+import time
+
+import netbooter
+
+__author__ = 'John Stile'
+
+# Outlets switched on together, start seconds after the sequence begins
+Wave = collections.namedtuple('Wave', 'start plugs')
+
+
+class Load(collections.namedtuple('Load', 'plug steady inrush settle after bank')):
+    """What the equipment on one outlet draws, bank is 1 or 2 for currentDrawStatus1/2"""
+    __slots__ = ()
+
+    def __new__(cls, plug, steady, inrush=None, settle=1.0, after=(), bank=1):
+        # A load never draws less while starting than once started
+        inrush = steady if inrush is None else max(inrush, steady)
+        return super(Load, cls).__new__(cls, plug, steady, inrush, settle, tuple(after), bank)
+
+    def draw(self, elapsed):
+        """Draw elapsed seconds after power on"""
+        return self.inrush if elapsed < self.settle else self.steady
+
+
+def _priorities(loads):
+    """Return plug -> seconds from its power on until everything after it has settled
+
+    Outlets heading the longest dependency chains go first.
+    """
+    dependents = collections.defaultdict(list)
+    for load in loads.values():
+        for plug in load.after:
+            if plug not in loads:
+                raise ValueError("Plug {} depends on unknown plug {}".format(load.plug, plug))
+            dependents[plug].append(load.plug)
+
+    priorities = {}
+    visiting = set()
+
+    def chain(plug):
+        if plug in priorities:
+            return priorities[plug]
+        if plug in visiting:
+            raise ValueError("Dependency loop through plug {}".format(plug))
+        visiting.add(plug)
+        priorities[plug] = loads[plug].settle + max([chain(d) for d in dependents[plug]] or [0])
+        visiting.discard(plug)
+        return priorities[plug]
+
+    for plug in loads:
+        chain(plug)
+    return priorities
+
+
+def plan(loads, budget):
+    """Plan the earliest power on of every load keeping each bank under budget
+
+       Takes: loads - list of Load
+              budget - maximum draw, a number for every bank or dict of bank -> draw
+       Returns: list of Wave, in start order
+
+    Outlets are started greedily at time 0 and whenever a started load
+    settles, longest dependency chain first.  A load only draws less once
+    settled, so a wave fitting when it starts fits for good.
+    Raises ValueError for unknown or looping dependencies, and for a load
+    that does not fit even with everything else settled.
+    """
+    loads = collections.OrderedDict((load.plug, load) for load in loads)
+    priorities = _priorities(loads)
+    order = sorted(loads, key=lambda plug: -priorities[plug])
+    if not isinstance(budget, dict):
+        budget = dict((load.bank, budget) for load in loads.values())
+
+    started = {}  # plug -> start time
+    waves = []
+    now = 0
+    while len(started) < len(loads):
+        draw = collections.Counter()
+        for plug, start in started.items():
+            draw[loads[plug].bank] += loads[plug].draw(now - start)
+        wave = []
+        for plug in order:
+            load = loads[plug]
+            if plug in started:
+                continue
+            if any(dep not in started or dep in wave or now - started[dep] < loads[dep].settle
+                   for dep in load.after):
+                continue
+            if draw[load.bank] + load.inrush > budget[load.bank]:
+                continue
+            draw[load.bank] += load.inrush
+            started[plug] = now
+            wave.append(plug)
+        if wave:
+            waves.append(Wave(now, wave))
+        settling = [
+            start + loads[plug].settle for plug, start in started.items()
+            if start + loads[plug].settle > now
+        ]
+        if wave and any(loads[plug].settle <= 0 for plug in wave):
+            # Loads settling at once may release their dependents right away
+            continue
+        if len(started) < len(loads) and not settling:
+            pending = [plug for plug in order if plug not in started]
+            raise ValueError("Plugs {} do not fit the budget {}".format(pending, budget))
+        if settling:
+            now = min(settling)
+    return waves
+
+
+class Sequencer(object):
+    """Power on the loads of one netbooter by plan(), wave by wave
+
+    Each wave is switched with concurrent SETs.  Before a wave the bank
+    current is read back, and the wave waits, pushing later waves back
+    with it, until the measured draw leaves room for its inrush.  A wave
+    still without room after max_wait seconds ends the sequence.
+    Outlets whose dependencies were not verified on are skipped.
+    Results map each plug to True if verified on.
+    """
+
+    def __init__(self, nb, loads, budget, feedback=True, poll=0.5, max_wait=30, logger=None):
+        self.nb = nb
+        self.loads = collections.OrderedDict((load.plug, load) for load in loads)
+        self.budget = budget if isinstance(budget, dict) else dict(
+            (load.bank, budget) for load in loads)
+        self.feedback = feedback
+        self.poll = poll
+        self.max_wait = max_wait
+        self.log = logger or logging.getLogger(__name__)
+        self.timeline = []  # (seconds after start, plugs, measured draw) per wave switched
+
+    def schedule(self):
+        """Return the planned list of Wave"""
+        return plan(self.loads.values(), self.budget)
+
+    def measure(self):
+        """Read the current draw of every bank in the budget
+        :return dict: bank -> draw, or None when the netbooter cannot tell
+        """
+        keys = tuple('currentDrawStatus{}'.format(bank) for bank in sorted(self.budget))
+        try:
+            values = self.nb.current_draw(keys=keys)
+        except Exception as e:
+            self.log.warning("Reading current draw failed, following the plan: %s", e)
+            return None
+        return dict((bank, values[key]) for bank, key in zip(sorted(self.budget), keys))
+
+    def headroom(self, plugs):
+        """Wait until the measured draw leaves room for the inrush of plugs
+        :return tuple: (seconds waited, measured draw or None), seconds is None when out of time
+        """
+        need = collections.Counter()
+        for plug in plugs:
+            need[self.loads[plug].bank] += self.loads[plug].inrush
+        start = time.monotonic()
+        while True:
+            measured = self.measure()
+            if measured is None or all(
+                    measured[bank] + need[bank] <= self.budget[bank] for bank in need):
+                return time.monotonic() - start, measured
+            if time.monotonic() - start >= self.max_wait:
+                return None, measured
+            self.log.info("Waiting for headroom, draw %s, need %s", measured, dict(need))
+            time.sleep(self.poll)
+
+    def run(self):
+        """Power on every load, wave by wave
+        :return dict: plug -> True if verified on, in plug order given
+        """
+        results = dict.fromkeys(self.loads, False)
+        start = time.monotonic()
+        shift = 0
+        for wave in self.schedule():
+            delay = start + wave.start + shift - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            plugs = []
+            for plug in wave.plugs:
+                if all(results[dep] for dep in self.loads[plug].after):
+                    plugs.append(plug)
+                else:
+                    self.log.error("Skipping plug %s, a plug it needs is not on", plug)
+            if not plugs:
+                continue
+            measured = None
+            if self.feedback:
+                waited, measured = self.headroom(plugs)
+                if waited is None:
+                    self.log.error("No headroom for plugs %s, draw %s, stopping", plugs, measured)
+                    break
+                shift += waited
+            self.timeline.append((time.monotonic() - start, plugs, measured))
+            for plug, verified in self.nb.plug_on(plugs, concurrent=True).items():
+                results[plug] = bool(verified)
+        return collections.OrderedDict((plug, results[plug]) for plug in self.loads)
+
+
+def main():
+    """Power on a netbooter by a JSON load file
+
+    {"budget": 160, "loads": [{"plug": 1, "steady": 10, "inrush": 40, "settle": 5},
+                              {"plug": 2, "steady": 20, "after": [1]}]}
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('loads', help='JSON file with budget and loads.')
+    parser.add_argument('--address', '-a', help='Destination IP of netbooter.')
+    parser.add_argument('--port', '-p', type=int, default=161, help='SNMP port of netbooter.')
+    parser.add_argument('--no-feedback', action='store_true', help='Do not read current draw between waves.')
+    parser.add_argument('--dry-run', '-n', action='store_true', help='Print the schedule only.')
+    args = parser.parse_args()
+
+    with open(args.loads) as fh:
+        config = json.load(fh)
+    loads = [Load(**load) for load in config['loads']]
+    budget = config['budget']
+    if isinstance(budget, dict):
+        budget = dict((int(bank), draw) for bank, draw in budget.items())
+
+    for wave in plan(loads, budget):
+        print("{:>8.1f}s  plugs {}".format(wave.start, wave.plugs))
+    if args.dry_run:
+        return 0
+    if not args.address:
+        parser.error('--address is required unless --dry-run')
+
+    log = netbooter.get_log()
+    nb = netbooter.NetBooter(host=args.address, port=args.port, logger=log)
+    sequencer = Sequencer(nb, loads, budget, feedback=not args.no_feedback, logger=log)
+    results = sequencer.run()
+    for plug, verified in results.items():
+        print("plug {}: {}".format(plug, 'on' if verified else 'FAILED'))
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
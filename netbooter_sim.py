@@ -0,0 +1,411 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Simulated netbooter SNMP agent for benchmarks and tests
+Answers SNMPv1/v2c GET, GETNEXT, GETBULK and SET on a localhost UDP port,
+emulating both MIBs handled by netbooter.identify_netbooter():
+  "Power Distribution System"  (NP-16, NP-8)
+  "Synaccess Remote PDU"       (NP-16s)
+
+Faults that can be injected:
+  latency        - seconds before each response, replies are scheduled so
+                   concurrent requests overlap like they do on a real agent
+  loss           - fraction of requests silently dropped
+  misreport_time - seconds after a SET during which the outlet reports the
+                   requested state; plugs in dead_outlets then revert
+                   (the behaviour behind the BAND AID in NetBooter)
+
+switch_local() switches an outlet as the front panel would, and sends an
+SNMPv2c trap with the new outlet status to trap_target, if set.
+
+Run:  python netbooter_sim.py --model "Synaccess Remote PDU" --outlets 16 --port 1161
+Then: python netbooter.py -a 127.0.0.1 -p 1161
+
+>>> with SimulatedNetBooter(outlets=8) as sim:
+...     nb = netbooter.NetBooter('127.0.0.1', port=sim.port)
+...     nb.port_status([1])
+Plug 1 is On
+[1]
+"""
+
+import argparse
+import bisect
+import random
+import select
+import socket
+import threading
+import time
+
+from pyasn1.codec.ber import decoder, encoder
+from pysnmp.proto import api, rfc1902
+
+import netbooter
+
+__author__ = 'John Stile'
+
+# SNMPv2-MIB::sysDescr.0, used by identify_netbooter
+SYS_DESCR = (1, 3, 6, 1, 2, 1, 1, 1, 0)
+
+# Values reported for an outlet, per model
+OUTLET_VALUES = {
+    'Power Distribution System': {1: 1, 2: 0},
+    'Synaccess Remote PDU': {1: 1, 2: 2},
+}
+
+# Objects of the trap sent by switch_local()
+SYS_UPTIME = (1, 3, 6, 1, 2, 1, 1, 3, 0)
+SNMP_TRAP_OID = (1, 3, 6, 1, 6, 3, 1, 1, 4, 1, 0)
+OUTLET_TRAP = (1, 3, 6, 1, 4, 1, 21728, 0, 1)
+
+# Status names answered with a string, all others are integers
+STRING_STATUS = ('systemModel', 'systemName', 'swVersion', 'ifPhysAddress', 'ipAddress')
+
+
+class Outlet(object):
+    """State of one simulated outlet"""
+
+    def __init__(self, state=1):
+        self.state = state        # 1=on, 2=off
+        self.requested = None     # state of the last SET
+        self.set_time = 0         # time of the last SET
+        self.previous = state     # state before the last SET
+
+    def reported(self, now, misreport_time, dead):
+        """Return the state the netbooter reports at time now"""
+        if self.requested is not None:
+            if now - self.set_time < misreport_time:
+                return self.requested
+            # Switching finished, a dead outlet falls back to its old state
+            self.state = self.previous if dead else self.requested
+            self.requested = None
+        return self.state
+
+
+class SimulatedNetBooter(object):
+    """Localhost UDP SNMP agent emulating a netbooter
+
+    Use as a context manager, or call start() and stop().
+    port=0 picks a free port, read it back from self.port.
+    """
+
+    def __init__(self, model='Synaccess Remote PDU', outlets=16, host='127.0.0.1', port=0,
+                 community='public', latency=0.0, loss=0.0, misreport_time=2.0,
+                 dead_outlets=(), seed=None, trap_target=None):
+        self.profile = netbooter.PROFILES[model]
+        self.model = model
+        self.host = host
+        self.port = port
+        self.community = community
+        self.latency = latency
+        self._send_lock = threading.Lock()
+        self._timers = []
+        self.loss = loss
+        self.misreport_time = misreport_time
+        # Plugs count from 1, as in NetBooter, and are kept as outlet indexes
+        self.dead_outlets = set(plug - 1 + self.profile.starting_plug for plug in dead_outlets)
+        self.random = random.Random(seed)
+        self.trap_target = trap_target  # (host, port) of a trap listener, or None
+        self.start_time = time.time()
+        self.outlets = dict(
+            (index, Outlet()) for index in
+            range(self.profile.starting_plug, self.profile.starting_plug + outlets)
+        )
+        self.requests = 0  # requests received, including dropped ones
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._sock = None
+        self._thread = None
+        self._running = False
+        self._build_objects(outlets)
+
+    def _build_objects(self, outlets):
+        """Create the MIB: oid -> callable returning the current value"""
+        self.objects = {SYS_DESCR: lambda: rfc1902.OctetString(self.model)}
+        for name, oid in self.profile.status_oids.items():
+            if name == 'powerOutletNum':
+                value = rfc1902.Integer(outlets)
+            elif name in STRING_STATUS:
+                value = rfc1902.OctetString(name)
+            elif name.startswith('currentDrawStatus'):
+                self.objects[oid] = self._current_draw
+                continue
+            elif name == 'temperatureReading':
+                value = rfc1902.Integer(30)
+            else:
+                value = rfc1902.Integer(0)
+            self.objects[oid] = (lambda v: lambda: v)(value)
+        for index in self.outlets:
+            set_oid, get_oid = self.profile.outlet_oids(index)
+            self.objects[get_oid] = (lambda i: lambda: self._outlet_value(i))(index)
+            # 0=none, the action column reads back as no action
+            self.objects[set_oid] = lambda: rfc1902.Integer(0)
+        self.sorted_oids = sorted(self.objects)
+
+    def _outlet_value(self, index):
+        state = self.outlets[index].reported(
+            time.time(), self.misreport_time, index in self.dead_outlets)
+        return rfc1902.Integer(OUTLET_VALUES[self.model][state])
+
+    def _current_draw(self):
+        """One amp, in tenths, per outlet that is on"""
+        on = sum(1 for index in self.outlets if self._outlet_value(index) == OUTLET_VALUES[self.model][1])
+        return rfc1902.Integer(10 * on)
+
+    def set_outlet(self, index, state):
+        """Apply a SET of state to outlet index, True if the value is valid"""
+        if state == 3:
+            # reboot: off, then back on once switching is done
+            state = 1
+        if state not in (1, 2):
+            return False
+        outlet = self.outlets[index]
+        outlet.reported(time.time(), self.misreport_time, index in self.dead_outlets)
+        outlet.previous = outlet.state
+        outlet.requested = state
+        outlet.set_time = time.time()
+        return True
+
+    def switch_local(self, plug, state):
+        """Switch plug, counting from 1, to state 1=on or 2=off at the unit
+
+        The outlet switches at once and a trap announces it to trap_target.
+        """
+        index = plug - 1 + self.profile.starting_plug
+        with self._lock:
+            outlet = self.outlets[index]
+            outlet.state = state
+            outlet.requested = None
+            value = self._outlet_value(index)
+        if self.trap_target is not None:
+            self.send_trap([(self.profile.outlet_oids(index)[1], value)])
+
+    def send_trap(self, var_binds):
+        """Send an SNMPv2c trap carrying var_binds to trap_target"""
+        p_mod = api.protoModules[api.protoVersion2c]
+        pdu = p_mod.SNMPv2TrapPDU()
+        p_mod.apiTrapPDU.setDefaults(pdu)
+        p_mod.apiTrapPDU.setVarBinds(pdu, [
+            (SYS_UPTIME, rfc1902.TimeTicks(int((time.time() - self.start_time) * 100))),
+            (SNMP_TRAP_OID, rfc1902.ObjectName(OUTLET_TRAP)),
+        ] + list(var_binds))
+        msg = p_mod.Message()
+        p_mod.apiMessage.setDefaults(msg)
+        p_mod.apiMessage.setCommunity(msg, self.community)
+        p_mod.apiMessage.setPDU(msg, pdu)
+        sock = self._sock or socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.sendto(encoder.encode(msg), self.trap_target)
+        finally:
+            if sock is not self._sock:
+                sock.close()
+
+    def _next_oid(self, oid):
+        """Return the first oid after oid, or None at the end of the MIB"""
+        position = bisect.bisect_right(self.sorted_oids, oid)
+        if position < len(self.sorted_oids):
+            return self.sorted_oids[position]
+        return None
+
+    def handle(self, whole_msg):
+        """Decode one request and return the encoded response, or None"""
+        version = int(api.decodeMessageVersion(whole_msg))
+        p_mod = api.protoModules[version]
+        req_msg, _ = decoder.decode(whole_msg, asn1Spec=p_mod.Message())
+        if str(p_mod.apiMessage.getCommunity(req_msg)) != self.community:
+            return None
+        req_pdu = p_mod.apiMessage.getPDU(req_msg)
+        rsp_msg = p_mod.apiMessage.getResponse(req_msg)
+        rsp_pdu = p_mod.apiMessage.getPDU(rsp_msg)
+        var_binds = []
+        error_index = 0
+
+        with self._lock:
+            if req_pdu.isSameTypeWith(p_mod.GetRequestPDU()):
+                for position, (oid, _) in enumerate(p_mod.apiPDU.getVarBinds(req_pdu), 1):
+                    oid = tuple(oid)
+                    if oid in self.objects:
+                        var_binds.append((oid, self.objects[oid]()))
+                    elif version == api.protoVersion1:
+                        error_index = error_index or position
+                        var_binds.append((oid, rfc1902.Integer(0)))
+                    else:
+                        var_binds.append((oid, p_mod.NoSuchObject()))
+            elif req_pdu.isSameTypeWith(p_mod.GetNextRequestPDU()):
+                for position, (oid, _) in enumerate(p_mod.apiPDU.getVarBinds(req_pdu), 1):
+                    next_oid = self._next_oid(tuple(oid))
+                    if next_oid is not None:
+                        var_binds.append((next_oid, self.objects[next_oid]()))
+                    elif version == api.protoVersion1:
+                        error_index = error_index or position
+                        var_binds.append((tuple(oid), rfc1902.Integer(0)))
+                    else:
+                        var_binds.append((tuple(oid), p_mod.EndOfMibView()))
+            elif version != api.protoVersion1 and req_pdu.isSameTypeWith(p_mod.GetBulkRequestPDU()):
+                var_binds = self._get_bulk(p_mod, req_pdu)
+            elif req_pdu.isSameTypeWith(p_mod.SetRequestPDU()):
+                for position, (oid, value) in enumerate(p_mod.apiPDU.getVarBinds(req_pdu), 1):
+                    oid = tuple(oid)
+                    index = oid[-1]
+                    valid = (
+                        oid[:-1] == self.profile.outlet_action_oid
+                        and index in self.outlets
+                        and self.set_outlet(index, int(value))
+                    )
+                    if not valid:
+                        error_index = error_index or position
+                    var_binds.append((oid, value))
+            else:
+                return None
+
+        if error_index:
+            # noSuchName (v1), or notWritable/noSuchName for sets
+            p_mod.apiPDU.setErrorStatus(rsp_pdu, 2)
+            p_mod.apiPDU.setErrorIndex(rsp_pdu, error_index)
+        p_mod.apiPDU.setVarBinds(rsp_pdu, var_binds)
+        return encoder.encode(rsp_msg)
+
+    def _get_bulk(self, p_mod, req_pdu):
+        """Answer a GETBULK, non-repeaters first then repeated columns"""
+        non_repeaters = int(p_mod.apiBulkPDU.getNonRepeaters(req_pdu))
+        max_repetitions = int(p_mod.apiBulkPDU.getMaxRepetitions(req_pdu))
+        oids = [tuple(oid) for oid, _ in p_mod.apiBulkPDU.getVarBinds(req_pdu)]
+        var_binds = []
+        for oid in oids[:non_repeaters]:
+            next_oid = self._next_oid(oid)
+            var_binds.append((next_oid, self.objects[next_oid]()) if next_oid
+                             else (oid, p_mod.EndOfMibView()))
+        columns = oids[non_repeaters:]
+        for _ in range(max_repetitions):
+            if not columns:
+                break
+            next_columns = []
+            for oid in columns:
+                next_oid = self._next_oid(oid)
+                if next_oid is None:
+                    var_binds.append((oid, p_mod.EndOfMibView()))
+                    next_columns.append(oid)
+                else:
+                    var_binds.append((next_oid, self.objects[next_oid]()))
+                    next_columns.append(next_oid)
+            columns = next_columns
+        return var_binds
+
+    def serve(self):
+        """Answer requests until stop() is called"""
+        while self._running:
+            readable, _, _ = select.select([self._sock], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                whole_msg, address = self._sock.recvfrom(65535)
+            except OSError:
+                break
+            self.requests += 1
+            if self.loss and self.random.random() < self.loss:
+                self.dropped += 1
+                continue
+            try:
+                response = self.handle(whole_msg)
+            except Exception:
+                # Garbage in, nothing out, like a real agent
+                continue
+            if response is None:
+                continue
+            if self.latency:
+                timer = threading.Timer(self.latency, self._send, (response, address))
+                timer.daemon = True
+                with self._send_lock:
+                    self._timers = [t for t in self._timers if t.is_alive()]
+                    self._timers.append(timer)
+                timer.start()
+            else:
+                self._send(response, address)
+
+    def _send(self, response, address):
+        """Send one response unless the agent was stopped meanwhile"""
+        with self._send_lock:
+            if self._sock is not None:
+                self._sock.sendto(response, address)
+
+    def start(self):
+        """Bind the UDP port and answer requests in a background thread"""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((self.host, self.port))
+        self.port = self._sock.getsockname()[1]
+        self._running = True
+        self._thread = threading.Thread(target=self.serve, name="SimulatedNetBooter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop answering and release the port"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._send_lock:
+            for timer in self._timers:
+                timer.cancel()
+            self._timers = []
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """Run a simulated netbooter until interrupted"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--model', '-m',
+        choices=sorted(OUTLET_VALUES),
+        default='Synaccess Remote PDU',
+        help='sysDescr of the emulated netbooter.'
+    )
+    parser.add_argument('--outlets', '-o', type=int, default=16, help='Number of outlets.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', '-p', type=int, default=1161, help='UDP port to listen on.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before each response.')
+    parser.add_argument('--loss', type=float, default=0.0, help='Fraction of requests dropped.')
+    parser.add_argument(
+        '--misreport-time',
+        type=float,
+        default=2.0,
+        help='Seconds an outlet reports the requested state after a set.'
+    )
+    parser.add_argument(
+        '--dead',
+        type=int,
+        action='append',
+        default=[],
+        help='Plug, counting from 1, that never switches, repeat for many.'
+    )
+    args = parser.parse_args()
+
+    sim = SimulatedNetBooter(
+        model=args.model,
+        outlets=args.outlets,
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        loss=args.loss,
+        misreport_time=args.misreport_time,
+        dead_outlets=args.dead
+    )
+    with sim:
+        print("Simulating {} with {} outlets on {}:{}".format(
+            args.model, args.outlets, args.host, sim.port))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
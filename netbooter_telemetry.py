@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Continuous telemetry poller for netbooter power switches
+Samples current draw and temperature from many netbooters at a fixed cadence.
+Each (host:port, metric) series is kept in a fixed size ring buffer.
+min/max/avg/percentile are answered without rescanning the history.
+
+Run:  python netbooter_telemetry.py -a 192.168.60.124 -a 192.168.60.125 --interval 10
+"""
+
+import argparse
+import array
+import bisect
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+
+import netbooter
+
+__author__ = 'John Stile'
+
+# Metrics sampled by default, names in NetBooter.status
+DEFAULT_METRICS = (
+    "currentDrawStatus1",
+    "currentDrawStatus2",
+    "temperatureReading",
+)
+
+
+class RingBuffer(object):
+    """Fixed size, array backed time series of floats
+
+    The oldest sample is overwritten once capacity is reached.
+    Statistics are kept up to date on every append:
+      avg        - running sum
+      min/max    - monotonic queues of (sequence, value)
+      percentile - sorted copy of the window, updated by bisection
+    A lock keeps readers on other threads from seeing half an append.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._values = array.array('d', [0.0] * capacity)
+        self._times = array.array('d', [0.0] * capacity)
+        self._count = 0      # samples appended, ever
+        self._sum = 0.0
+        self._min = collections.deque()
+        self._max = collections.deque()
+        self._sorted = []
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, value, timestamp=None):
+        """Add a sample, evicting the oldest if full"""
+        with self._lock:
+            self._append(float(value), time.time() if timestamp is None else timestamp)
+
+    def _append(self, value, timestamp):
+        seq = self._count
+        index = seq % self.capacity
+        if seq >= self.capacity:
+            evicted = self._values[index]
+            self._sum -= evicted
+            del self._sorted[bisect.bisect_left(self._sorted, evicted)]
+        self._values[index] = value
+        self._times[index] = timestamp
+        self._count += 1
+        self._sum += value
+        bisect.insort(self._sorted, value)
+
+        # Samples older than the window fall off the front of the queues
+        oldest = self._count - self.capacity
+        for queue, worse in ((self._min, lambda v: v >= value), (self._max, lambda v: v <= value)):
+            while queue and worse(queue[-1][1]):
+                queue.pop()
+            queue.append((seq, value))
+            while queue[0][0] < oldest:
+                queue.popleft()
+
+    def samples(self):
+        """Return list of (timestamp, value), oldest first"""
+        with self._lock:
+            start = max(self._count - self.capacity, 0)
+            return [
+                (self._times[seq % self.capacity], self._values[seq % self.capacity])
+                for seq in range(start, self._count)
+            ]
+
+    def min(self):
+        with self._lock:
+            return self._min[0][1] if self._min else None
+
+    def max(self):
+        with self._lock:
+            return self._max[0][1] if self._max else None
+
+    def avg(self):
+        with self._lock:
+            return self._sum / len(self) if len(self) else None
+
+    def percentile(self, percent):
+        """Nearest rank percentile, percent from 0 to 100"""
+        with self._lock:
+            if not self._sorted:
+                return None
+            rank = int(round(percent / 100.0 * (len(self._sorted) - 1)))
+            return self._sorted[rank]
+
+    def stats(self):
+        """Return dict of count, min, max, avg, p50, p95, p99, all of one window"""
+        with self._lock:
+            return {
+                'count': len(self),
+                'min': self.min(),
+                'max': self.max(),
+                'avg': self.avg(),
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99),
+            }
+
+
+class TelemetryPoller(object):
+    """Sample many netbooters at a fixed cadence into ring buffers
+
+    Every interval, each netbooter is read with one current_draw() bulk
+    request, in parallel across netbooters.  A netbooter that fails is
+    logged and skipped for that interval.
+    """
+
+    def __init__(self, netbooters, interval=60, capacity=1440,
+                 metrics=DEFAULT_METRICS, logger=None, max_workers=16):
+        self.netbooters = list(netbooters)
+        self.interval = interval
+        self.capacity = capacity
+        self.metrics = metrics
+        self.log = logger or logging.getLogger(__name__)
+        self.max_workers = max_workers
+        self.series = {}  # (identity_key, metric) -> RingBuffer
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def buffer(self, host, metric):
+        """Return the ring buffer for host and metric, creating it if needed
+        host is the NetBooter.identity_key, host:port
+        """
+        with self._lock:
+            key = (host, metric)
+            if key not in self.series:
+                self.series[key] = RingBuffer(self.capacity)
+            return self.series[key]
+
+    def _sample_one(self, nb):
+        """Read one netbooter and record its metrics"""
+        keys = tuple(metric for metric in self.metrics if metric in nb.status)
+        values = nb.current_draw(keys=keys)
+        timestamp = time.time()
+        for metric, value in values.items():
+            self.buffer(nb.identity_key, metric).append(value, timestamp)
+
+    def sample_once(self):
+        """Sample every netbooter once, in parallel
+        :return int: number of netbooters that failed
+        """
+        failures = 0
+        workers = max(min(self.max_workers, len(self.netbooters)), 1)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = dict((pool.submit(self._sample_one, nb), nb) for nb in self.netbooters)
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failures += 1
+                    self.log.warning("Sample of %s failed: %s", futures[future].identity_key, e)
+        return failures
+
+    def run(self):
+        """Sample at a fixed cadence until stop() is called
+        The next sample is scheduled from the previous start, so slow
+        netbooters do not make the cadence drift.
+        """
+        next_time = time.monotonic()
+        while not self._stop.is_set():
+            self.sample_once()
+            next_time += self.interval
+            self._stop.wait(max(next_time - time.monotonic(), 0))
+
+    def start(self):
+        """Run the poller in a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="TelemetryPoller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self, host, metric):
+        """Return min/max/avg/percentiles of one series, host is host:port"""
+        return self.buffer(host, metric).stats()
+
+
+def main():
+    """Poll netbooters and print statistics after each interval"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--address', '-a',
+        action='append',
+        required=True,
+        help='Destination IP of netbooter, repeat for many.'
+    )
+    parser.add_argument(
+        '--interval', '-i',
+        type=float,
+        default=60,
+        help='Seconds between samples.'
+    )
+    parser.add_argument(
+        '--capacity', '-c',
+        type=int,
+        default=1440,
+        help='Samples kept per metric.'
+    )
+    args = parser.parse_args()
+
+    log = netbooter.get_log()
+    poller = TelemetryPoller(
+        [netbooter.NetBooter(host=address, logger=log) for address in args.address],
+        interval=args.interval,
+        capacity=args.capacity,
+        logger=log
+    )
+    poller.start()
+    try:
+        while True:
+            time.sleep(args.interval)
+            for (host, metric), ring in sorted(poller.series.items()):
+                print("{:<22} {:<20} {}".format(host, metric, ring.stats()))
+    except KeyboardInterrupt:
+        poller.stop()
+
+
+if __name__ == "__main__":
+    main()
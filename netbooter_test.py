@@ -4,22 +4,142 @@
 """
 Stress test for netbooter module
 Send simultaneous SNMP commands to netbooter to demonstrate when request fails
+
+Workers run as one process per plug (--mode process), or as threads of one
+process sharing a single identification of the netbooter (--mode thread),
+which starts in a fraction of the time and memory.
 """
 
 import multiprocessing
+import multiprocessing.connection
+import queue
+import sys
+import threading
 import time
 import logging
 import argparse
-from queue import Queue
-import retrying
 
 import message_queue
 import netbooter
+import status_board
 
 __author__ = 'John Stile'
 
 
-class Worker(multiprocessing.Process):
+def drain(q):
+    """Yield the messages waiting on multiprocessing queue q, without blocking"""
+    while True:
+        try:
+            yield message_queue.receive(q.get_nowait())
+        except queue.Empty:
+            return
+
+
+def queue_waitable(q):
+    """Return what multiprocessing.connection.wait() waits on for multiprocessing queue q
+
+    A multiprocessing.Queue has no public handle to wait on.  In CPython
+    its _reader is the receiving end of the pipe get() reads from, and it
+    is ready whenever a message is waiting.  Other queues, e.g. a Manager
+    queue, have none and are refused here instead of failing in wait().
+    """
+    reader = getattr(q, '_reader', None)
+    if reader is None:
+        raise TypeError("Cannot wait on a {}, use multiprocessing.Queue".format(type(q).__name__))
+    return reader
+
+
+def worker_log(netbooter_ipv4, plug_id, name=None):
+    """Return logger writing to the log file of one plug, the root logger when name is None"""
+    log_file_name = "{}-worker-plug{}.log".format(netbooter_ipv4, plug_id)
+    rh = logging.FileHandler(log_file_name)
+    fmt = logging.Formatter("%(asctime)s (%(levelname)-8s): %(message)s")
+    rh.setFormatter(fmt)
+    log = logging.getLogger(name)
+    log.setLevel('INFO')
+    log.addHandler(rh)
+    if name is not None:
+        log.propagate = False
+    log.info("Log Initialized")
+    return log
+
+
+class PlugTest(object):
+    """Stress test of one plug, run by process and thread workers
+    Needs plug_id, cycles, netbooter, log, sender and error_count.
+    sender is a message_queue.BatchSender to the Boss, so the log messages
+    of many transitions share one queue put.
+    Progress goes to record slot of status_board, when there is one.
+    """
+
+    def report(self, state, iteration=None):
+        """Show state and error count on the status board"""
+        if self.status_board is not None:
+            self.status_board.update(
+                self.slot, id=self.plug_id, state=state, iteration=iteration, error_count=self.error_count)
+
+    def test(self):
+        """Toggle plug on and off, and check state after each operaiton
+        If a change fails to take place, terminate test"""
+        self.log.info('Run Test')
+
+        try:
+            # This is how many times we toggle the plug
+            for iteration in range(1, self.cycles+1):
+                self.log.info(
+                    (
+                        "=====Plug: {:>2}, Iteration:{:>3}, Error Count:{:>3}===="
+                    ).format(
+                        self.plug_id,
+                        iteration,
+                        self.error_count
+                    )
+                )
+                self.log.info('Power off')
+                self.report('off', iteration)
+                self.sender.put(message_queue.LogMessage(self.plug_id, "INFO", "off"))
+                # Change state
+                try:
+                    self.netbooter.plug_off([self.plug_id])
+                    # Read current state
+                    status = self.netbooter.port_status([self.plug_id])
+                    # If plug not in expected state, count error
+                    if status != [0]:
+                        self.log.critical("PLUG {} NOT OFF.".format(self.plug_id))
+                        # send quit message
+                        self.error_count += 1
+
+                except (netbooter.RetryExhaustedError, netbooter.CircuitOpenError) as e:
+                    self.log.critical("FAILED. plug_off() exception:{}".format(str(e)))
+                    self.error_count += 1
+
+                self.log.info('Power on')
+                self.report('on', iteration)
+                self.sender.put(message_queue.LogMessage(self.plug_id, "INFO", "on"))
+                # Change state
+                try:
+                    self.netbooter.plug_on([self.plug_id])
+                    # If plug not in expected state, count error
+                    status = self.netbooter.port_status([self.plug_id])
+                    # If plug not in expected state, count error
+                    if status != [1]:
+                        self.log.critical("PLUG  {} NOT ON.".format(self.plug_id))
+                        # send quit message
+                        self.error_count += 1
+
+                except (netbooter.RetryExhaustedError, netbooter.CircuitOpenError) as e:
+                    self.log.critical("FAILED plug_on(). exception:{}".format(str(e)))
+                    self.error_count += 1
+
+            self.report('done')
+
+        except Exception as e:
+            self.log.exception("Exception occurred: {}".format(e))
+            self.report('failed')
+            raise
+
+
+class Worker(PlugTest, multiprocessing.Process):
     """
         Workers created for simultaneous SNMP requests 
     """
@@ -29,7 +149,12 @@ class Worker(multiprocessing.Process):
             plug_id,
             queue_from_boss,
             queue_to_boss,
-            cycles
+            cycles,
+            serialize=False,
+            port=161,
+            startup_timeout=15,
+            status_board=None,
+            slot=None
     ):
         super(Worker, self).__init__()
         self.netbooter_ipv4 = netbooter_ipv4
@@ -37,6 +162,11 @@ class Worker(multiprocessing.Process):
         self.queue_from_boss = queue_from_boss
         self.queue_to_boss = queue_to_boss
         self.cycles = cycles
+        self.serialize = serialize
+        self.port = port
+        self.status_board = status_board
+        self.slot = slot
+        self.startup_timeout = startup_timeout
         self.begin_test = False
         #
         # non-pickle-able objects to be initialized in run()
@@ -44,6 +174,7 @@ class Worker(multiprocessing.Process):
         #
         self.netbooter = None
         self.log = None
+        self.sender = None
         # Result counter
         self.error_count = 0
 
@@ -54,29 +185,29 @@ class Worker(multiprocessing.Process):
         #
         # Setup log
         #
-        log_file_name = "{}-worker-plug{}.log".format(self.netbooter_ipv4, self.plug_id)
-        rh = logging.FileHandler(log_file_name)
-        fmt = logging.Formatter("%(asctime)s (%(levelname)-8s): %(message)s")
-        rh.setFormatter(fmt)
-        self.log = logging.getLogger()
-        self.log.setLevel('INFO')
-        self.log.addHandler(rh)
-        self.log.info("Log Initialized")
+        self.log = worker_log(self.netbooter_ipv4, self.plug_id)
+        self.sender = message_queue.BatchSender(self.queue_to_boss)
         #
         # Setup Netbooter snmp object
         #
         self.log.info('Creating instance of Netbooter')
-        self.netbooter = netbooter.NetBooter(host=self.netbooter_ipv4, logger=self.log)
+        self.netbooter = netbooter.NetBooter(
+            host=self.netbooter_ipv4,
+            port=self.port,
+            logger=self.log,
+            serialize=self.serialize
+        )
         #
         # Empty Multiprocessing queue
         #
-        while not self.queue_from_boss.empty():
-            self.log.info('Inside clear() loop -- getting items from queue')
-            self.queue_from_boss.get()
+        for msg in drain(self.queue_from_boss):
+            self.log.info('Discarding stale message {}'.format(type(msg).__name__))
         #
         # Tell boss Worker is ready
         #
-        self.queue_to_boss.put(message_queue.StatusMessage(self.plug_id, {'ready': True}))
+        self.report('ready')
+        self.sender.put(message_queue.StatusMessage(self.plug_id, {'ready': True}))
+        self.sender.flush()
         #
         # Poll messages from Boss to start test
         #
@@ -86,31 +217,39 @@ class Worker(multiprocessing.Process):
         #
         self.log.info("Send Quit to Boss")
 
-        self.queue_to_boss.put(message_queue.QuitMessage(self.plug_id, self.error_count))
+        self.sender.put(message_queue.QuitMessage(self.plug_id, self.error_count))
+        self.sender.close()
 
     def process_queue(self):
-        """Poll the message queue for BeginTest message from Boss
+        """Block on the message queue until the BeginTest message from Boss
         When message is received, self.begin_test is set to True,
-        and the test is run."""
-
-        continue_test = True
-        while continue_test:
-            # Listen for messages from Boss
-            if not self.queue_from_boss.empty():
-                try:
-                    self.log.debug("reading queue")
-                    msg = self.queue_from_boss.get(timeout=0.001)
-                    msg.handle(self)
-                except Queue.Empty:
-                    "Queue unexpectedly empty"
-
-            # Boss sends status message, which toggles this to true
+        and the test is run.
+        Gives up if the Boss process ends first, or after startup_timeout."""
+
+        boss = multiprocessing.parent_process()
+        waitables = [queue_waitable(self.queue_from_boss)]
+        if boss is not None:
+            waitables.append(boss.sentinel)
+
+        # Boss sends status message, which toggles this to true
+        deadline = time.time() + self.startup_timeout
+        while not self.begin_test:
+            ready = multiprocessing.connection.wait(waitables, max(deadline - time.time(), 0))
+            for msg in drain(self.queue_from_boss):
+                self.log.debug("Got {}".format(type(msg).__name__))
+                msg.handle(self)
             if self.begin_test:
-                self.test()
-                continue_test = False
-                continue
-
-        self.log.info("Exit while loop.")
+                break
+            if boss is not None and boss.sentinel in ready:
+                self.log.error("Boss ended before the test began")
+                return
+            if time.time() >= deadline:
+                self.log.error("No BeginTest from Boss within {}s".format(self.startup_timeout))
+                self.error_count += 1
+                return
+
+        self.test()
+        self.log.info("Exit message loop.")
 
     def on_status(self, plug_id, data):
         """Boss will send a BeginTest message once all Workers are ready"""
@@ -118,62 +257,71 @@ class Worker(multiprocessing.Process):
         if data['BeginTest']:
             self.begin_test = True
 
-    def test(self):
-        """Toggle plug on and off, and check state after each operaiton
-        If a change fails to take place, terminate test"""
-        self.log.info('Run Test')
 
-        try:
-            # This is how many times we toggle the plug
-            for iteration in range(1, self.cycles+1):
-                self.log.info(
-                    (
-                        "=====Plug: {:>2}, Iteration:{:>3}, Error Count:{:>3}===="
-                    ).format(
-                        self.plug_id,
-                        iteration,
-                        self.error_count
-                    )
-                )
-                self.log.info('Power off')
-                self.queue_to_boss.put(message_queue.LogMessage(self.plug_id, "INFO", "off"))
-                # Change state
-                try:
-                    self.netbooter.plug_off([self.plug_id])
-                    # Read current state
-                    status = self.netbooter.port_status([self.plug_id])
-                    # If plug not in expected state, count error
-                    if status != [0]:
-                        self.log.critical("PLUG {} NOT OFF.".format(self.plug_id))
-                        # send quit message
-                        self.error_count += 1
-
-                except retrying.RetryError as e:
-                    self.log.critical("FAILED. plug_off() exception:{}".format(str(e)))
-                    self.error_count += 1
-
-                self.log.info('Power on')
-                self.queue_to_boss.put(message_queue.LogMessage(self.plug_id, "INFO", "on"))
-                # Change state
-                try:
-                    self.netbooter.plug_on([self.plug_id])
-                    # If plug not in expected state, count error
-                    status = self.netbooter.port_status([self.plug_id])
-                    # If plug not in expected state, count error
-                    if status != [1]:
-                        self.log.critical("PLUG  {} NOT ON.".format(self.plug_id))
-                        # send quit message
-                        self.error_count += 1
-
-                except retrying.RetryError as e:
-                    self.log.critical("FAILED plug_on(). exception:{}".format(str(e)))
-                    self.error_count += 1
-
-            self.queue_to_boss.put(message_queue.QuitMessage(self.plug_id, self.error_count))
+class ThreadWorker(PlugTest, threading.Thread):
+    """
+        Worker thread of the thread mode, all workers share one process
+        and one identification of the netbooter
+    """
+    def __init__(
+            self,
+            netbooter_ipv4,
+            plug_id,
+            queue_to_boss,
+            cycles,
+            barrier,
+            identity_cache,
+            serialize=False,
+            port=161,
+            startup_timeout=15,
+            status_board=None,
+            slot=None
+    ):
+        super(ThreadWorker, self).__init__(name="plug{}".format(plug_id), daemon=True)
+        self.netbooter_ipv4 = netbooter_ipv4
+        self.plug_id = plug_id
+        self.queue_to_boss = queue_to_boss
+        self.cycles = cycles
+        self.barrier = barrier
+        self.identity_cache = identity_cache
+        self.serialize = serialize
+        self.port = port
+        self.status_board = status_board
+        self.slot = slot
+        self.startup_timeout = startup_timeout
+        self.netbooter = None
+        self.log = None
+        self.sender = None
+        # Result counter
+        self.error_count = 0
 
+    def run(self):
+        """Create a NetBooter from the shared identity,
+        wait for every worker, run the test and message Boss the result"""
+        self.sender = message_queue.BatchSender(self.queue_to_boss)
+        try:
+            self.log = worker_log(self.netbooter_ipv4, self.plug_id, name="{}.plug{}".format(__name__, self.plug_id))
+            self.netbooter = netbooter.NetBooter(
+                host=self.netbooter_ipv4,
+                port=self.port,
+                logger=self.log,
+                serialize=self.serialize,
+                identity_cache=self.identity_cache
+            )
+            self.report('ready')
+            # Start together, like the BeginTest message of process mode
+            self.barrier.wait(self.startup_timeout)
+            self.test()
         except Exception as e:
-            self.log.exception("Exception occurred: {}".format(e))
-            raise
+            # Do not leave the other workers waiting for this one
+            self.barrier.abort()
+            if self.log is not None:
+                self.log.exception("Worker failed: {}".format(e))
+            self.error_count += 1
+            self.report('failed')
+        finally:
+            self.sender.put(message_queue.QuitMessage(self.plug_id, self.error_count))
+            self.sender.close()
 
 
 class Boss(object):
@@ -182,10 +330,16 @@ class Boss(object):
         Boss monitors the message queue for ready and quit
         Once all the workers are ready, boss has them all start testing
         If any quit message has an error exit_status, boss stops all workers
-        Once all workers have quit, boss terminates workers."""
+        Once all workers have quit, boss terminates workers.
+        mode 'thread' runs the workers as threads of this process instead."""
 
-    def __init__(self, netbooter_ipv4):
+    def __init__(self, netbooter_ipv4, serialize=False, port=161, mode='process'):
         self.netbooter_ipv4 = netbooter_ipv4
+        self.port = port
+        # Workers take turns talking to the netbooter instead of racing
+        self.serialize = serialize
+        # 'process' or 'thread'
+        self.mode = mode
 
         # set up multiprocessing logger
         multiprocessing.log_to_stderr()
@@ -215,20 +369,60 @@ class Boss(object):
         self.worker_results = {}
         self.exit_code = 0
 
-        # startup timeout
-        self.startup_timeout=15
+        # seconds for all workers to report ready, and for the test to finish
+        self.startup_timeout = 15
+        self.test_timeout = 3600
+
+        # Workers write progress to a shared memory board, dumped to
+        # status_file every status_interval seconds
+        self.status_board = None
+        self.status_file = '{}-status.json'.format(self.netbooter_ipv4)
+        self.status_interval = 1.0
+        self._next_dump = 0
 
     def main(self):
+        self.status_board = status_board.StatusBoard(len(self.plug_ids))
+        try:
+            if self.mode == 'thread':
+                self.run_threads()
+            else:
+                self.run_processes()
+        finally:
+            self.dump_status(force=True)
+            self.status_board.close()
+            self.status_board = None
+
+        #
+        # Print the result for each worker
+        #
+        self.log.info("Results for {} cycles".format(self.number_of_switch_cycles))
+        for (plug, error_count) in self.worker_results.items():
+            if error_count == 0:
+                this_log = self.log.info
+            else:
+                this_log = self.log.critical
+            this_log("\tplug:{:>2}, error_count:{:>3}".format(plug, error_count))
+        return self.exit_code
+
+    def run_processes(self):
+        """Run one Worker process per plug"""
+        # Import pysnmp once here, forked workers inherit it
+        netbooter.cmdgen
 
         # Create workers, and start
-        for plug_id in self.plug_ids:
+        for slot, plug_id in enumerate(self.plug_ids):
             # Each worker controls one plug
             w = Worker(
                 self.netbooter_ipv4,
                 plug_id,
                 queue_to_boss=self.queue,
                 queue_from_boss=multiprocessing.Queue(),
-                cycles=self.number_of_switch_cycles
+                cycles=self.number_of_switch_cycles,
+                serialize=self.serialize,
+                port=self.port,
+                startup_timeout=self.startup_timeout,
+                status_board=self.status_board,
+                slot=slot
             )
 
             # Add worker to our list of workers
@@ -237,65 +431,108 @@ class Boss(object):
             # start Worker object run()
             w.start()
 
-        # process messages from Works
+        # process messages from Works until all have ended
         self.process_queue()
 
-        #
-        # Block until workers report quit
-        #
-        while len(self.workers):
-            time.sleep(2)
-
-        # # clean up processes and kill any remaining AVBWorkers
-        # self.clean_up()
-
-        #
-        # Print the result for each worker
-        #
-        self.log.info("Results for {} cycles".format(self.number_of_switch_cycles))
-        for (plug, error_count) in self.worker_results.items():
-            if error_count == 0:
-                this_log = self.log.info
-            else:
-                this_log = self.log.critical
-            this_log("\tplug:{:>2}, error_count:{:>3}".format(plug, error_count))
+    def run_threads(self):
+        """Run one ThreadWorker per plug, identifying the netbooter once"""
+        identity_cache = netbooter.MemoryIdentityCache()
+        netbooter.NetBooter(
+            host=self.netbooter_ipv4,
+            port=self.port,
+            logger=self.log,
+            identity_cache=identity_cache
+        )
+        reports = queue.Queue()
+        barrier = threading.Barrier(len(self.plug_ids))
+        threads = [
+            ThreadWorker(
+                self.netbooter_ipv4,
+                plug_id,
+                queue_to_boss=reports,
+                cycles=self.number_of_switch_cycles,
+                barrier=barrier,
+                identity_cache=identity_cache,
+                serialize=self.serialize,
+                port=self.port,
+                startup_timeout=self.startup_timeout,
+                status_board=self.status_board,
+                slot=slot
+            )
+            for slot, plug_id in enumerate(self.plug_ids)
+        ]
+        for thread in threads:
+            thread.start()
+
+        # Block on messages until every worker has quit
+        deadline = time.time() + self.startup_timeout + self.test_timeout
+        while self.quit_counter < len(threads):
+            try:
+                message_queue.receive(reports.get(timeout=self.wait_time(deadline))).handle(self)
+            except queue.Empty:
+                if time.time() >= deadline:
+                    self.log.error("[!!] Exceeded test_timeout. Abandon running workers")
+                    self.exit_code = 1
+                    break
+            self.dump_status()
+        self.log.info("All Workers quit, end program")
 
     def process_queue(self):
+        """Dispatch worker messages until every worker has ended
 
-        # loop until we read a 'quit' for worker, or an error
-        # When all workers are ready, start the tests
-        # If workers are not ready after at time, kill them and quit
-        start_time = time.time()
-        continue_test = True
-        while continue_test:
-            # Catch timeout
-            if (time.time() - start_time) > self.startup_timeout:
-                self.log.error( "[!!] Exceeded startup_timeout. End all worker" )
-                for worker in self.workers:
-                    self.clean_up(worker)
+        Blocks on the queue and the worker process sentinels together, so
+        a message is handled as soon as it arrives and a worker that dies
+        without a quit message is noticed at once.
+        When all workers are ready, start the tests.
+        If workers are not ready, or not done, in time, end them and quit.
+        """
+        deadline = time.time() + self.startup_timeout
+        started = False
+        while self.workers:
+            waitables = [queue_waitable(self.queue)] + [worker.sentinel for worker in self.workers]
+            ready = multiprocessing.connection.wait(waitables, self.wait_time(deadline))
+
+            for msg in drain(self.queue):
+                msg.handle(self)
+            self.dump_status()
 
             # When the number of ready messages == workers, start test
-            if self.ready_counter == len(self.workers):
+            if not started and self.workers and self.ready_counter >= len(self.workers):
                 self.log.info("All Workers ready, start test")
-
                 # Send the message to start testing
                 for worker in self.workers:
-                    worker.queue_from_boss.put(message_queue.QuitMessage('BOSS', {'BeginTest': True}))
-                self.ready_counter = False
+                    message_queue.send(worker.queue_from_boss, message_queue.StatusMessage('BOSS', {'BeginTest': True}))
+                started = True
+                deadline = time.time() + self.test_timeout
+
+            # Workers that ended without a quit message
+            for worker in [w for w in self.workers if w.sentinel in ready]:
+                self.clean_up(worker)
+                self.log.error("plug:{} ended without quit, exitcode:{}".format(worker.plug_id, worker.exitcode))
+                self.worker_results.setdefault(worker.plug_id, 'exitcode {}'.format(worker.exitcode))
+                self.exit_code = 1
+
+            if self.workers and time.time() >= deadline:
+                self.log.error("[!!] Exceeded {}. End all worker".format(
+                    'test_timeout' if started else 'startup_timeout'))
+                self.exit_code = 1
+                for worker in list(self.workers):
+                    self.clean_up(worker)
 
-            if self.quit_counter == len(self.workers):
-                self.log.info("All Workers quit, end program")
-                continue_test = False
-                continue
+        self.log.info("All Workers quit, end program")
 
-            if not self.queue.empty():
-                try:
-                    msg = self.queue.get(timeout=0.001)
-                    msg.handle(self)
-                except Queue.Empty as e:
-                    self.log.warning(
-                        "Queue unexpectedly Empty. {}".format(e)
-                    )
+    def wait_time(self, deadline):
+        """Seconds to block for messages, until deadline or the next status dump"""
+        if self.status_board is not None:
+            deadline = min(deadline, self._next_dump)
+        return max(deadline - time.time(), 0)
+
+    def dump_status(self, force=False):
+        """Write the status board to status_file, when status_interval is up"""
+        if self.status_board is None or not (force or time.time() >= self._next_dump):
+            return
+        self.status_board.dump(self.status_file)
+        self._next_dump = time.time() + self.status_interval
 
     def on_status(self, plug_id, data):
         """Counts the number of workers that are ready
@@ -319,6 +556,9 @@ class Boss(object):
         #     self.worker_results[plug_id] = exit_code
         # else:
         self.worker_results[plug_id] = exit_code
+        self.quit_counter += 1
+        if exit_code:
+            self.exit_code = 1
         #
         # Force process to end
         #
@@ -373,6 +613,37 @@ if __name__ == '__main__':
         required=True,
         help='netbooter ipv4 address'
     )
+    parser.add_argument(
+        '--port', '-p',
+        type=int,
+        default=161,
+        help='netbooter snmp port, e.g. of netbooter_sim.py'
+    )
+    parser.add_argument(
+        '--serialize', '-s',
+        action='store_true',
+        help='Serialize requests to the netbooter instead of racing them'
+    )
+    parser.add_argument(
+        '--mode', '-m',
+        choices=['process', 'thread'],
+        default='process',
+        help='Run workers as processes, or as threads of one process'
+    )
+    parser.add_argument(
+        '--outlets', '-o',
+        type=netbooter.parse_outlets,
+        help='Plugs to test, e.g. 1-16 (default: 1-16)'
+    )
+    parser.add_argument(
+        '--cycles', '-c',
+        type=int,
+        default=4,
+        help='Off/on cycles per plug'
+    )
     args = parser.parse_args()
-    boss = Boss(args.ipv4)
-    boss.main()
+    boss = Boss(args.ipv4, serialize=args.serialize, port=args.port, mode=args.mode)
+    boss.number_of_switch_cycles = args.cycles
+    if args.outlets:
+        boss.plug_ids = args.outlets
+    sys.exit(boss.main())
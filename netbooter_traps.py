@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SNMP trap listener keeping a netbooter.OutletStateCache current
+Netbooters send a trap or inform when an outlet is switched at the unit,
+e.g. from the front panel or a schedule.  Traps carrying outlet status
+objects update the cache, any other trap drops what is cached for the
+sending host, so the next port_status() reads the netbooter again.
+
+Run:  python netbooter_traps.py --port 1162
+
+>>> cache = netbooter.OutletStateCache(ttl=60)
+>>> with TrapListener(cache, port=1162):
+...     nb = netbooter.NetBooter('192.168.60.124', outlet_cache=cache)
+...     nb.port_status([1])     # read once, then from the cache
+"""
+
+import argparse
+import logging
+import select
+import socket
+import threading
+
+from pyasn1.codec.ber import decoder, encoder
+from pysnmp.proto import api
+
+import netbooter
+
+__author__ = 'John Stile'
+
+
+def outlet_states(var_binds):
+    """Return list of (plug, state) for outlet status objects in a trap
+
+    The outlet status column tells the model, plugs count from 1
+    and states are 1=on, 0=off, None=Unknown.
+    """
+    states = []
+    for oid, value in var_binds:
+        oid = tuple(oid)
+        for profile in netbooter.PROFILES.values():
+            if oid[:-1] == profile.outlet_status_oid:
+                states.append((oid[-1] - profile.starting_plug + 1, netbooter.plug_state(int(value))))
+                break
+    return states
+
+
+class TrapListener(object):
+    """UDP listener applying SNMPv1/v2c traps and informs to an OutletStateCache
+
+    Use as a context manager, or call start() and stop().
+    port=0 picks a free port, read it back from self.port.
+    """
+
+    def __init__(self, cache, host='0.0.0.0', port=162, community='public', logger=None):
+        self.cache = cache
+        self.host = host
+        self.port = port
+        self.community = community
+        self.log = logger or logging.getLogger(__name__)
+        self.traps = 0  # traps and informs applied
+        self._sock = None
+        self._thread = None
+        self._running = False
+
+    def handle(self, whole_msg, address):
+        """Apply one trap from address (host, port)
+        :return bytes: encoded response to an inform, or None
+        """
+        version = int(api.decodeMessageVersion(whole_msg))
+        p_mod = api.protoModules[version]
+        req_msg, _ = decoder.decode(whole_msg, asn1Spec=p_mod.Message())
+        if str(p_mod.apiMessage.getCommunity(req_msg)) != self.community:
+            return None
+        req_pdu = p_mod.apiMessage.getPDU(req_msg)
+        response = None
+        if version == api.protoVersion1:
+            if not req_pdu.isSameTypeWith(p_mod.TrapPDU()):
+                return None
+            var_binds = p_mod.apiTrapPDU.getVarBinds(req_pdu)
+        elif req_pdu.isSameTypeWith(p_mod.SNMPv2TrapPDU()):
+            var_binds = p_mod.apiPDU.getVarBinds(req_pdu)
+        elif req_pdu.isSameTypeWith(p_mod.InformRequestPDU()):
+            var_binds = p_mod.apiPDU.getVarBinds(req_pdu)
+            rsp_msg = p_mod.apiMessage.getResponse(req_msg)
+            p_mod.apiPDU.setVarBinds(p_mod.apiMessage.getPDU(rsp_msg), var_binds)
+            response = encoder.encode(rsp_msg)
+        else:
+            return None
+
+        host = address[0]
+        states = outlet_states(var_binds)
+        if states:
+            for plug, state in states:
+                self.log.debug("trap from %s: plug %s state %s", host, plug, state)
+                self.cache.update_host(host, plug, state)
+        else:
+            self.log.debug("trap from %s without outlet state, dropping cached states", host)
+            self.cache.invalidate_host(host)
+        self.traps += 1
+        return response
+
+    def serve(self):
+        """Apply traps until stop() is called"""
+        while self._running:
+            readable, _, _ = select.select([self._sock], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                whole_msg, address = self._sock.recvfrom(65535)
+            except OSError:
+                break
+            try:
+                response = self.handle(whole_msg, address)
+            except Exception as e:
+                self.log.warning("Bad trap from %s: %s", address[0], e)
+                continue
+            if response is not None:
+                self._sock.sendto(response, address)
+
+    def start(self):
+        """Bind the UDP port and listen in a background thread"""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((self.host, self.port))
+        self.port = self._sock.getsockname()[1]
+        self._running = True
+        self._thread = threading.Thread(target=self.serve, name="TrapListener", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop listening and release the port"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """Log outlet state traps until interrupted"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0', help='Address to listen on.')
+    parser.add_argument('--port', '-p', type=int, default=162, help='UDP port to listen on.')
+    parser.add_argument('--community', '-c', default='public', help='Trap community string.')
+    args = parser.parse_args()
+
+    log = netbooter.get_log()
+    log.setLevel(logging.DEBUG)
+    listener = TrapListener(
+        netbooter.OutletStateCache(),
+        host=args.host,
+        port=args.port,
+        community=args.community,
+        logger=log
+    )
+    with listener:
+        print("Listening for traps on {}:{}".format(args.host, listener.port))
+        try:
+            while True:
+                threading.Event().wait(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Worker status in shared memory
+A StatusBoard is a fixed layout array in multiprocessing.shared_memory,
+one record per worker slot.  Workers update their own record in place and
+the Boss reads every record without a lock or a queued message, then dumps
+the board to status.json now and then.
+
+Each record is guarded by a sequence counter (a seqlock): the writer makes
+it odd before changing the record and even again after, and a reader retries
+until it sees the same even counter before and after copying the record.
+Every slot must have a single writer.
+
+>>> with StatusBoard(16) as board:
+...     board.update(0, id=1, state='on', iteration=3)
+...     board.read(0)['state']
+'on'
+"""
+
+import json
+import struct
+import time
+from multiprocessing import shared_memory
+
+import netbooter
+
+__author__ = 'John Stile'
+
+# Record states, stored as their index
+STATES = ('idle', 'ready', 'off', 'on', 'done', 'failed')
+
+# seq, then id, state, iteration, error_count, updated (time.time()) and a note
+_SEQ = struct.Struct('<I')
+NOTE_SIZE = 24
+_BODY = struct.Struct('<iiiid{}s'.format(NOTE_SIZE))
+RECORD_SIZE = _SEQ.size + _BODY.size
+
+
+class StatusBoard(object):
+    """Shared memory records of worker status, indexed by slot
+
+    The creator owns the segment and unlinks it on close(); workers given
+    the board through multiprocessing, or attach() by name, only close it.
+    """
+
+    def __init__(self, slots, name=None, create=True):
+        self.slots = slots
+        self.owner = create
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=create, size=slots * RECORD_SIZE if create else 0)
+        if create:
+            self.shm.buf[:slots * RECORD_SIZE] = bytes(slots * RECORD_SIZE)
+
+    @classmethod
+    def attach(cls, name, slots):
+        """Open the board created under name by another process"""
+        return cls(slots, name=name, create=False)
+
+    def __reduce__(self):
+        # A worker started by spawn attaches by name and never unlinks
+        return self.attach, (self.name, self.slots)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def update(self, slot, id=None, state=None, iteration=None, error_count=None, note=None):
+        """Change fields of the record of slot, others keep their value"""
+        offset = slot * RECORD_SIZE
+        buf = self.shm.buf
+        seq = _SEQ.unpack_from(buf, offset)[0]
+        old_id, old_state, old_iteration, old_error_count, _, old_note = _BODY.unpack_from(
+            buf, offset + _SEQ.size)
+        body = _BODY.pack(
+            old_id if id is None else id,
+            old_state if state is None else STATES.index(state),
+            old_iteration if iteration is None else iteration,
+            old_error_count if error_count is None else error_count,
+            time.time(),
+            old_note if note is None else note.encode('utf-8')[:NOTE_SIZE]
+        )
+        _SEQ.pack_into(buf, offset, (seq + 1) & 0xffffffff)
+        buf[offset + _SEQ.size:offset + RECORD_SIZE] = body
+        _SEQ.pack_into(buf, offset, (seq + 2) & 0xffffffff)
+
+    def read(self, slot):
+        """Return the record of slot as a dict, or None if it was never written"""
+        offset = slot * RECORD_SIZE
+        buf = self.shm.buf
+        while True:
+            seq = _SEQ.unpack_from(buf, offset)[0]
+            if seq % 2:
+                continue
+            body = bytes(buf[offset + _SEQ.size:offset + RECORD_SIZE])
+            if _SEQ.unpack_from(buf, offset)[0] == seq:
+                break
+        if seq == 0:
+            return None
+        id, state, iteration, error_count, updated, note = _BODY.unpack(body)
+        return {
+            'id': id,
+            'state': STATES[state],
+            'iteration': iteration,
+            'error_count': error_count,
+            'updated': updated,
+            'note': note.rstrip(b'\0').decode('utf-8', 'replace'),
+        }
+
+    def snapshot(self):
+        """Return the records of every written slot"""
+        records = (self.read(slot) for slot in range(self.slots))
+        return [record for record in records if record is not None]
+
+    def dump(self, path):
+        """Write the board to path as JSON, replacing the file atomically"""
+        text = json.dumps({'time': time.time(), 'workers': self.snapshot()}, indent=1, sort_keys=True)
+        netbooter.atomic_write(path, text, prefix='.status')
+
+    def close(self):
+        """Release the board, removing the segment if this process created it"""
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for message_queue
+"""
+
+import pickle
+import unittest
+from unittest.mock import MagicMock
+
+
+class TestEncoding(unittest.TestCase):
+
+    @staticmethod
+    def _callFUT(data):
+        from message_queue import decode
+        return decode(data)
+
+    def test_round_trip(self):
+        """Every message type comes back equal to what was encoded"""
+        import message_queue
+        messages = [
+            message_queue.QuitMessage(7, 0),
+            message_queue.LogMessage(3, 'INFO', u'plug 3 → off ' * 4),
+            message_queue.StatusMessage('BOSS', {'BeginTest': True, 'load': [1.5, -300, None, b'\x00']}),
+            message_queue.RebootMessage('down'),
+            message_queue.FinishedMessage('fe80::1'),
+        ]
+        for msg in messages:
+            assert self._callFUT(msg.encode()) == msg
+            # Put as is, pickling goes through the compact form too
+            assert pickle.loads(pickle.dumps(msg)) == msg
+
+    def test_compact(self):
+        """The encoded form is smaller than a pickled __dict__"""
+        from message_queue import LogMessage
+        from message_queue_bench import LegacyLogMessage
+        assert len(LogMessage(3, 'INFO', 'off').encode()) == 12
+        assert len(pickle.dumps(LegacyLogMessage(3, 'INFO', 'off'))) > 12
+        assert not hasattr(LogMessage(3, 'INFO', 'off'), '__dict__')
+
+    def test_big_int(self):
+        """Ints up to uint64 round trip, bigger ones raise TypeError"""
+        from message_queue import StatusMessage
+        msg = StatusMessage(1, {'min': -2 ** 63, 'max': 2 ** 64 - 1})
+        assert self._callFUT(msg.encode()) == msg
+        with self.assertRaises(TypeError):
+            StatusMessage(1, 2 ** 64).encode()
+        with self.assertRaises(TypeError):
+            StatusMessage(1, -2 ** 63 - 1).encode()
+
+    def test_hashable(self):
+        """Equal messages hash equal, lists and dicts included"""
+        from message_queue import LogMessage, StatusMessage
+        assert len({LogMessage(3, 'INFO', 'off'), LogMessage(3, 'INFO', 'off')}) == 1
+        status = StatusMessage(3, {'ready': True, 'plugs': [1, 2]})
+        assert hash(status) == hash(self._callFUT(status.encode()))
+
+    def test_bad_data(self):
+        from message_queue import WIRE_VERSION, LogMessage
+        data = LogMessage(3, 'INFO', 'off').encode()
+        with self.assertRaises(ValueError):
+            self._callFUT(bytes([WIRE_VERSION + 1]) + data[1:])
+        with self.assertRaises(ValueError):
+            self._callFUT(bytes([WIRE_VERSION, 99]) + data[2:])
+
+    def test_send_receive(self):
+        """send() puts bytes, receive() dispatches to the handler"""
+        import message_queue
+        queue = MagicMock()
+        message_queue.send(queue, message_queue.LogMessage(3, 'INFO', 'on'))
+        item = queue.put.call_args[0][0]
+        assert isinstance(item, bytes)
+        receiver = MagicMock()
+        message_queue.receive(item).handle(receiver)
+        receiver.on_log.assert_called_once_with(3, 'INFO', 'on')
+
+
+class TestBatchSender(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from message_queue import BatchSender
+        return BatchSender
+
+    def _makeOne(self, **kw):
+        import queue
+        self.queue = queue.Queue()
+        sender = self._getTargetClass()(self.queue, **kw)
+        self.addCleanup(sender.close)
+        return sender
+
+    def _received(self):
+        """Return (items on the queue, messages they dispatch)"""
+        import message_queue
+        items = []
+        while not self.queue.empty():
+            items.append(self.queue.get())
+        receiver = MagicMock()
+        for item in items:
+            message_queue.receive(item).handle(receiver)
+        return items, receiver.method_calls
+
+    def test_size(self):
+        """A full buffer goes out as one batch, in order"""
+        from unittest.mock import call
+        from message_queue import LogMessage
+        sender = self._makeOne(max_messages=3, max_delay=60)
+        for n in range(7):
+            sender.put(LogMessage(n, 'INFO', 'on'))
+        items, calls = self._received()
+        assert len(items) == 2 and sender.batches == 2
+        assert calls == [call.on_log(n, 'INFO', 'on') for n in range(6)]
+
+    def test_time(self):
+        """A partial buffer goes out max_delay after its first message"""
+        import time
+        from message_queue import LogMessage
+        sender = self._makeOne(max_delay=0.05)
+        sender.put(LogMessage(1, 'INFO', 'on'))
+        sender.put(LogMessage(2, 'INFO', 'on'))
+        assert self.queue.empty()
+        time.sleep(0.3)
+        items, calls = self._received()
+        assert len(items) == 1 and len(calls) == 2
+
+    def test_coalesce(self):
+        """Only the last status of an id is sent, a quit flushes at once"""
+        from unittest.mock import call
+        from message_queue import LogMessage, QuitMessage, StatusMessage
+        sender = self._makeOne(max_delay=60)
+        sender.put(StatusMessage(1, {'cycle': 1}))
+        sender.put(StatusMessage(2, {'cycle': 1}))
+        sender.put(LogMessage(1, 'INFO', 'off'))
+        sender.put(StatusMessage(1, {'cycle': 2}))
+        sender.put(QuitMessage(1, 0))
+        items, calls = self._received()
+        assert len(items) == 1
+        assert calls == [
+            call.on_status(2, {'cycle': 1}),
+            call.on_log(1, 'INFO', 'off'),
+            call.on_status(1, {'cycle': 2}),
+            call.on_quit(1, 0),
+        ]
+
+
+if __name__ == '__main__':
+    unittest.main()
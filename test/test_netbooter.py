@@ -0,0 +1,876 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for netbooter
+SNMP traffic is mocked, no netbooter is required.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+def _var_binds(values):
+    """Build a pysnmp style getCmd response for a list of values"""
+    return None, 0, 0, [(index, value) for index, value in enumerate(values)]
+
+
+class _Clock(object):
+    """Fake time for netbooter, sleep() moves time() forward"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestNetBooter(unittest.TestCase):
+
+    #
+    # Each test will import the Module Under Test
+    #
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter import NetBooter
+        return NetBooter
+
+    def _makeOne(self, *args, **kw):
+        """Create a NetBooter without identifying it over the network"""
+        with patch.object(self._getTargetClass(), 'identify_netbooter'):
+            nb = self._getTargetClass()(*args, logger=MagicMock(), **kw)
+        nb.status = {
+            "currentAlarmThreshold": "1.3.6.1.4.1.21728.3.3.1.0",
+            "currentDrawStatus1": "1.3.6.1.4.1.21728.3.3.2.0",
+            "currentDrawStatus2": "1.3.6.1.4.1.21728.3.3.3.0",
+            "currentDrawMax1": "1.3.6.1.4.1.21728.3.3.4.0",
+            "currentDrawMax2": "1.3.6.1.4.1.21728.3.3.5.0",
+        }
+        nb.outlet_action = "1.3.6.1.4.1.21728.3.2.1.1.4"
+        nb.outlet_status = "1.3.6.1.4.1.21728.3.2.1.1.3"
+        nb.outlet_range = list(range(0, 16))
+        from netbooter import PROFILES
+        nb.profile = PROFILES['Synaccess Remote PDU']
+        return nb
+
+    @patch("netbooter.cmdgen")
+    def test_get_snmp_data_bulk_single_pdu(self, mock_cmdgen):
+        """All OIDs fit in one PDU, so one round trip"""
+        getcmd = mock_cmdgen.CommandGenerator.return_value.getCmd
+        getcmd.return_value = _var_binds([1, 2, 1])
+        nb = self._makeOne(host='127.0.0.1')
+        result = nb.get_snmp_data_bulk(['1.3.6.1', '1.3.6.2', '1.3.6.3'])
+        assert result == [1, 2, 1]
+        assert getcmd.call_count == 1
+        assert getcmd.call_args[0][2:] == ((1, 3, 6, 1), (1, 3, 6, 2), (1, 3, 6, 3))
+
+    @patch("netbooter.cmdgen")
+    def test_get_snmp_data_bulk_splits_at_limit(self, mock_cmdgen):
+        """OIDs beyond max_var_binds go into another PDU"""
+        getcmd = mock_cmdgen.CommandGenerator.return_value.getCmd
+        getcmd.side_effect = [_var_binds([1, 1]), _var_binds([2])]
+        nb = self._makeOne(host='127.0.0.1', max_var_binds=2)
+        result = nb.get_snmp_data_bulk(['1.1', '1.2', '1.3'])
+        assert result == [1, 1, 2]
+        assert getcmd.call_count == 2
+
+    @patch("netbooter.cmdgen")
+    def test_get_snmp_data_bulk_engine_error(self, mock_cmdgen):
+        """Error indication raises SnmpEngineError, the cause once retries run out"""
+        from netbooter import RetryExhaustedError, RetryPolicy, SnmpEngineError
+        getcmd = mock_cmdgen.CommandGenerator.return_value.getCmd
+        getcmd.return_value = ('requestTimedOut', 0, 0, [])
+        nb = self._makeOne(host='127.0.0.1', retry_policy=RetryPolicy(max_attempts=1))
+        with self.assertRaises(RetryExhaustedError) as cm:
+            nb.get_snmp_data_bulk(['1.1'])
+        assert isinstance(cm.exception.__cause__, SnmpEngineError)
+        assert getcmd.call_count == 1
+
+    @patch("netbooter.cmdgen")
+    def test_set_snmp_data_bulk_retried(self, mock_cmdgen):
+        """A failed bulk SET is resent under the retry policy and reported"""
+        from netbooter import RetryPolicy
+        setcmd = mock_cmdgen.CommandGenerator.return_value.setCmd
+        setcmd.side_effect = [('requestTimedOut', 0, 0, []), _var_binds([1, 1])]
+        hook = MagicMock()
+        nb = self._makeOne(
+            host='127.0.0.1', request_hooks=[hook],
+            retry_policy=RetryPolicy(max_attempts=5, initial_backoff=0))
+        nb.set_snmp_data_bulk(['1.1', '1.2'], 1)
+        assert setcmd.call_count == 2
+        metric = hook.call_args[0][0]
+        assert (metric.operation, metric.oid, metric.retries, metric.error) == (
+            'set_snmp_data_bulk', '1.1', 1, None)
+
+    @patch("netbooter.cmdgen")
+    def test_port_status_one_round_trip(self, mock_cmdgen):
+        """port_status reads every plug with one bulk request"""
+        getcmd = mock_cmdgen.CommandGenerator.return_value.getCmd
+        getcmd.return_value = _var_binds([1, 2, 257, 0])
+        nb = self._makeOne(host='127.0.0.1')
+        assert nb.port_status([1, 2, 3, 4]) == [1, 0, 1, 0]
+        assert getcmd.call_count == 1
+
+    @patch("netbooter.cmdgen")
+    def test_snmp_session_reused(self, mock_cmdgen):
+        """Engine and transport are built once per instance"""
+        getcmd = mock_cmdgen.CommandGenerator.return_value.getCmd
+        getcmd.return_value = _var_binds([1])
+        nb = self._makeOne(host='127.0.0.1', port=1161)
+        nb.get_snmp_data('1.1')
+        nb.get_snmp_data_bulk(['1.1', '1.2'])
+        assert mock_cmdgen.CommandGenerator.call_count == 1
+        assert mock_cmdgen.UdpTransportTarget.call_count == 1
+        assert mock_cmdgen.UdpTransportTarget.call_args[0][0] == ('127.0.0.1', 1161)
+
+    @patch("netbooter.time.sleep")
+    def test_confirm_state_waits_for_stable_reads(self, mock_sleep):
+        """A change of value restarts the count of same reads"""
+        nb = self._makeOne(host='127.0.0.1')
+        nb.verify = dict(initial_delay=0.1, max_delay=0.4, stable_reads=2, deadline=60)
+        nb.get_snmp_data = MagicMock(side_effect=[1, 2, 1, 1])
+        assert nb.confirm_state('1.1', 1) == 1
+        assert nb.get_snmp_data.call_count == 4
+        # Exponential backoff, capped at max_delay
+        assert [c[0][0] for c in mock_sleep.call_args_list] == [0.1, 0.2, 0.4, 0.4]
+
+    def test_confirm_state_stable_failure(self):
+        """A plug that stays in the old state fails at min_settle, not the deadline"""
+        clock = _Clock()
+        nb = self._makeOne(host='127.0.0.1')
+        nb.verify = dict(min_settle=2, initial_delay=0.1, max_delay=0.4, stable_reads=2, deadline=60)
+        nb.get_snmp_data = MagicMock(return_value=2)
+        with patch("netbooter.time.time", clock.time), patch("netbooter.time.sleep", clock.sleep):
+            assert nb.confirm_state('1.1', 1) == 2
+        # Two reads, max_delay apart, the last one on min_settle
+        assert clock.now == 2
+        assert nb.get_snmp_data.call_count == 2
+
+    def test_confirm_state_misreport(self):
+        """A port falling back just before min_settle is not accepted"""
+        from netbooter import VERIFY_DEFAULT
+        clock = _Clock()
+        nb = self._makeOne(host='127.0.0.1')
+        nb.verify = dict(VERIFY_DEFAULT)
+        # Reports the state set, then the old state from 1.8 seconds on
+        nb.get_snmp_data = MagicMock(side_effect=lambda oid: 1 if clock.now < 1.8 else 2)
+        with patch("netbooter.time.time", clock.time), patch("netbooter.time.sleep", clock.sleep):
+            assert nb.confirm_state('1.1', 1) == 2
+        assert 2 < clock.now < VERIFY_DEFAULT['deadline']
+
+    @patch("netbooter.cmdgen")
+    def test_set_no_slower_than_fixed_sleep(self, mock_cmdgen):
+        """A sequential set of a plug that switches costs sleep(2) and two reads"""
+        from netbooter import PROFILES
+        session = mock_cmdgen.CommandGenerator.return_value
+        session.setCmd.return_value = _var_binds([1])
+        session.getCmd.return_value = _var_binds([1])
+        for model in ('Synaccess Remote PDU', 'Power Distribution System'):
+            clock = _Clock()
+            nb = self._makeOne(host='127.0.0.1')
+            nb.verify = dict(PROFILES[model].verify)
+            with patch("netbooter.time.time", clock.time), patch("netbooter.time.sleep", clock.sleep):
+                assert nb.set_snmp_data(*nb.outlet_oids(1), state=1) is True
+            assert clock.now <= 2.0
+        assert session.getCmd.call_count == 4
+
+    @patch("netbooter.time.sleep")
+    def test_confirm_state_deadline(self, mock_sleep):
+        """Give up with the last value once the deadline passes"""
+        nb = self._makeOne(host='127.0.0.1')
+        nb.verify = dict(initial_delay=0.1, max_delay=0.4, stable_reads=2, deadline=0)
+        nb.get_snmp_data = MagicMock(return_value=2)
+        assert nb.confirm_state('1.1', 1) == 2
+        assert nb.get_snmp_data.call_count == 1
+
+    @patch("netbooter.time.sleep")
+    @patch("netbooter.cmdgen")
+    def test_plug_on_concurrent_one_set_pdu(self, mock_cmdgen, mock_sleep):
+        """Concurrent mode sends every SET in one PDU and verifies in bulk"""
+        session = mock_cmdgen.CommandGenerator.return_value
+        session.setCmd.return_value = _var_binds([1, 1, 1])
+        session.getCmd.return_value = _var_binds([1, 257, 1])
+        nb = self._makeOne(host='127.0.0.1')
+        nb.verify = dict(initial_delay=0, max_delay=0, stable_reads=1, deadline=60)
+        assert nb.plug_on([1, 2, 3], concurrent=True) == {1: True, 2: True, 3: True}
+        assert session.setCmd.call_count == 1
+        assert len(session.setCmd.call_args[0]) == 5
+        assert session.getCmd.call_count == 1
+
+    @patch("netbooter.time.sleep")
+    def test_switch_plugs_retries_unverified(self, mock_sleep):
+        """Plugs that did not verify are SET again, alone"""
+        nb = self._makeOne(host='127.0.0.1')
+        nb.verify = dict(initial_delay=0, max_delay=0, stable_reads=1, deadline=0)
+        nb.set_snmp_data_bulk = MagicMock()
+        nb.get_snmp_data_bulk = MagicMock(side_effect=[[2, 1], [2]])
+        assert nb.switch_plugs([1, 2], 2) == {1: True, 2: True}
+        assert nb.set_snmp_data_bulk.call_args_list[1][0][0] == [(1, 3, 6, 1, 4, 1, 21728, 3, 2, 1, 1, 4, 1)]
+
+    @patch("netbooter.time.sleep")
+    def test_switch_plugs_stagger(self, mock_sleep):
+        """Stagger sends one SET per plug, pausing between them"""
+        nb = self._makeOne(host='127.0.0.1')
+        nb.verify = dict(initial_delay=0, max_delay=0, stable_reads=1, deadline=60)
+        nb.set_snmp_data_bulk = MagicMock()
+        nb.get_snmp_data_bulk = MagicMock(return_value=[1, 1, 1])
+        assert nb.switch_plugs([1, 2, 3], 1, stagger=0.5) == {1: True, 2: True, 3: True}
+        assert nb.set_snmp_data_bulk.call_count == 3
+        assert mock_sleep.call_args_list.count(unittest.mock.call(0.5)) == 2
+
+    def test_all_on_concurrent(self):
+        """all_on and all_off switch every plug together, delay_time staggers them"""
+        nb = self._makeOne(host='127.0.0.1')
+        nb.outlet_range = list(range(0, 4))
+        nb.switch_plugs = MagicMock(return_value={1: True, 2: True, 3: True, 4: True})
+        nb.all_on(delay_time=0.5)
+        nb.all_off()
+        assert nb.switch_plugs.call_args_list == [
+            unittest.mock.call([1, 2, 3, 4], 1, stagger=0.5),
+            unittest.mock.call([1, 2, 3, 4], 2, stagger=0)]
+
+    def test_outlet_oids_compiled(self):
+        """Outlet OIDs come from the profile as cached tuples"""
+        nb = self._makeOne(host='127.0.0.1')
+        set_oid, get_oid = nb.outlet_oids(3)
+        assert set_oid == (1, 3, 6, 1, 4, 1, 21728, 3, 2, 1, 1, 4, 2)
+        assert get_oid == (1, 3, 6, 1, 4, 1, 21728, 3, 2, 1, 1, 3, 2)
+        assert nb.outlet_oids(3)[0] is set_oid
+
+    def test_register_profile(self):
+        """A new model is added as data"""
+        from netbooter import PROFILES, register_profile, VERIFY_DEFAULT
+        self.addCleanup(PROFILES.pop, 'Test PDU', None)
+        profile = register_profile('Test PDU', {
+            'status': {'powerOutletNum': '1.3.6.1.4.1.99.1.0'},
+            'outlet_action': '1.3.6.1.4.1.99.2',
+            'outlet_status': '1.3.6.1.4.1.99.3',
+            'starting_plug': 1,
+            'verify': VERIFY_DEFAULT,
+        })
+        assert PROFILES['Test PDU'] is profile
+        assert profile.status_oids['powerOutletNum'] == (1, 3, 6, 1, 4, 1, 99, 1, 0)
+        assert profile.outlet_oids(1) == ((1, 3, 6, 1, 4, 1, 99, 2, 1), (1, 3, 6, 1, 4, 1, 99, 3, 1))
+
+    @patch("netbooter.cmdgen")
+    def test_snapshot_walks_tables(self, mock_cmdgen):
+        """snapshot() walks outlet and sensor tables with GETNEXT on SNMPv1, one root at a time"""
+        status = (1, 3, 6, 1, 4, 1, 21728, 3, 2, 1, 1, 3)
+        sensor = (1, 3, 6, 1, 4, 1, 21728, 3, 3)
+        nextcmd = mock_cmdgen.CommandGenerator.return_value.nextCmd
+        nextcmd.side_effect = [
+            (None, 0, 0, [
+                [(status + (0,), 1)],
+                [(status + (1,), 2)],
+                [(status + (2,), 1)],
+                # Past the end of the outlet column
+                [((1, 3, 6, 1, 4, 1, 21728, 3, 2, 1, 1, 4, 0), 0)],
+            ]),
+            (None, 0, 0, [
+                [(sensor + (1, 0), 80)],
+                [(sensor + (2, 0), 12)],
+                [(sensor + (8, 0), 31)],
+                [((1, 3, 6, 1, 4, 1, 21728, 3, 4, 1, 0), 0)],
+            ]),
+        ]
+        nb = self._makeOne(host='127.0.0.1')
+        nb.outlet_range = [0, 1, 2]
+        snapshot = nb.snapshot()
+        assert [c[0][2:] for c in nextcmd.call_args_list] == [(status,), (sensor,)]
+        assert snapshot.model == 'Synaccess Remote PDU'
+        assert snapshot.outlets == {1: 1, 2: 0, 3: 1}
+        assert snapshot.sensors == {
+            'currentAlarmThreshold': 80,
+            'currentDrawStatus1': 12,
+            'temperatureReading': 31,
+        }
+
+    @patch("netbooter.cmdgen")
+    def test_walk_uses_getbulk_on_v2c(self, mock_cmdgen):
+        """SNMPv2c walks use GETBULK"""
+        bulkcmd = mock_cmdgen.CommandGenerator.return_value.bulkCmd
+        bulkcmd.return_value = (None, 0, 0, [[((1, 1, 1), 5)], [((1, 2, 1), 6)]])
+        nb = self._makeOne(host='127.0.0.1', mp_model=1)
+        assert nb.walk_snmp_data(['1.1']) == [((1, 1, 1), 5)]
+        assert bulkcmd.call_args[0][2:] == (0, nb.max_var_binds, (1, 1))
+
+    def test_current_draw_uses_bulk(self):
+        """current_draw reads all current values in one call"""
+        nb = self._makeOne(host='127.0.0.1')
+        nb.get_snmp_data_bulk = MagicMock(return_value=[1, 2, 3, 4, 5])
+        nb.current_draw()
+        nb.get_snmp_data_bulk.assert_called_once()
+        assert len(nb.get_snmp_data_bulk.call_args[0][0]) == 5
+
+
+class TestDeviceLock(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter import DeviceLock
+        return DeviceLock
+
+    def _makeOne(self, key='10.0.0.1:161'):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return self._getTargetClass()(key, tmp.name)
+
+    def test_for_host_shared(self):
+        """Every NetBooter of one host shares a lock"""
+        cls = self._getTargetClass()
+        assert cls.for_host('10.9.9.9') is cls.for_host('10.9.9.9', 161)
+        assert cls.for_host('10.9.9.9') is not cls.for_host('10.9.9.9', 1161)
+
+    def test_reentrant_and_file_lock(self):
+        """The flock is taken once and held until the outer release"""
+        import fcntl
+        lock = self._makeOne()
+        with lock:
+            with lock:
+                pass
+            # Another open file description cannot take the lock meanwhile
+            fd = os.open(lock.path, os.O_RDWR)
+            try:
+                with self.assertRaises(BlockingIOError):
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            finally:
+                os.close(fd)
+        fd = os.open(lock.path, os.O_RDWR)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.close(fd)
+
+    def test_threads_serialized(self):
+        """Threads never hold the lock together"""
+        import threading
+        lock = self._makeOne()
+        inside = []
+        peak = []
+
+        def work():
+            for _ in range(20):
+                with lock:
+                    inside.append(1)
+                    peak.append(len(inside))
+                    inside.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(peak) == 1
+
+    @patch("netbooter.cmdgen")
+    def test_netbooter_serialize(self, mock_cmdgen):
+        """With serialize on, requests hold the host lock"""
+        from netbooter import NetBooter
+        held = []
+        getcmd = mock_cmdgen.CommandGenerator.return_value.getCmd
+
+        def answer(*args):
+            held.append(nb.device_lock._depth)
+            return _var_binds([1])
+
+        getcmd.side_effect = answer
+        with patch.object(NetBooter, 'identify_netbooter'):
+            nb = NetBooter('10.0.0.1', logger=MagicMock(), serialize=True)
+        nb.device_lock = self._makeOne()
+        nb.get_snmp_data('1.1')
+        assert held == [1]
+        assert nb.device_lock._depth == 0
+
+
+class TestIdentityCache(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter import IdentityCache
+        return IdentityCache
+
+    def _makeOne(self, ttl=3600):
+        """Identity cache in a temporary directory"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return self._getTargetClass()(os.path.join(tmp.name, 'sub', 'identity.json'), ttl)
+
+    @staticmethod
+    def _entry():
+        from netbooter import MIBS
+        mib = MIBS['Synaccess Remote PDU']
+        return {
+            'model': 'Synaccess Remote PDU',
+            'power_outlet_num': 4,
+            'outlet_action': mib['outlet_action'],
+            'outlet_status': mib['outlet_status'],
+            'outlet_range': [0, 1, 2, 3],
+            'status': mib['status'],
+        }
+
+    def test_put_get(self):
+        """A stored entry is returned until it expires"""
+        cache = self._makeOne()
+        cache.put('10.0.0.1:161', self._entry())
+        assert cache.get('10.0.0.1:161')['outlet_range'] == [0, 1, 2, 3]
+        assert cache.get('10.0.0.2:161') is None
+
+    def test_expired(self):
+        """An entry older than ttl is ignored"""
+        cache = self._makeOne(ttl=-1)
+        cache.put('10.0.0.1:161', self._entry())
+        assert cache.get('10.0.0.1:161') is None
+
+    def test_invalidate(self):
+        """Invalidated entries are gone"""
+        cache = self._makeOne()
+        cache.put('10.0.0.1:161', self._entry())
+        cache.invalidate('10.0.0.1:161')
+        assert cache.get('10.0.0.1:161') is None
+
+    def test_netbooter_skips_identify(self):
+        """NetBooter starts from the cache without SNMP traffic"""
+        from netbooter import NetBooter
+        cache = self._makeOne()
+        cache.put('10.0.0.1:161', self._entry())
+        with patch.object(NetBooter, 'identify_netbooter') as identify:
+            nb = NetBooter('10.0.0.1', logger=MagicMock(), identity_cache=cache)
+        identify.assert_not_called()
+        assert nb.outlet_range == [0, 1, 2, 3]
+
+    @patch("netbooter.cmdgen")
+    def test_netbooter_error_invalidates(self, mock_cmdgen):
+        """An SNMP error drops the cached identity"""
+        from netbooter import NetBooter, SnmpEngineError
+        mock_cmdgen.CommandGenerator.return_value.getCmd.return_value = ('requestTimedOut', 0, 0, [])
+        cache = self._makeOne()
+        cache.put('10.0.0.1:161', self._entry())
+        nb = NetBooter('10.0.0.1', logger=MagicMock(), identity_cache=cache)
+        with self.assertRaises(SnmpEngineError):
+            NetBooter.get_snmp_data_bulk.__wrapped__(nb, ['1.1'])
+        assert cache.get('10.0.0.1:161') is None
+
+
+class TestMemoryIdentityCache(TestIdentityCache):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter import MemoryIdentityCache
+        return MemoryIdentityCache
+
+    def _makeOne(self, ttl=3600):
+        return self._getTargetClass()(ttl)
+
+
+class TestOutletStateCache(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter import OutletStateCache
+        return OutletStateCache
+
+    def _makeOne(self, *args, **kw):
+        return self._getTargetClass()(*args, **kw)
+
+    def test_ttl(self):
+        cache = self._makeOne(ttl=0.05)
+        cache.put('pdu:161', 1, 0)
+        assert cache.get('pdu:161', 1) == 0
+        assert cache.get('pdu:161', 2) is None
+        time.sleep(0.05)
+        assert cache.get('pdu:161', 1) is None
+
+    def test_host(self):
+        """Host wide updates reach every port of that host only"""
+        cache = self._makeOne()
+        for key in ('pdu:161', 'pdu:1161', 'other:161'):
+            cache.put(key, 1, 1)
+        cache.update_host('pdu', 1, 0)
+        assert [cache.get(key, 1) for key in ('pdu:161', 'pdu:1161', 'other:161')] == [0, 0, 1]
+        cache.invalidate_host('pdu')
+        assert [cache.get(key, 1) for key in ('pdu:161', 'pdu:1161', 'other:161')] == [None, None, 1]
+
+    @patch("netbooter.socket.gethostbyname")
+    def test_host_name(self, mock_resolve):
+        """Traps name the sender by IP address, keys by host name still match"""
+        addresses = {'pdu.lab': '10.0.0.5', 'other.lab': '10.0.0.6'}
+        mock_resolve.side_effect = lambda host: addresses.get(host, host)
+        cache = self._makeOne()
+        for key in ('pdu.lab:161', 'other.lab:161'):
+            cache.put(key, 1, 1)
+        cache.update_host('10.0.0.5', 1, 0)
+        assert [cache.get(key, 1) for key in ('pdu.lab:161', 'other.lab:161')] == [0, 1]
+        cache.invalidate_host('10.0.0.5')
+        assert [cache.get(key, 1) for key in ('pdu.lab:161', 'other.lab:161')] == [None, 1]
+        # Each host is resolved once
+        cache.update_host('10.0.0.6', 1, 0)
+        assert sorted(call[0][0] for call in mock_resolve.call_args_list) == [
+            '10.0.0.5', '10.0.0.6', 'other.lab', 'pdu.lab']
+
+    @patch("netbooter.cmdgen")
+    def test_port_status_cached(self, mock_cmdgen):
+        """Only plugs missing from the cache are read, SETs update the cache"""
+        getcmd = mock_cmdgen.CommandGenerator.return_value.getCmd
+        getcmd.return_value = _var_binds([2])
+        cache = self._makeOne()
+        with patch('netbooter.NetBooter.identify_netbooter'):
+            from netbooter import NetBooter, PROFILES
+            nb = NetBooter('127.0.0.1', logger=MagicMock(), outlet_cache=cache)
+        nb.outlet_range = list(range(0, 16))
+        nb.profile = PROFILES['Synaccess Remote PDU']
+        cache.put(nb.identity_key, 1, 1)
+        assert nb.port_status([1, 2]) == [1, 0]
+        assert getcmd.call_args[0][2:] == (nb.outlet_oids(2)[1],)
+        assert nb.port_status([1, 2]) == [1, 0]
+        assert getcmd.call_count == 1
+        with patch.object(NetBooter, 'set_snmp_data', return_value=True):
+            nb.plug_on([2])
+        with patch.object(NetBooter, 'set_snmp_data', return_value=False):
+            nb.plug_off([1])
+        assert (cache.get(nb.identity_key, 1), cache.get(nb.identity_key, 2)) == (None, 1)
+
+
+class TestCommandLine(unittest.TestCase):
+
+    def test_parse_outlets(self):
+        from netbooter import parse_outlets
+        assert parse_outlets('1-4,8, 10-11') == [1, 2, 3, 4, 8, 10, 11]
+
+    def test_inventory_and_report(self):
+        """Inventory lines become hosts, reports are CSV or JSON by extension"""
+        import json
+        from netbooter import read_inventory, write_report
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'pdus.txt')
+            with open(path, 'w') as fh:
+                fh.write("# lab\n192.168.60.124 1-2,5\n\n192.168.60.125:1161  # all outlets\n")
+            assert read_inventory(path) == [('192.168.60.124', [1, 2, 5]), ('192.168.60.125:1161', None)]
+            rows = [dict(host='pdu', plug=1, sensor=None, command='status', value=1, error=None)]
+            write_report(rows, os.path.join(directory, 'report.csv'))
+            with open(os.path.join(directory, 'report.csv')) as fh:
+                assert fh.read().splitlines() == ['host,plug,sensor,command,value,error', 'pdu,1,,status,1,']
+            write_report(rows, os.path.join(directory, 'report.json'))
+            with open(os.path.join(directory, 'report.json')) as fh:
+                assert json.load(fh) == rows
+
+
+class TestImport(unittest.TestCase):
+
+    @staticmethod
+    def _loaded(statement):
+        """Return top level packages loaded after statement, in a fresh interpreter"""
+        code = "import sys; {}; print(' '.join(sorted(set(m.split('.')[0] for m in sys.modules))))"
+        output = subprocess.check_output(
+            [sys.executable, '-c', code.format(statement)],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stderr=subprocess.DEVNULL
+        )
+        return output.decode().split()
+
+    def test_lazy_pysnmp(self):
+        """Importing netbooter loads neither pysnmp nor asyncio"""
+        loaded = self._loaded("import netbooter")
+        assert 'netbooter' in loaded
+        assert 'pysnmp' not in loaded and 'asyncio' not in loaded
+
+    def test_import_on_use(self):
+        """pysnmp modules are imported on first attribute access"""
+        assert 'pysnmp' in self._loaded("import netbooter; netbooter.cmdgen.CommandGenerator")
+
+    def test_unknown_attribute(self):
+        import netbooter
+        with self.assertRaises(AttributeError):
+            netbooter.no_such_module
+
+
+class TestLogEvent(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter import LogEvent
+        return LogEvent
+
+    def test_render(self):
+        """Plain key=value text, or one JSON object when structured"""
+        import json
+        fields = {'oid': '1.3.6.1', 'state': 2}
+        assert str(self._getTargetClass()('set_request', fields)) == 'set_request oid=1.3.6.1 state=2'
+        assert json.loads(str(self._getTargetClass()('set_request', fields, structured=True))) == {
+            'event': 'set_request', 'oid': '1.3.6.1', 'state': 2}
+
+    def test_disabled_level(self):
+        """Nothing is logged or formatted when the level is off"""
+        import logging
+        from netbooter import NetBooter
+        nb = NetBooter.__new__(NetBooter)
+        nb.log = MagicMock()
+        nb.log.isEnabledFor.return_value = False
+        nb.structured_log = True
+        nb._event(logging.DEBUG, 'get_request', oid='1.3.6.1')
+        nb.log.isEnabledFor.assert_called_once_with(logging.DEBUG)
+        assert not nb.log.log.called
+        nb.log.isEnabledFor.return_value = True
+        nb._event(logging.DEBUG, 'get_request', oid='1.3.6.1')
+        assert nb.log.log.call_args[1]['extra'] == {'event': 'get_request', 'fields': {'oid': '1.3.6.1'}}
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter import RetryPolicy
+        return RetryPolicy
+
+    def _makeOne(self, **kw):
+        kw.setdefault('initial_backoff', 0)
+        return self._getTargetClass()(**kw)
+
+    def test_retry_then_success(self):
+        """Retryable errors and bad results are retried"""
+        from netbooter import SnmpEngineError
+        policy = self._makeOne()
+        func = MagicMock(side_effect=[SnmpEngineError('timeout'), None, 1])
+        assert policy.call('pdu', func, retry_on_result=lambda result: result is None) == 1
+        assert policy.stats() == {
+            'attempts': 3, 'errors': 1, 'bad_results': 1, 'retries': 2, 'successes': 1}
+
+    def test_other_errors_not_retried(self):
+        policy = self._makeOne()
+        func = MagicMock(side_effect=KeyError('bug'))
+        with self.assertRaises(KeyError):
+            policy.call('pdu', func)
+        assert func.call_count == 1
+
+    def test_exhausted(self):
+        """The last error is chained to RetryExhaustedError"""
+        from netbooter import RetryExhaustedError, SnmpEngineError
+        policy = self._makeOne(breaker_threshold=10)
+        func = MagicMock(side_effect=SnmpEngineError('timeout'))
+        with self.assertRaises(RetryExhaustedError) as raised:
+            policy.call('pdu', func, max_attempts=3)
+        assert func.call_count == 3
+        assert isinstance(raised.exception.__cause__, SnmpEngineError)
+        assert policy.stats()['exhausted'] == 1
+
+    def test_deadline(self):
+        """No attempt starts after the deadline"""
+        from netbooter import RetryExhaustedError
+        policy = self._makeOne(deadline=0)
+        func = MagicMock(return_value=None)
+        with self.assertRaises(RetryExhaustedError):
+            policy.call('pdu', func, retry_on_result=lambda result: result is None)
+        assert func.call_count == 1
+        assert policy.stats()['deadline_exceeded'] == 1
+
+    def test_nested_deadline(self):
+        """Calls nested in func share the outer deadline, not one each"""
+        from netbooter import RetryExhaustedError
+        policy = self._makeOne(deadline=0.2)
+
+        def read():
+            time.sleep(0.05)
+            return 1
+
+        def set_and_verify():
+            for _ in range(3):
+                policy.call('pdu', read)
+            return False
+
+        start = time.monotonic()
+        with self.assertRaises(RetryExhaustedError):
+            policy.call('pdu', set_and_verify, retry_on_result=lambda result: not result,
+                        max_attempts=4)
+        # Deadline plus one request, not 4 attempts of 0.15 s each
+        assert time.monotonic() - start < 0.3
+        # Later calls get their own deadline again
+        assert policy.call('pdu', MagicMock(return_value=1)) == 1
+
+    def test_circuit_breaker(self):
+        """An open circuit refuses requests until reset_time, then lets one probe through"""
+        from netbooter import CircuitOpenError, RetryExhaustedError, SnmpEngineError
+        policy = self._makeOne(breaker_threshold=2, breaker_reset=0.05)
+        func = MagicMock(side_effect=SnmpEngineError('timeout'))
+        with self.assertRaises(CircuitOpenError):
+            policy.call('dead', func)
+        assert func.call_count == 2
+        # Fail fast, and only for this host
+        with self.assertRaises(CircuitOpenError):
+            policy.call('dead', func)
+        assert func.call_count == 2
+        assert policy.call('alive', MagicMock(return_value=1)) == 1
+        # After reset_time a successful probe closes the circuit
+        time.sleep(0.05)
+        assert policy.call('dead', MagicMock(return_value=1)) == 1
+        assert policy.breaker('dead').state == 'closed'
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter import MetricsRegistry
+        return MetricsRegistry
+
+    def _makeOne(self):
+        return self._getTargetClass()()
+
+    @patch("netbooter.cmdgen")
+    def test_request_hooks(self, mock_cmdgen):
+        """Every request is reported with its retries and error"""
+        from netbooter import NetBooter, RetryPolicy, RequestMetric, RetryExhaustedError
+        getcmd = mock_cmdgen.CommandGenerator.return_value.getCmd
+        getcmd.side_effect = [('requestTimedOut', 0, 0, []), _var_binds([1])]
+        registry = self._makeOne()
+        hook = MagicMock()
+        with patch.object(NetBooter, 'identify_netbooter'):
+            nb = NetBooter(
+                '127.0.0.1', logger=MagicMock(), request_hooks=[registry, hook],
+                retry_policy=RetryPolicy(max_attempts=2, initial_backoff=0))
+        assert nb.get_snmp_data('1.3.6.1') == 1
+        metric = hook.call_args[0][0]
+        assert metric._replace(duration=0) == RequestMetric(
+            '127.0.0.1:161', 'get_snmp_data', '1.3.6.1', 0, 1, None)
+
+        getcmd.side_effect = None
+        getcmd.return_value = ('requestTimedOut', 0, 0, [])
+        with self.assertRaises(RetryExhaustedError):
+            nb.get_snmp_data_bulk([(1, 3, 6, 2), (1, 3, 6, 3)])
+        assert hook.call_args[0][0].error == 'SnmpEngineError'
+        assert hook.call_args[0][0].oid == '1.3.6.2'
+        assert registry.series[('127.0.0.1:161', 'get_snmp_data', '1.3.6.1')]['retries'] == 1
+
+    def test_export(self):
+        """Prometheus text and JSON snapshot carry the same totals"""
+        import json
+        from netbooter import RequestMetric
+        registry = self._makeOne()
+        registry(RequestMetric('pdu:161', 'set_snmp_data', '1.3.6.1', 0.02, 0, None))
+        registry(RequestMetric('pdu:161', 'set_snmp_data', '1.3.6.1', 3.0, 2, 'SnmpEngineError'))
+        text = registry.to_prometheus()
+        labels = 'host="pdu:161",operation="set_snmp_data",oid="1.3.6.1"'
+        assert 'netbooter_requests_total{%s} 2' % labels in text
+        assert 'netbooter_request_retries_total{%s} 2' % labels in text
+        assert 'netbooter_request_errors_total{%s,error="SnmpEngineError"} 1' % labels in text
+        assert 'netbooter_request_duration_seconds_bucket{%s,le="0.025"} 1' % labels in text
+        assert 'netbooter_request_duration_seconds_bucket{%s,le="+Inf"} 2' % labels in text
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.json')
+            registry.write(path)
+            with open(path) as fh:
+                series = json.load(fh)['requests'][0]
+            assert (series['count'], series['duration_max']) == (2, 3.0)
+            path = os.path.join(directory, 'metrics.prom')
+            registry.write(path)
+            with open(path) as fh:
+                assert fh.read() == text
+
+
+class TestAsyncNetBooter(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter import AsyncNetBooter
+        return AsyncNetBooter
+
+    def _makeOne(self, *args, **kw):
+        """Create an AsyncNetBooter for a 4 plug Synaccess Remote PDU"""
+        nb = self._getTargetClass()(*args, logger=MagicMock(), **kw)
+        nb.outlet_action = "1.3.6.1.4.1.21728.3.2.1.1.4"
+        nb.outlet_status = "1.3.6.1.4.1.21728.3.2.1.1.3"
+        nb.outlet_range = list(range(0, 4))
+        from netbooter import PROFILES
+        nb.profile = PROFILES['Synaccess Remote PDU']
+        nb.verify = dict(initial_delay=0, max_delay=0, stable_reads=1, deadline=0)
+        return nb
+
+    @staticmethod
+    def _request(get_values):
+        """Mock AsyncNetBooter._request answering each GET with get_values"""
+        responses = iter(get_values)
+
+        async def request(pdu_type, var_binds):
+            if pdu_type == 'SetRequestPDU':
+                return var_binds
+            return [(oid, value) for (oid, _), value in zip(var_binds, next(responses))]
+        return AsyncMock(side_effect=request)
+
+    def test_identify_netbooter(self):
+        """Identity and outlet count select the MIB"""
+        request = self._request([['Synaccess Remote PDU'], [4]])
+        with patch.object(self._getTargetClass(), '_request', request):
+            nb = asyncio.run(self._getTargetClass().create('127.0.0.1', logger=MagicMock()))
+        assert nb.outlet_range == [0, 1, 2, 3]
+        assert nb.outlet_status == "1.3.6.1.4.1.21728.3.2.1.1.3"
+
+    def test_port_status(self):
+        """port_status reads all plugs in one request"""
+        nb = self._makeOne('127.0.0.1')
+        nb._request = self._request([[1, 2, 257]])
+        assert asyncio.run(nb.port_status([1, 2, 3])) == [1, 0, 1]
+        assert nb._request.await_count == 1
+        pdu_type, var_binds = nb._request.await_args[0]
+        assert pdu_type == 'GetRequestPDU' and len(var_binds) == 3
+
+    def test_plug_on_verified(self):
+        """plug_on returns a verified result per plug"""
+        nb = self._makeOne('127.0.0.1')
+        nb._request = self._request([[1], [257]])
+        assert asyncio.run(nb.plug_on([1, 2])) == {1: True, 2: True}
+        sets = [c for c in nb._request.await_args_list if c[0][0] == 'SetRequestPDU']
+        assert len(sets) == 2
+
+    def test_plug_off_not_verified(self):
+        """plug_off gives up after set_attempts"""
+        nb = self._makeOne('127.0.0.1')
+        nb.set_attempts = 2
+        nb._request = self._request([[1], [1]])
+        assert asyncio.run(nb.plug_off([1])) == {1: False}
+
+    def test_timeout_settings(self):
+        """Resends and the deadline come from the constructor"""
+        nb = self._makeOne('127.0.0.1', timeout=0.5, num_retries=3, deadline=4)
+        assert (nb.timeout, nb.num_retries, nb.deadline) == (0.5, 3, 4)
+
+    def test_gather_bounded_limit(self):
+        """No more than limit coroutines run at once"""
+        from netbooter import gather_bounded
+        running = []
+        peak = []
+
+        async def job(n):
+            running.append(n)
+            peak.append(len(running))
+            await asyncio.sleep(0)
+            running.remove(n)
+            return n
+
+        result = asyncio.run(gather_bounded([job(n) for n in range(10)], 3))
+        assert result == list(range(10))
+        assert max(peak) == 3
+
+
+class TestMain(unittest.TestCase):
+
+    @staticmethod
+    def _callFUT(argv):
+        from netbooter import main
+        with patch.object(sys, 'argv', ['netbooter.py', '--no-identity-cache'] + argv):
+            return main()
+
+    @patch('netbooter.NetBooter')
+    def test_address_port(self, mock_netbooter):
+        """The test sequence splits address:port like the subcommands"""
+        with patch('builtins.print'):
+            self._callFUT(['--delay', '0', '-a', '10.0.0.1:1161', '-a', '10.0.0.2'])
+        assert [(call[1]['host'], call[1]['port']) for call in mock_netbooter.call_args_list] == [
+            ('10.0.0.1', 1161), ('10.0.0.2', 161)]
+
+
+if __name__ == '__main__':
+    unittest.main()
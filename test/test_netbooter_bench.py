@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for netbooter_bench
+The operation suite runs against netbooter_sim, no netbooter is required.
+"""
+
+import unittest
+
+
+class TestBenchOperations(unittest.TestCase):
+
+    @staticmethod
+    def _callFUT(*args, **kw):
+        from netbooter_bench import bench_operations
+        return bench_operations(*args, **kw)
+
+    def test_matrix(self):
+        """One result per operation and concurrency, with latency percentiles"""
+        results = self._callFUT(
+            2, operations=['get_snmp_data', 'set_snmp_data'], outlets=[4], concurrency=[1, 2])
+        assert [(r['operation'], r['concurrency']) for r in results] == [
+            ('get_snmp_data', 1), ('set_snmp_data', 1),
+            ('get_snmp_data', 2), ('set_snmp_data', 2),
+        ]
+        for result in results:
+            assert result['errors'] == 0
+            assert result['count'] == 2 * result['concurrency']
+            assert result['p50'] <= result['p95'] <= result['p99']
+            assert result['ops_per_sec'] > 0
+
+    def test_realistic(self):
+        """Default tunables wait out the simulator's 2 second misreport window"""
+        from netbooter import VERIFY_DEFAULT
+        results = self._callFUT(1, operations=['set_snmp_data'], outlets=[4], realistic=True)
+        assert results[0]['errors'] == 0
+        assert results[0]['realistic'] is True
+        assert VERIFY_DEFAULT['min_settle'] <= results[0]['p50'] < VERIFY_DEFAULT['deadline']
+
+    def test_verified(self):
+        from netbooter_bench import verified
+        assert verified({1: True, 2: True}) and verified(1)
+        assert not verified({1: True, 2: False}) and not verified(False)
+
+
+class TestBenchSession(unittest.TestCase):
+
+    @staticmethod
+    def _callFUT(*args, **kw):
+        from netbooter_bench import bench_session
+        return bench_session(*args, **kw)
+
+    def test_reused_session_faster(self):
+        """Real GETs against the simulator, a reused session beats a new one per request"""
+        result = self._callFUT(2)
+        assert 0 < result['after'] < result['before']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for netbooter_fleet
+Netbooters are mocked, no netbooter is required.
+"""
+
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+
+class FakeNetBooter(object):
+    """Records switch calls and how many run at once"""
+
+    def __init__(self, host, active):
+        self.host = host
+        self.active = active
+        self.calls = []
+
+    def _switch(self, action, plug_id, delay_time, concurrent):
+        with self.active['lock']:
+            self.active[self.host] = self.active.get(self.host, 0) + 1
+            self.active['peak'] = max(self.active['peak'], self.active[self.host])
+        time.sleep(0.01)
+        self.calls.append((action, list(plug_id), delay_time, concurrent))
+        with self.active['lock']:
+            self.active[self.host] -= 1
+        return dict((plug, True) for plug in plug_id)
+
+    outlet_range = range(4)
+
+    def port_status(self, plug_id):
+        return [plug % 2 for plug in plug_id]
+
+    def plug_on(self, plug_id, delay_time=0, concurrent=False):
+        return self._switch('on', plug_id, delay_time, concurrent)
+
+    def plug_off(self, plug_id, delay_time=0, concurrent=False):
+        return self._switch('off', plug_id, delay_time, concurrent)
+
+
+class TestFleetController(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter_fleet import FleetController
+        return FleetController
+
+    def _makeOne(self, **kw):
+        self.active = {'lock': threading.Lock(), 'peak': 0}
+        self.pdus = {}
+
+        def factory(host):
+            self.pdus[host] = FakeNetBooter(host, self.active)
+            return self.pdus[host]
+
+        return self._getTargetClass()(logger=MagicMock(), netbooter_factory=factory, **kw)
+
+    def test_cycle(self):
+        """Each PDU gets one off and one on for all its plugs"""
+        from netbooter_fleet import Target
+        fleet = self._makeOne(stagger=0.25)
+        targets = [Target('a', 1), Target('b', 2), Target('a', 3)]
+        results = fleet.cycle(targets)
+        assert list(results) == targets
+        assert all(results.values())
+        assert self.pdus['a'].calls == [('off', [1, 3], 0.25, True), ('on', [1, 3], 0.25, True)]
+
+    def test_per_pdu_limit(self):
+        """Plans running together never overlap on one PDU"""
+        from netbooter_fleet import Target
+        fleet = self._makeOne()
+        threads = [
+            threading.Thread(target=fleet.on, args=([Target('a', plug)],))
+            for plug in range(1, 6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert self.active['peak'] == 1
+        assert len(self.pdus['a'].calls) == 5
+
+    def test_failed_pdu(self):
+        """A PDU that raises fails only its own targets"""
+        from netbooter_fleet import Target
+        fleet = self._makeOne()
+        fleet.netbooter('bad').plug_off = MagicMock(side_effect=IOError('timeout'))
+        results = fleet.off([Target('good', 1), Target('bad', 1)])
+        assert results == {Target('good', 1): True, Target('bad', 1): False}
+        assert 'bad' in fleet.errors
+
+    def test_unknown_action(self):
+        from netbooter_fleet import Target
+        fleet = self._makeOne()
+        with self.assertRaises(ValueError):
+            fleet.run_step([Target('a', 1)], 'reboot')
+
+    def test_status(self):
+        """Reads are grouped per PDU and failures read as unknown"""
+        from netbooter_fleet import Target
+        fleet = self._makeOne()
+        fleet.netbooter('bad').port_status = MagicMock(side_effect=IOError('timeout'))
+        results = fleet.status([Target('a', 1), Target('bad', 1), Target('a', 2)])
+        assert list(results.values()) == [1, None, 0]
+
+    def test_split_host(self):
+        from netbooter_fleet import split_host
+        assert split_host('192.168.60.124') == ('192.168.60.124', 161)
+        assert split_host('192.168.60.124:1161', 161) == ('192.168.60.124', 1161)
+
+    def test_run_command(self):
+        """Hosts without outlets get every outlet of the PDU"""
+        from netbooter import run_command
+        fleet = self._makeOne()
+        rows = run_command(fleet, 'off', [('a', None), ('b', [2])])
+        assert [(row['host'], row['plug'], row['value']) for row in rows] == [
+            ('a', 1, True), ('a', 2, True), ('a', 3, True), ('a', 4, True), ('b', 2, True)]
+        assert self.pdus['a'].calls == [('off', [1, 2, 3, 4], 0, True)]
+
+
+if __name__ == '__main__':
+    unittest.main()
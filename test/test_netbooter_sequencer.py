@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for netbooter_sequencer
+Netbooters are mocked, no netbooter is required.
+"""
+
+import unittest
+from unittest.mock import MagicMock
+
+
+class TestPlan(unittest.TestCase):
+
+    @staticmethod
+    def _callFUT(*args, **kw):
+        from netbooter_sequencer import plan
+        return plan(*args, **kw)
+
+    def test_parallel_when_budget_allows(self):
+        """Loads fitting the budget together start together"""
+        from netbooter_sequencer import Load
+        loads = [Load(plug, steady=10, inrush=30, settle=2) for plug in (1, 2, 3)]
+        assert [tuple(w) for w in self._callFUT(loads, 90)] == [(0, [1, 2, 3])]
+        assert [tuple(w) for w in self._callFUT(loads, 60)] == [(0, [1, 2]), (2, [3])]
+
+    def test_dependencies(self):
+        """Dependents wait for their dependency to settle, longest chain first"""
+        from netbooter_sequencer import Load
+        loads = [
+            Load(4, steady=5, settle=1),
+            Load(2, steady=20, inrush=60, settle=10, after=[1]),
+            Load(1, steady=10, inrush=40, settle=5),
+            Load(3, steady=20, inrush=60, settle=10, after=[1]),
+        ]
+        assert [tuple(w) for w in self._callFUT(loads, 160)] == [(0, [1, 4]), (5, [2, 3])]
+
+    def test_banks(self):
+        """Each bank has its own budget"""
+        from netbooter_sequencer import Load
+        loads = [Load(1, 10, 30, 2, bank=1), Load(2, 10, 30, 2, bank=1), Load(3, 10, 30, 2, bank=2)]
+        assert [tuple(w) for w in self._callFUT(loads, {1: 40, 2: 40})] == [(0, [1, 3]), (2, [2])]
+
+    def test_impossible(self):
+        from netbooter_sequencer import Load
+        with self.assertRaises(ValueError):
+            self._callFUT([Load(1, 10, 100, 1)], 50)
+        with self.assertRaises(ValueError):
+            self._callFUT([Load(1, 10, after=[2]), Load(2, 10, after=[1])], 50)
+        with self.assertRaises(ValueError):
+            self._callFUT([Load(1, 10, after=[9])], 50)
+
+
+class TestSequencer(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter_sequencer import Sequencer
+        return Sequencer
+
+    def _makeOne(self, loads, budget, draws=(0,), **kw):
+        self.nb = MagicMock()
+        self.nb.plug_on.side_effect = lambda plugs, concurrent: dict((plug, plug != 9) for plug in plugs)
+        self.nb.current_draw.side_effect = [{'currentDrawStatus1': draw} for draw in draws]
+        return self._getTargetClass()(self.nb, loads, budget, poll=0, logger=MagicMock(), **kw)
+
+    def test_run(self):
+        """Waves are switched concurrently in plan order"""
+        from netbooter_sequencer import Load
+        loads = [Load(1, 10, 30, 0.05), Load(2, 10, 30, 0.05, after=[1])]
+        sequencer = self._makeOne(loads, 50, draws=(0, 10))
+        assert sequencer.run() == {1: True, 2: True}
+        assert [call[0][0] for call in self.nb.plug_on.call_args_list] == [[1], [2]]
+        assert sequencer.timeline[1][0] >= 0.05
+
+    def test_feedback_waits(self):
+        """A wave waits until the measured draw leaves room for its inrush"""
+        from netbooter_sequencer import Load
+        sequencer = self._makeOne([Load(1, 10, 30, 1)], 50, draws=(40, 25, 15))
+        assert sequencer.run() == {1: True}
+        assert self.nb.current_draw.call_count == 3
+        assert sequencer.timeline[0][2] == {1: 15}
+
+    def test_no_headroom(self):
+        from netbooter_sequencer import Load
+        sequencer = self._makeOne([Load(1, 10, 30, 1)], 50, draws=(40, 40), max_wait=0)
+        assert sequencer.run() == {1: False}
+        assert not self.nb.plug_on.called
+
+    def test_failed_dependency(self):
+        """Outlets behind a plug that failed are not switched on"""
+        from netbooter_sequencer import Load
+        loads = [Load(9, 10, 10, 0), Load(2, 10, after=[9])]
+        sequencer = self._makeOne(loads, 50, feedback=False)
+        assert sequencer.run() == {9: False, 2: False}
+        assert self.nb.plug_on.call_count == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
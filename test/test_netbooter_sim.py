@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Integration tests for netbooter against netbooter_sim
+A simulated agent runs on a localhost UDP port, no netbooter is required.
+"""
+
+import time
+import unittest
+from unittest.mock import MagicMock
+
+
+class TestSimulatedNetBooter(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter_sim import SimulatedNetBooter
+        return SimulatedNetBooter
+
+    def _makeOne(self, **kw):
+        kw.setdefault('misreport_time', 0.2)
+        sim = self._getTargetClass()(**kw)
+        sim.start()
+        self.addCleanup(sim.stop)
+        return sim
+
+    @staticmethod
+    def _netbooter(sim, **kw):
+        from netbooter import NetBooter
+        kw.setdefault('timeout', 1)
+        kw.setdefault('num_retries', 1)
+        nb = NetBooter(host='127.0.0.1', port=sim.port, logger=MagicMock(), **kw)
+        nb.verify = dict(nb.verify, min_settle=0.3, initial_delay=0.05, max_delay=0.1)
+        return nb
+
+    def test_identify(self):
+        """Both MIBs are identified by sysDescr"""
+        for model in ('Synaccess Remote PDU', 'Power Distribution System'):
+            sim = self._makeOne(model=model, outlets=8)
+            nb = self._netbooter(sim)
+            assert nb.profile.identity == model
+            assert nb.port_status([1, 2]) == [1, 1]
+
+    def test_latency_overlaps(self):
+        """Concurrent requests wait out latency together, not one after another"""
+        import asyncio
+        from netbooter import AsyncNetBooter
+        sim = self._makeOne(outlets=8, latency=0.3)
+
+        async def run():
+            nb = await AsyncNetBooter.create(
+                '127.0.0.1', port=sim.port, logger=MagicMock(), mp_model=1, max_concurrency=4)
+            try:
+                start = time.time()
+                states = await asyncio.gather(*(nb.port_status([plug]) for plug in range(1, 5)))
+                return states, time.time() - start
+            finally:
+                nb.close()
+
+        states, elapsed = asyncio.run(run())
+        assert states == [[1]] * 4
+        # Serial replies would take 4 * 0.3 s
+        assert elapsed < 0.9
+
+    def test_switch(self):
+        """A dead outlet reverts after the misreport window and is not verified"""
+        for model in ('Synaccess Remote PDU', 'Power Distribution System'):
+            sim = self._makeOne(model=model, outlets=4, dead_outlets=(3,))
+            nb = self._netbooter(sim)
+            results = nb.plug_off([1, 2, 3], concurrent=True)
+            assert results == {1: True, 2: True, 3: False}
+            assert nb.port_status([1, 2, 3, 4]) == [0, 0, 1, 1]
+
+    def test_snapshot(self):
+        """Table walks return every outlet state and sensor over v1 and v2c"""
+        for model in ('Synaccess Remote PDU', 'Power Distribution System'):
+            sim = self._makeOne(model=model, outlets=8)
+            sim.switch_local(3, 2)
+            for mp_model in (0, 1):
+                snapshot = self._netbooter(sim, mp_model=mp_model).snapshot()
+                assert snapshot.model == model
+                assert snapshot.outlets == {1: 1, 2: 1, 3: 0, 4: 1, 5: 1, 6: 1, 7: 1, 8: 1}
+                # One amp, in tenths, per outlet on
+                assert snapshot.sensors['currentDrawStatus1'] == 70
+                assert snapshot.sensors['temperatureReading'] == 30
+
+    def test_async(self):
+        """AsyncNetBooter identifies, reads and switches both MIBs over v1 and v2c"""
+        import asyncio
+        from netbooter import AsyncNetBooter
+
+        async def run(sim, mp_model):
+            nb = await AsyncNetBooter.create(
+                '127.0.0.1', port=sim.port, logger=MagicMock(), mp_model=mp_model,
+                timeout=1, num_retries=1)
+            nb.verify = dict(nb.verify, min_settle=0.3, initial_delay=0.05, max_delay=0.1)
+            nb.set_attempts = 1
+            try:
+                return (nb.profile.identity, await nb.plug_off([1, 3]),
+                        await nb.plug_on([1]), await nb.port_status())
+            finally:
+                nb.close()
+
+        for model in ('Synaccess Remote PDU', 'Power Distribution System'):
+            for mp_model in (0, 1):
+                sim = self._makeOne(model=model, outlets=4, dead_outlets=(3,))
+                assert asyncio.run(run(sim, mp_model)) == (
+                    model, {1: True, 3: False}, {1: True}, [1, 1, 1, 1])
+
+    def test_async_deadline(self):
+        """An AsyncNetBooter request to a dead netbooter fails at its deadline"""
+        import asyncio
+        from netbooter import AsyncNetBooter, RequestTimedOutError
+        sim = self._makeOne(outlets=4)
+        sim.stop()
+        nb = AsyncNetBooter('127.0.0.1', port=sim.port, logger=MagicMock(),
+                            timeout=0.1, num_retries=100, deadline=0.5)
+
+        async def get():
+            try:
+                await nb.get_snmp_data('1.3.6.1.2.1.1.1.0')
+            finally:
+                nb.close()
+
+        start = time.time()
+        with self.assertRaises(RequestTimedOutError):
+            asyncio.run(get())
+        assert time.time() - start < 1.5
+
+    def test_loss(self):
+        """Dropped requests are retried by the transport"""
+        sim = self._makeOne(outlets=4, loss=0.3, seed=1)
+        nb = self._netbooter(sim, timeout=0.2, num_retries=10)
+        assert nb.port_status([1, 2, 3, 4]) == [1, 1, 1, 1]
+        assert sim.dropped > 0
+
+    def test_dead_netbooter(self):
+        """A netbooter that stops answering fails within the deadline, then fails fast"""
+        from netbooter import CircuitOpenError, RetryExhaustedError, RetryPolicy
+        sim = self._makeOne(outlets=4)
+        policy = RetryPolicy(deadline=5, initial_backoff=0.05, breaker_threshold=3)
+        nb = self._netbooter(sim, timeout=0.1, num_retries=0, retry_policy=policy)
+        sim.stop()
+        with self.assertRaises((RetryExhaustedError, CircuitOpenError)):
+            nb.port_status([1])
+        start = time.time()
+        with self.assertRaises(CircuitOpenError):
+            nb.port_status([1])
+        assert time.time() - start < 0.1
+
+
+if __name__ == '__main__':
+    unittest.main()
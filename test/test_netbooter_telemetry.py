@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for netbooter_telemetry
+Netbooters are mocked, no netbooter is required.
+"""
+
+import random
+import unittest
+from unittest.mock import MagicMock
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter_telemetry import RingBuffer
+        return RingBuffer
+
+    def _makeOne(self, *args, **kw):
+        return self._getTargetClass()(*args, **kw)
+
+    def test_empty(self):
+        """Empty buffer has no statistics"""
+        ring = self._makeOne(4)
+        assert len(ring) == 0
+        assert ring.min() is None and ring.avg() is None and ring.percentile(50) is None
+
+    def test_eviction(self):
+        """Oldest samples are overwritten once full"""
+        ring = self._makeOne(3)
+        for value in [5, 1, 9, 2]:
+            ring.append(value, timestamp=value)
+        assert ring.samples() == [(1, 1.0), (9, 9.0), (2, 2.0)]
+        assert (ring.min(), ring.max(), ring.avg()) == (1.0, 9.0, 4.0)
+
+    def test_stats_match_window(self):
+        """Running statistics equal a rescan of the window"""
+        rng = random.Random(7)
+        ring = self._makeOne(50)
+        history = []
+        for _ in range(500):
+            value = rng.randint(0, 1000)
+            history.append(value)
+            ring.append(value)
+            window = sorted(history[-50:])
+            assert ring.min() == window[0]
+            assert ring.max() == window[-1]
+            assert abs(ring.avg() - sum(window) / len(window)) < 1e-6
+            assert ring.percentile(95) == window[int(round(0.95 * (len(window) - 1)))]
+
+
+class TestTelemetryPoller(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter_telemetry import TelemetryPoller
+        return TelemetryPoller
+
+    @staticmethod
+    def _netbooter(host, values):
+        nb = MagicMock()
+        nb.host = host
+        nb.identity_key = '{}:161'.format(host)
+        nb.status = dict.fromkeys(values)
+        nb.current_draw.return_value = values
+        return nb
+
+    def test_sample_once(self):
+        """Each netbooter is read once and recorded per metric"""
+        good = self._netbooter('10.0.0.1', {'currentDrawStatus1': 12, 'temperatureReading': 30})
+        bad = self._netbooter('10.0.0.2', {'currentDrawStatus1': 0})
+        bad.current_draw.side_effect = IOError('no route')
+        poller = self._getTargetClass()([good, bad], logger=MagicMock())
+        assert poller.sample_once() == 1
+        assert poller.stats('10.0.0.1:161', 'currentDrawStatus1')['max'] == 12
+        assert poller.stats('10.0.0.1:161', 'temperatureReading')['count'] == 1
+        # Only metrics the model has are requested
+        assert good.current_draw.call_args[1]['keys'] == ('currentDrawStatus1', 'temperatureReading')
+
+
+    def test_ports_kept_apart(self):
+        """Two netbooters on one address with different ports get their own series"""
+        first = self._netbooter('10.0.0.1', {'currentDrawStatus1': 12})
+        second = self._netbooter('10.0.0.1', {'currentDrawStatus1': 40})
+        second.identity_key = '10.0.0.1:1161'
+        poller = self._getTargetClass()([first, second], logger=MagicMock())
+        poller.sample_once()
+        assert poller.stats('10.0.0.1:161', 'currentDrawStatus1')['max'] == 12
+        assert poller.stats('10.0.0.1:1161', 'currentDrawStatus1')['max'] == 40
+
+    def test_stats_while_sampling(self):
+        """stats() from another thread always sees whole appends"""
+        import threading
+        from netbooter_telemetry import RingBuffer
+        ring = RingBuffer(64)
+        stop = threading.Event()
+
+        def writer():
+            n = 0
+            while not stop.is_set():
+                ring.append(n % 7)
+                n += 1
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            for _ in range(2000):
+                samples = ring.samples()
+                stats = ring.stats()
+                assert len(samples) <= 64
+                if stats['count']:
+                    assert stats['min'] <= stats['avg'] <= stats['max']
+        finally:
+            stop.set()
+            thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
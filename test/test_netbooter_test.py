@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the netbooter_test stress harness
+Workers run against netbooter_sim, no netbooter is required.
+"""
+
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+
+class TestBoss(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter_test import Boss
+        return Boss
+
+    def setUp(self):
+        # Boss and workers write their logs to the current directory
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        # Boss adds stderr and file handlers to the multiprocessing logger
+        log = multiprocessing.get_logger()
+        for handler in list(log.handlers):
+            log.removeHandler(handler)
+            handler.close()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def _makeOne(self, sim, plug_ids):
+        boss = self._getTargetClass()(sim.host, port=sim.port)
+        boss.plug_ids = plug_ids
+        boss.number_of_switch_cycles = 1
+        return boss
+
+    def test_main(self):
+        """Every worker cycles its plug and reports back"""
+        import netbooter_sim
+        with netbooter_sim.SimulatedNetBooter(outlets=4, misreport_time=0) as sim:
+            boss = self._makeOne(sim, [1, 2])
+            assert boss.main() == 0
+        assert boss.worker_results == {1: 0, 2: 0}
+        assert boss.workers == []
+        # Progress went through the status board
+        with open(boss.status_file) as fh:
+            status = json.load(fh)
+        assert sorted((w['id'], w['state'], w['iteration']) for w in status['workers']) == [
+            (1, 'done', 1), (2, 'done', 1)]
+
+    def test_main_threads(self):
+        """Thread workers share one identification of the netbooter"""
+        import netbooter
+        import netbooter_sim
+        with netbooter_sim.SimulatedNetBooter(outlets=4, misreport_time=0) as sim:
+            boss = self._makeOne(sim, [1, 2, 3])
+            boss.mode = 'thread'
+            with patch.object(
+                    netbooter.NetBooter, 'identify_netbooter',
+                    autospec=True, side_effect=netbooter.NetBooter.identify_netbooter) as identify:
+                assert boss.main() == 0
+        assert boss.worker_results == {1: 0, 2: 0, 3: 0}
+        assert identify.call_count == 1
+
+    def test_dead_worker(self):
+        """A worker dying without a quit message ends the run at once"""
+        import netbooter_sim
+        with netbooter_sim.SimulatedNetBooter(outlets=4) as sim:
+            boss = self._makeOne(sim, [1])
+            boss.startup_timeout = 60
+            worker = multiprocessing.Process(target=time.sleep, args=(0,))
+            worker.plug_id = 1
+            worker.queue_from_boss = multiprocessing.Queue()
+            boss.workers.append(worker)
+            worker.start()
+            start = time.time()
+            boss.process_queue()
+        assert time.time() - start < 10
+        assert boss.exit_code == 1
+        assert boss.worker_results == {1: 'exitcode 0'}
+
+
+class TestDrain(unittest.TestCase):
+
+    def test_drain(self):
+        from netbooter_test import drain
+        q = multiprocessing.Queue()
+        for n in range(3):
+            q.put(n)
+        time.sleep(0.1)
+        assert list(drain(q)) == [0, 1, 2]
+        assert list(drain(q)) == []
+
+
+
+class TestQueueWaitable(unittest.TestCase):
+
+    @staticmethod
+    def _callFUT(q):
+        from netbooter_test import queue_waitable
+        return queue_waitable(q)
+
+    def test_ready_on_put(self):
+        """wait() returns the waitable once the queue holds a message"""
+        import multiprocessing.connection
+        q = multiprocessing.Queue()
+        waitable = self._callFUT(q)
+        assert multiprocessing.connection.wait([waitable], 0) == []
+        q.put(1)
+        assert multiprocessing.connection.wait([waitable], 5) == [waitable]
+
+    def test_other_queue(self):
+        import queue
+        with self.assertRaises(TypeError):
+            self._callFUT(queue.Queue())
+
+
+class TestWorker(unittest.TestCase):
+
+    def test_no_begin_test(self):
+        """A worker waits for BeginTest at most startup_timeout"""
+        from unittest.mock import MagicMock
+        from netbooter_test import Worker
+        worker = Worker('127.0.0.1', 1, multiprocessing.Queue(), multiprocessing.Queue(), 1,
+                        startup_timeout=0.2)
+        worker.log = MagicMock()
+        worker.test = MagicMock()
+        start = time.time()
+        worker.process_queue()
+        assert time.time() - start < 2
+        assert worker.error_count == 1
+        worker.test.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Integration tests for netbooter_traps
+Traps come from netbooter_sim on localhost, no netbooter is required.
+"""
+
+import time
+import unittest
+from unittest.mock import MagicMock
+
+
+class TestTrapListener(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from netbooter_traps import TrapListener
+        return TrapListener
+
+    def _makeOne(self, cache):
+        listener = self._getTargetClass()(cache, host='127.0.0.1', port=0, logger=MagicMock())
+        listener.start()
+        self.addCleanup(listener.stop)
+        return listener
+
+    @staticmethod
+    def _wait(listener, traps):
+        deadline = time.time() + 2
+        while listener.traps < traps and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_outlet_trap(self):
+        """A local switch reaches port_status through the cache, without a read"""
+        from netbooter import NetBooter, OutletStateCache
+        from netbooter_sim import SimulatedNetBooter
+        cache = OutletStateCache(ttl=60)
+        listener = self._makeOne(cache)
+        for number, model in enumerate(('Synaccess Remote PDU', 'Power Distribution System'), 1):
+            with SimulatedNetBooter(model=model, outlets=4,
+                                    trap_target=('127.0.0.1', listener.port)) as sim:
+                nb = NetBooter('127.0.0.1', port=sim.port, logger=MagicMock(), outlet_cache=cache)
+                assert nb.port_status() == [1, 1, 1, 1]
+                requests = sim.requests
+                sim.switch_local(3, 2)
+                self._wait(listener, number)
+                assert nb.port_status() == [1, 1, 0, 1]
+                assert sim.requests == requests
+
+    def test_other_trap(self):
+        """A trap without outlet status drops the cached states of its host"""
+        from netbooter import OutletStateCache
+        from netbooter_sim import SimulatedNetBooter
+        cache = OutletStateCache(ttl=60)
+        cache.put('127.0.0.1:161', 1, 1)
+        listener = self._makeOne(cache)
+        sim = SimulatedNetBooter(trap_target=('127.0.0.1', listener.port))
+        sim.send_trap([])
+        self._wait(listener, 1)
+        assert cache.get('127.0.0.1:161', 1) is None
+
+
+    def test_host_name(self):
+        """A trap from 127.0.0.1 reaches a netbooter configured as localhost"""
+        from netbooter import NetBooter, OutletStateCache
+        from netbooter_sim import SimulatedNetBooter
+        cache = OutletStateCache(ttl=60)
+        listener = self._makeOne(cache)
+        with SimulatedNetBooter(outlets=4, trap_target=('127.0.0.1', listener.port)) as sim:
+            nb = NetBooter('localhost', port=sim.port, logger=MagicMock(), outlet_cache=cache)
+            assert nb.port_status() == [1, 1, 1, 1]
+            requests = sim.requests
+            sim.switch_local(2, 2)
+            self._wait(listener, 1)
+            assert nb.port_status() == [1, 0, 1, 1]
+            assert sim.requests == requests
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Unit tests for status_board
+"""
+
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+
+def _write(board, slot, count):
+    """Worker process: update one slot count times"""
+    for iteration in range(1, count + 1):
+        board.update(slot, id=slot + 1, state='on' if iteration % 2 else 'off',
+                     iteration=iteration, error_count=iteration)
+
+
+class TestStatusBoard(unittest.TestCase):
+
+    @staticmethod
+    def _getTargetClass() -> object:
+        from status_board import StatusBoard
+        return StatusBoard
+
+    def _makeOne(self, slots=4):
+        board = self._getTargetClass()(slots)
+        self.addCleanup(board.close)
+        return board
+
+    def test_update_read(self):
+        """Fields not given keep their value, unwritten slots read as None"""
+        board = self._makeOne()
+        board.update(2, id=3, state='ready', note='plug 3')
+        board.update(2, state='off', iteration=1)
+        record = board.read(2)
+        assert (record['id'], record['state'], record['iteration'], record['note']) == (3, 'off', 1, 'plug 3')
+        assert board.read(0) is None
+        assert [r['id'] for r in board.snapshot()] == [3]
+
+    def test_processes(self):
+        """Records written by other processes are read whole"""
+        board = self._makeOne()
+        workers = [multiprocessing.Process(target=_write, args=(board, slot, 2000)) for slot in range(4)]
+        for worker in workers:
+            worker.start()
+        while any(worker.is_alive() for worker in workers):
+            for record in board.snapshot():
+                # iteration and error_count are written together
+                assert record['iteration'] == record['error_count']
+        for worker in workers:
+            worker.join()
+        assert [(r['id'], r['iteration']) for r in board.snapshot()] == [(1, 2000), (2, 2000), (3, 2000), (4, 2000)]
+
+    def test_attach(self):
+        """A board opened by name sees updates and does not remove the segment"""
+        board = self._makeOne()
+        other = self._getTargetClass().attach(board.name, board.slots)
+        other.update(1, id=2, state='done')
+        other.close()
+        assert board.read(1)['state'] == 'done'
+
+    def test_dump(self):
+        board = self._makeOne()
+        board.update(0, id=1, state='on', iteration=4)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'status.json')
+            board.dump(path)
+            with open(path) as fh:
+                status = json.load(fh)
+            assert os.listdir(directory) == ['status.json']
+        assert [(w['id'], w['state'], w['iteration']) for w in status['workers']] == [(1, 'on', 4)]
+
+
+if __name__ == '__main__':
+    unittest.main()